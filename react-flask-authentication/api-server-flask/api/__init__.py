@@ -4,17 +4,23 @@ Copyright (c) 2019 - present AppSeed.us
 """
 
 import os
+import time
 from flask import Flask, request
-import json as py_json
 from flask_cors import CORS
 from api.models import db
 from api.routes import register_blueprints, rest_api
 
 def create_app():
-    """Flask application factory function - SINGLE PORT SOLUTION"""
-    # Configure Flask to serve React build files (Docker container paths)
+    """Flask application factory function - SINGLE PORT SOLUTION
+
+    No database work here: the schema is created by migrations/create_schema.py
+    and the one-time checks run in prepare_preload() (gunicorn master).
+    """
+    started = time.perf_counter()
+    # React build files are served by the routes below through api.static_assets
+    # (no Flask static route: it would answer /static/ without the immutable headers)
     app = Flask(__name__,
-                static_folder='../react-ui/build/static',
+                static_folder=None,
                 template_folder='../react-ui/build')
 
     # Load configuration
@@ -26,9 +32,15 @@ def create_app():
     # CRITICAL FIX: Configure Flask to handle VPN proxy headers properly
     # This prevents 302 redirects by ensuring Flask trusts the proxy
     from werkzeug.middleware.proxy_fix import ProxyFix
-    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1, x_host=1, x_prefix=1)
-
-    # Initialize database
+    from api.prefix_dispatch import PrefixDispatch
+    from api.static_assets import react_build
+    app.wsgi_app = ProxyFix(PrefixDispatch(app.wsgi_app), x_for=1, x_proto=1, x_host=1, x_prefix=1)
+
+    # Initialize database (pool settings: api/db_pool.py)
+    from api.db_pool import engine_options, configure_odbc_pooling
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(app.config))
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('mssql+pyodbc'):
+        configure_odbc_pooling(app.config['DB_ODBC_POOLING'])
     db.init_app(app)
 
     # Enable CORS - Updated to support VPN proxy access
@@ -155,17 +167,10 @@ def create_app():
     def serve_react_app():
         """Serve the main React application"""
         try:
-            from flask import send_from_directory
-            import os
-
-            # Docker container path: /app/react-ui/build
-            build_dir = '/app/react-ui/build'
-
-            index_path = os.path.join(build_dir, 'index.html')
-            if os.path.exists(index_path):
-                return send_from_directory(build_dir, 'index.html')
-            else:
-                return {"error": "React build not found", "build_dir": build_dir}, 500
+            response = react_build.index()
+            if response is None:
+                return {"error": "React build not found", "build_dir": react_build.build_dir}, 500
+            return response
 
         except Exception as e:
             return {"error": "React app serving error", "details": str(e)}, 500
@@ -176,90 +181,20 @@ def create_app():
     def serve_react_app_vpn(path=''):
         """Serve React app for VPN proxy access"""
         try:
+            # API calls under the prefix never get here: PrefixDispatch routes them to the API
 
-            from flask import send_from_directory
-            import os
-
-            # CRITICAL FIX: Proxy API requests to regular API routes
-            if path.startswith('api/'):
-                # Remove the VPN prefix and forward to regular API
-                api_path = '/' + path  # Convert 'api/count' to '/api/count'
-
-                # Import Flask's test client to make internal request
-                from flask import current_app
-                with current_app.test_client() as client:
-                    # Forward the request with all headers and data
-                    if request.method == 'GET':
-                        response = client.get(api_path,
-                                            headers=dict(request.headers),
-                                            query_string=request.query_string)
-                    elif request.method == 'POST':
-                        response = client.post(api_path,
-                                             headers=dict(request.headers),
-                                             data=request.get_data(),
-                                             query_string=request.query_string)
-                    elif request.method == 'PUT':
-                        response = client.put(api_path,
-                                            headers=dict(request.headers),
-                                            data=request.get_data(),
-                                            query_string=request.query_string)
-                    elif request.method == 'DELETE':
-                        response = client.delete(api_path,
-                                               headers=dict(request.headers),
-                                               query_string=request.query_string)
-                    else:
-                        return {"error": "Method not allowed"}, 405
-
-
-
-                    # Return the response from the internal API call
-                    from flask import Response
-                    return Response(
-                        response.get_data(),
-                        status=response.status_code,
-                        headers=dict(response.headers),
-                        mimetype=response.mimetype
-                    )
-
-            # CRITICAL FIX: Handle static assets (JS, CSS, images)
+            # Static assets (JS, CSS, images) and root files (manifest.json, favicon.ico, ...)
+            response = react_build.response(path) if path else None
+            if response is not None:
+                return response
             if path.startswith('static/'):
-
-                build_dir = '/app/react-ui/build'
-                asset_path = os.path.join(build_dir, path)
-                if os.path.exists(asset_path):
-
-                    from flask import make_response
-                    response = make_response(send_from_directory(build_dir, path))
-                    # Add cache control headers to prevent 304 issues
-                    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-                    response.headers['Pragma'] = 'no-cache'
-                    response.headers['Expires'] = '0'
-                    return response
-                else:
-
-                    return {"error": "Static asset not found", "path": path}, 404
-
-            # Handle manifest.json and other root files
-            if path in ['manifest.json', 'favicon.ico', 'robots.txt', 'asset-manifest.json']:
-                build_dir = '/app/react-ui/build'
-                asset_path = os.path.join(build_dir, path)
-                if os.path.exists(asset_path):
-                    from flask import make_response
-                    response = make_response(send_from_directory(build_dir, path))
-                    response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-                    response.headers['Pragma'] = 'no-cache'
-                    response.headers['Expires'] = '0'
-                    return response
+                return {"error": "Static asset not found", "path": path}, 404
 
             # For all other requests (React routes), serve React app
-            # Docker container path: /app/react-ui/build
-            build_dir = '/app/react-ui/build'
-
-            index_path = os.path.join(build_dir, 'index.html')
-            if os.path.exists(index_path):
-                return send_from_directory(build_dir, 'index.html')
-            else:
-                return {"error": "React build not found", "build_dir": build_dir, "index_path": index_path}, 500
+            response = react_build.index()
+            if response is None:
+                return {"error": "React build not found", "build_dir": react_build.build_dir}, 500
+            return response
 
         except Exception as e:
             return {"error": "VPN React app serving error", "details": str(e)}, 500
@@ -338,6 +273,26 @@ def create_app():
             "version": "single-port-enhanced"
         }
 
+    @app.route('/health/transactions')
+    @app.route('/web_forward_CuttingApplicationAPI/health/transactions')
+    def transaction_health():
+        """Deadlock / lock timeout retry counters of this worker, per endpoint"""
+        from api.transactions import transaction_stats
+        return {"success": True, "pid": os.getpid(), "data": transaction_stats()}
+
+    @app.route('/health/assets/reload', methods=['POST'])
+    @app.route('/web_forward_CuttingApplicationAPI/health/assets/reload', methods=['POST'])
+    def reload_assets():
+        """Rescan the React build of this worker (the others pick it up when index.html changes)"""
+        return {"success": True, "pid": os.getpid(), "files": react_build.reload()}
+
+    @app.route('/health/pool')
+    @app.route('/web_forward_CuttingApplicationAPI/health/pool')
+    def pool_health():
+        """Connection checkout wait histogram and pool state of this worker"""
+        from api.db_pool import pool_stats
+        return {"success": True, "pid": os.getpid(), "data": pool_stats(db.engine)}
+
     # SIMPLE TEST ROUTE - Add this before Flask-RESTX to test if routes work
     @app.route('/simple-test')
     @app.route('/web_forward_CuttingApplicationAPI/simple-test')
@@ -379,52 +334,21 @@ def create_app():
         if path.startswith('api/') or path.startswith('users/'):
             return {"error": "API endpoint not found", "path": path}, 404
 
-        # Handle static assets for non-VPN paths
-        if path.startswith('static/'):
-            build_dir = '/app/react-ui/build'
-            asset_path = os.path.join(build_dir, path)
-            if os.path.exists(asset_path):
-                return send_from_directory(build_dir, path)
-            else:
-                return {"error": "Static asset not found", "path": path}, 404
-
-        # If it's a static file request, try to serve it from the build directory
-        if '.' in path and not path.endswith('.html'):
-            try:
+        # Static assets and root files of the build
+        response = react_build.response(path)
+        if response is not None:
+            return response
 
-                from flask import send_from_directory
-                import os
-
-                # Docker container path: /app/react-ui/build
-                build_dir = '/app/react-ui/build'
-
-                # For static files, they're usually in build/static/ subdirectory
-                if path.startswith('static/'):
-                    file_path = os.path.join(build_dir, path)
-                    if os.path.exists(file_path):
-                        return send_from_directory(build_dir, path)
-
-                # Try serving from root build directory
-                file_path = os.path.join(build_dir, path)
-                if os.path.exists(file_path):
-                    return send_from_directory(build_dir, path)
-
-
-                return {"error": "Static file not found", "path": path}, 404
-
-            except Exception as e:
-                return {"error": "Static file error", "path": path, "details": str(e)}, 404
+        # If it's a static file request that the build does not have, don't answer with the React app
+        if path.startswith('static/') or ('.' in path and not path.endswith('.html')):
+            return {"error": "Static file not found", "path": path}, 404
 
         # For all other routes (React client-side routing), serve the React app
         try:
-
-            from flask import send_from_directory
-            import os
-
-            # Docker container path: /app/react-ui/build
-            build_dir = '/app/react-ui/build'
-
-            return send_from_directory(build_dir, 'index.html')
+            response = react_build.index()
+            if response is None:
+                return {"error": "React build not found", "build_dir": react_build.build_dir}, 500
+            return response
 
         except Exception as e:
             return {
@@ -436,41 +360,38 @@ def create_app():
 
 
 
-    # Setup database
+    # Custom responses: Flask-RESTX validation errors are reshaped to {"success": False, "msg": ...}
+    # by output_json (api/serialization.py) before encoding; response bodies are never parsed here
+
+
+    print(f"⏱️ App created in {(time.perf_counter() - started) * 1000:.0f} ms (pid {os.getpid()})")
+
+    return app
+
+def prepare_preload(app):
+    """Gunicorn master after loading the app (preload_app): one-time work shared by the forked workers"""
     with app.app_context():
+        # Probe the BOM source once for all workers instead of once per worker
         try:
-            db.create_all()
+            from api.bom_cache import probe_nav_bom
+            if not probe_nav_bom():
+                print('> nav_bom not found, BOM endpoints will return empty data')
         except Exception as e:
-            print('> Error: DBMS Exception: ' + str(e))
-            print('> Database initialization failed.')
-
-    """
-    Custom responses
-    """
-    @app.after_request
-    def after_request(response):
-        if response.content_type and 'application/json' not in response.content_type:
-            return response  # Skip non-JSON responses like images
-
-        if int(response.status_code) >= 400:
-            try:
-                response_data = py_json.loads(response.get_data())  # Use py_json instead of json
-                if "errors" in response_data:
-                    response_data = {
-                        "success": False,
-                        "msg": list(response_data["errors"].items())[0][1]
-                    }
-                    response.set_data(py_json.dumps(response_data))  # Use py_json.dumps()
-            except Exception:
-                response_data = {
-                    "success": False,
-                    "msg": "An unexpected error occurred. Invalid response format."
-                }
-                response.set_data(py_json.dumps(response_data))  # Use py_json.dumps()
+            print('> BOM source probe failed, retrying on first use: ' + str(e))
 
-            response.headers.add('Content-Type', 'application/json')
-        return response
+        # The workers must not inherit the master's connections
+        db.engine.dispose()
 
+    # Loaded lazily by the routes; imported here so the workers share the module pages
+    import numpy  # noqa: F401
 
+def init_worker(app):
+    """Right after a gunicorn worker forks (or before the dev server starts)"""
+    with app.app_context():
+        db.engine.dispose()
 
-    return app
+    # Background jobs run in run_jobs.py; JOBS_IN_PROCESS runs them on a thread of each worker instead
+    # (started after the fork: threads of the master do not survive it)
+    if app.config['JOBS_IN_PROCESS']:
+        from api.jobs import JobRunner
+        JobRunner(app, threads=1).start()
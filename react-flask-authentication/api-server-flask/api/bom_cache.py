@@ -0,0 +1,214 @@
+"""
+Local BOM snapshots.
+
+/orders/bom and ratio auto-populate read the same BOM many times while an
+order is planned, and each read went to nav_bom on the NAV linked server
+(after an INFORMATION_SCHEMA probe). The rows of each order are now kept in
+order_bom_snapshots with the time they were fetched:
+
+- fresh snapshots (younger than BOM_FRESH_SECONDS) are served as they are
+- stale snapshots are served immediately and refreshed in a background thread
+  (stale-while-revalidate)
+- only orders never seen before are read from NAV on the request, in bulk
+
+prefetch_boms() loads many orders at once; sync_order_lines.py uses it to keep
+the snapshots of open orders warm. Whether nav_bom exists is probed once per
+worker at startup (probe_nav_bom()).
+"""
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import bindparam, inspect
+
+from api.models import db, NavBom, OrderBomSnapshot, OrderLinesView, OrderLineReplica
+from api.order_lines_sync import chunked, order_prefix_filter, replica_ready, OPEN_STATUS_MAX
+from api.bom_signatures import normalize_bom
+
+# Snapshots younger than this are served without a refresh
+BOM_FRESH_SECONDS = 3600
+
+_nav_bom_available = None
+_refreshing = set()
+_refresh_lock = threading.Lock()
+
+
+def probe_nav_bom():
+    """Check once whether the nav_bom view exists (called at startup)"""
+    global _nav_bom_available
+    _nav_bom_available = inspect(db.engine).has_table(NavBom.__tablename__)
+    return _nav_bom_available
+
+
+def nav_bom_available():
+    if _nav_bom_available is None:
+        probe_nav_bom()
+    return _nav_bom_available
+
+
+def _read_nav_bom(orders):
+    """Return {requested order: [NavBom.to_dict()]} for every order, empty lists included"""
+    by_key = {order.upper(): order for order in orders}
+    boms = {order: [] for order in orders}
+    for chunk in chunked(orders):
+        for row in NavBom.query.filter(NavBom.shortcut_dimension_2_code.in_(chunk)):
+            order = by_key.get(row.shortcut_dimension_2_code.upper())
+            if order is not None:
+                boms[order].append(row.to_dict())
+    return boms
+
+
+def _store_snapshots(boms, fetched_at):
+    """Insert or overwrite the snapshots of {order: lines} (caller commits)"""
+    existing = {}
+    for chunk in chunked(boms):
+        existing.update({
+            order.upper(): order
+            for order, in db.session.query(OrderBomSnapshot.order_commessa)
+            .filter(OrderBomSnapshot.order_commessa.in_(chunk))
+        })
+
+    inserts = []
+    updates = []
+    for order, lines in boms.items():
+        row = {'lines': json.dumps(lines), 'line_count': len(lines), 'fetched_at': fetched_at}
+        if order.upper() in existing:
+            row = {f'b_{key}': value for key, value in row.items()}
+            row['b_order_commessa'] = existing[order.upper()]
+            updates.append(row)
+        else:
+            row['order_commessa'] = order
+            inserts.append(row)
+
+    table = OrderBomSnapshot.__table__
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+    if updates:
+        db.session.execute(
+            table.update()
+            .where(table.c.order_commessa == bindparam('b_order_commessa'))
+            .values(lines=bindparam('b_lines'), line_count=bindparam('b_line_count'),
+                    fetched_at=bindparam('b_fetched_at')),
+            updates
+        )
+
+
+def refresh_boms(orders):
+    """Read the BOM of the given orders from NAV and store the snapshots (caller commits)"""
+    orders = sorted({order.strip() for order in orders if order and order.strip()})
+    if not orders or not nav_bom_available():
+        return {}
+
+    fetched_at = datetime.now()
+    boms = _read_nav_bom(orders)
+    _store_snapshots(boms, fetched_at)
+    return {order: {'lines': lines, 'fetched_at': fetched_at, 'state': 'fetched'} for order, lines in boms.items()}
+
+
+def _refresh_in_background(app, orders):
+    try:
+        with app.app_context():
+            refresh_boms(orders)
+            db.session.commit()
+    except Exception as e:
+        print(f"⚠️ Background BOM refresh failed for {len(orders)} orders: {str(e)}")
+    finally:
+        with _refresh_lock:
+            _refreshing.difference_update(orders)
+
+
+def _schedule_refresh(orders):
+    """Refresh stale snapshots after the response, once per order at a time"""
+    with _refresh_lock:
+        orders = [order for order in orders if order not in _refreshing]
+        _refreshing.update(orders)
+    if orders:
+        app = current_app._get_current_object()
+        threading.Thread(target=_refresh_in_background, args=(app, orders), daemon=True).start()
+
+
+def get_boms(orders):
+    """Return {order: {'lines', 'fetched_at', 'state'}} for the given orders.
+
+    state is 'fresh', 'stale' (served while a refresh runs in the background) or
+    'fetched' (read from NAV now). Orders are missing from the result only when
+    they have no snapshot and nav_bom does not exist. Commits when NAV was read.
+    """
+    orders = sorted({order.strip() for order in orders if order and order.strip()})
+    fresh_after = datetime.now() - timedelta(seconds=BOM_FRESH_SECONDS)
+
+    result = {}
+    by_key = {order.upper(): order for order in orders}
+    for chunk in chunked(orders):
+        for snapshot in OrderBomSnapshot.query.filter(OrderBomSnapshot.order_commessa.in_(chunk)):
+            order = by_key.get(snapshot.order_commessa.upper())
+            if order is not None:
+                result[order] = {
+                    'lines': json.loads(snapshot.lines),
+                    'fetched_at': snapshot.fetched_at,
+                    'state': 'fresh' if snapshot.fetched_at >= fresh_after else 'stale'
+                }
+
+    missing = [order for order in orders if order not in result]
+    if missing:
+        result.update(refresh_boms(missing))
+        db.session.commit()
+
+    stale = [order for order, bom in result.items() if bom['state'] == 'stale']
+    if stale and nav_bom_available():
+        _schedule_refresh(stale)
+
+    return result
+
+
+def get_bom(order_commessa):
+    """Snapshot of one order (see get_boms), None if there is no BOM source at all"""
+    return get_boms([order_commessa]).get(order_commessa.strip())
+
+
+def fabric_bom(bom):
+    """Normalized (item, quantity) FABRIC rows of a snapshot, as used for BOM signatures"""
+    if not bom:
+        return []
+    return normalize_bom((line['item'], line['quantity']) for line in bom['lines']
+                         if (line['category'] or '').upper() == 'FABRIC')
+
+
+def prefetch_boms(orders, max_age_seconds=BOM_FRESH_SECONDS):
+    """Fetch, in bulk, every order without a snapshot or with one older than max_age_seconds.
+
+    Commits. Returns a summary dict.
+    """
+    started = time.perf_counter()
+    orders = sorted({order.strip() for order in orders if order and order.strip()})
+    fresh_after = datetime.now() - timedelta(seconds=max_age_seconds)
+
+    fresh = set()
+    for chunk in chunked(orders):
+        fresh.update(order.upper() for order, in db.session.query(OrderBomSnapshot.order_commessa)
+                     .filter(OrderBomSnapshot.order_commessa.in_(chunk))
+                     .filter(OrderBomSnapshot.fetched_at >= fresh_after))
+
+    to_fetch = [order for order in orders if order.upper() not in fresh]
+    fetched = refresh_boms(to_fetch)
+    db.session.commit()
+
+    return {
+        "orders": len(orders),
+        "fetched": len(fetched),
+        "already_fresh": len(orders) - len(to_fetch),
+        "nav_bom_available": nav_bom_available(),
+        "duration_ms": round((time.perf_counter() - started) * 1000, 2)
+    }
+
+
+def open_orders():
+    """Orders still in production, whose BOM can change"""
+    model = OrderLineReplica if replica_ready() else OrderLinesView
+    return [row[0] for row in db.session.query(model.order_commessa)
+            .filter(order_prefix_filter(model))
+            .filter(model.status <= OPEN_STATUS_MAX)
+            .distinct()]
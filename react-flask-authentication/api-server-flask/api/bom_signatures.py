@@ -0,0 +1,187 @@
+"""
+Fabric BOM signatures per production order.
+
+Auto-populate of Italian ratios looks for orders of the same style with the
+same fabric BOM (item and consumption quantity, color ignored). Instead of
+reading and comparing the BOM of every candidate order on each call, the
+normalized FABRIC component list of every order is hashed once into
+order_bom_signatures, so matching orders are found with one indexed join.
+
+refresh_bom_signatures() is run by sync_order_lines.py after the order lines
+sync: incrementally for new and open orders, fully with "full".
+"""
+
+import hashlib
+import time
+from collections import defaultdict
+from datetime import datetime
+
+from sqlalchemy import bindparam
+
+from api.models import db, NavBom, OrderLinesView, OrderLineReplica, OrderBomSignature
+from api.order_lines_sync import get_sync_state, order_prefix_filter, replica_ready, OPEN_STATUS_MAX, chunked
+
+BOM_SIGNATURES_SYNC = 'bom_signatures'
+
+
+def normalize_bom(rows):
+    """Sorted (item_no, quantity) pairs with a stable text form for hashing"""
+    return sorted((str(item_no).strip().upper(), round(float(quantity or 0), 6)) for item_no, quantity in rows)
+
+
+def bom_items_text(items):
+    return ';'.join(f'{item_no}={quantity:.6f}' for item_no, quantity in items)
+
+
+def parse_bom_items(text):
+    """Inverse of bom_items_text"""
+    items = []
+    for part in (text or '').split(';'):
+        if part:
+            item_no, quantity = part.rsplit('=', 1)
+            items.append((item_no, float(quantity)))
+    return items
+
+
+def bom_signature(items):
+    return hashlib.sha256(bom_items_text(items).encode('utf-8')).hexdigest()
+
+
+def bom_distance(items_a, items_b):
+    """Largest relative consumption difference between two BOMs with the same items, None if the items differ"""
+    if [item for item, _ in items_a] != [item for item, _ in items_b]:
+        return None
+    distance = 0.0
+    for (_, qty_a), (_, qty_b) in zip(items_a, items_b):
+        scale = max(abs(qty_a), abs(qty_b))
+        if scale:
+            distance = max(distance, abs(qty_a - qty_b) / scale)
+    return distance
+
+
+def read_fabric_bom(orders=None):
+    """Return {order_commessa: normalized items} from nav_bom, for the given orders or all of them"""
+    query = db.session.query(NavBom.shortcut_dimension_2_code, NavBom.item_no, NavBom.quantity)\
+        .filter(NavBom.source == 'FABRIC')
+
+    if orders is None:
+        rows = query.all()
+    else:
+        rows = []
+        for chunk in chunked(orders):
+            rows.extend(query.filter(NavBom.shortcut_dimension_2_code.in_(chunk)).all())
+
+    boms = defaultdict(list)
+    for order_commessa, item_no, quantity in rows:
+        boms[order_commessa].append((item_no, quantity))
+    return {order_commessa: normalize_bom(items) for order_commessa, items in boms.items()}
+
+
+def store_signature(order_commessa, style, items):
+    """Insert or refresh the signature of one order (caller commits). Returns the signature row."""
+    signature = bom_signature(items)
+    row = db.session.get(OrderBomSignature, order_commessa)
+    if row is None:
+        row = OrderBomSignature(order_commessa=order_commessa)
+        db.session.add(row)
+    if row.signature != signature or row.style != style:
+        row.style = style
+        row.signature = signature
+        row.items = bom_items_text(items)
+        row.item_count = len(items)
+        row.computed_at = datetime.now()
+    return row
+
+
+def _order_styles(full):
+    """Return {order_commessa: style} for the orders whose signature should be (re)computed"""
+    model = OrderLineReplica if replica_ready() else OrderLinesView
+    query = db.session.query(model.order_commessa, model.style).filter(order_prefix_filter(model))
+
+    if not full:
+        # Open orders can still get a new BOM; finished ones only need a signature once
+        missing = ~db.session.query(OrderBomSignature.order_commessa)\
+            .filter(OrderBomSignature.order_commessa == model.order_commessa).exists()
+        query = query.filter((model.status <= OPEN_STATUS_MAX) | missing)
+
+    return dict(query.distinct().all())
+
+
+def refresh_bom_signatures(full=False):
+    """Recompute the fabric BOM signatures of new and open orders (all orders with full=True).
+
+    Must run inside an app context. Commits on success. Returns a summary dict.
+    """
+    started = time.perf_counter()
+    computed_at = datetime.now()
+    state = get_sync_state(BOM_SIGNATURES_SYNC)
+    full = full or state.last_full_sync is None
+
+    try:
+        styles = _order_styles(full)
+        boms = read_fabric_bom(None if full else styles.keys())
+
+        existing = {}
+        for chunk in chunked(styles.keys()):
+            existing.update({
+                row.order_commessa: (row.style, row.signature)
+                for row in db.session.query(OrderBomSignature.order_commessa, OrderBomSignature.style,
+                                            OrderBomSignature.signature)
+                .filter(OrderBomSignature.order_commessa.in_(chunk))
+            })
+
+        inserts = []
+        updates = []
+        for order_commessa, style in styles.items():
+            # Orders without fabric rows get the signature of an empty BOM, so they match each other as before
+            items = boms.get(order_commessa, [])
+            signature = bom_signature(items)
+            if existing.get(order_commessa) == (style, signature):
+                continue
+            row = {'style': style, 'signature': signature, 'items': bom_items_text(items),
+                   'item_count': len(items), 'computed_at': computed_at}
+            if order_commessa in existing:
+                row = {f'b_{key}': value for key, value in row.items()}
+                row['b_order_commessa'] = order_commessa
+                updates.append(row)
+            else:
+                row['order_commessa'] = order_commessa
+                inserts.append(row)
+
+        table = OrderBomSignature.__table__
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+        if updates:
+            db.session.execute(
+                table.update()
+                .where(table.c.order_commessa == bindparam('b_order_commessa'))
+                .values({table.c[key]: bindparam(f'b_{key}')
+                         for key in ['style', 'signature', 'items', 'item_count', 'computed_at']}),
+                updates
+            )
+
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        if full:
+            state.last_full_sync = computed_at
+        state.last_incremental_sync = computed_at
+        state.last_row_count = len(styles)
+        state.last_duration_ms = duration_ms
+        state.last_error = None
+        db.session.commit()
+
+        return {
+            "mode": "full" if full else "incremental",
+            "orders": len(styles),
+            "inserted": len(inserts),
+            "updated": len(updates),
+            "duration_ms": duration_ms
+        }
+
+    except Exception as e:
+        db.session.rollback()
+        try:
+            get_sync_state(BOM_SIGNATURES_SYNC).last_error = str(e)[:1000]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+        raise
@@ -0,0 +1,83 @@
+"""
+Small in-process memo with shared invalidation.
+
+Each gunicorn worker keeps its own Memo. Entries are tied to a version key in
+the cache_versions table: a writer calls bump_versions() in its transaction,
+and every worker sees the new version on its next lookup (one primary key
+read) and recomputes. A TTL bounds staleness for changes that do not bump a
+version.
+"""
+
+import threading
+import time
+
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from api.models import db, CacheVersion
+
+
+def get_version(key):
+    """Current version of a key (0 if it was never bumped)"""
+    version = db.session.execute(select(CacheVersion.version).where(CacheVersion.key == key)).scalar()
+    return version or 0
+
+
+def bump_versions(connection, keys):
+    """Increment the version of every key, on the given connection (same transaction as the change)"""
+    table = CacheVersion.__table__
+    for key in sorted(set(keys)):
+        increment = table.update().where(table.c.key == key).values(version=table.c.version + 1)
+        if connection.execute(increment).rowcount:
+            continue
+        try:
+            # Savepoint: a failed insert must not end the transaction of the change
+            with connection.begin_nested():
+                connection.execute(table.insert().values(key=key, version=1))
+        except IntegrityError:
+            # Another transaction created the key since the update: increment it instead
+            connection.execute(increment)
+
+
+class Memo:
+    """Thread-safe dict of (version, expires_at, value) with a size cap"""
+
+    def __init__(self, ttl=600, max_entries=500):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] == version and entry[1] > time.monotonic():
+                self.hits += 1
+                return True, entry[2]
+            self.misses += 1
+            return False, None
+
+    def set(self, key, version, value, ttl=None):
+        with self._lock:
+            if len(self._entries) >= self.max_entries and key not in self._entries:
+                # Drop the entry closest to expiry
+                self._entries.pop(min(self._entries, key=lambda k: self._entries[k][1]))
+            self._entries[key] = (version, time.monotonic() + (ttl or self.ttl), value)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def get_or_compute(self, key, version_key, compute, ttl=None):
+        """Return the memoized value for key, computing it when missing, expired or outdated.
+
+        Without a version_key the entry only expires with the TTL.
+        """
+        version = get_version(version_key) if version_key else 0
+        found, value = self.get(key, version)
+        if not found:
+            value = compute()
+            self.set(key, version, value, ttl)
+        return value
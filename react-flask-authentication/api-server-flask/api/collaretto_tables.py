@@ -0,0 +1,296 @@
+"""
+Bulk save of a collaretto table (along, weft or bias).
+
+The planning screen posts every row of a table to add_along_row, add_weft_row
+or add_bias_row: one transaction per row, each with a handful of lookups.
+save_collaretto_table() saves all the rows of one table in one transaction:
+the existing rows are read with one query per table, and the mattresses,
+phases, mattress details, collarettos and collaretto details are written with
+one executemany per table and operation. Rows of the table that are no longer
+in the payload are deleted, with their weft/bias mattress, as the screen's
+delete calls do.
+
+Rows use the same payload as the single-row endpoints.
+"""
+
+from datetime import datetime
+
+from sqlalchemy import bindparam
+
+from api.cache import bump_versions
+from api.consumption import consumption_version_key
+from api.logistic_collaretto import TABLE_TYPES
+from api.models import (db, Collaretto, CollarettoDetail, Mattresses, MattressDetail, MattressPhase,
+                        MattressProductionCenter)
+from api.order_lines_sync import chunked
+from api.transactions import transactional
+
+# Phases created with every new weft/bias mattress: (status, active)
+DEFAULT_PHASES = [("0 - NOT SET", True), ("1 - TO LOAD", False), ("2 - ON SPREAD", False), ("5 - COMPLETED", False)]
+
+# Collaretto types that own a mattress (same row_id as the collaretto)
+MATTRESS_TYPES = ('CW', 'CB')
+
+
+def _applicable_sizes(row):
+    applicable_sizes = row.get('applicable_sizes')
+    return applicable_sizes if applicable_sizes != 'ALL' else None
+
+
+def _float_or_none(value):
+    return float(value) if value is not None else None
+
+
+def _first_detail(row):
+    details = row.get('details') or []
+    return details[0] if details else None
+
+
+def _mattress_item_type(row):
+    if row.get('item_type') == 'CB':
+        return 'MSB'
+    return 'MSW' if row.get('spreading', 'AUTOMATIC') == 'MANUAL' else 'ASW'
+
+
+def _mattress_values(row, table_id, now):
+    return {
+        'mattress': row.get('mattress'),
+        'order_commessa': row.get('order_commessa'),
+        'fabric_type': row.get('fabric_type'),
+        'fabric_code': row.get('fabric_code'),
+        'fabric_color': row.get('fabric_color'),
+        'dye_lot': row.get('dye_lot'),
+        'item_type': _mattress_item_type(row),
+        'spreading_method': 'FACE UP',
+        'table_id': table_id,
+        'row_id': row.get('row_id'),
+        'sequence_number': row.get('sequence_number'),
+        'updated_at': now
+    }
+
+
+def _mattress_detail_values(row, detail, now):
+    # Weft panels are rewound to rewound_width, bias panels are cut at panel_length
+    length = detail.get('panel_length') if row.get('item_type') == 'CB' else detail.get('rewound_width')
+    return {
+        'layers': detail.get('panels_planned') or 0,
+        'length_mattress': length or 0,
+        'cons_planned': detail.get('cons_planned') or 0,
+        'extra': 0,
+        'bagno_ready': detail.get('bagno_ready', False),
+        'updated_at': now
+    }
+
+
+def _collaretto_values(row, table_id, now):
+    return {
+        'order_commessa': row.get('order_commessa'),
+        'fabric_type': row.get('fabric_type'),
+        'fabric_code': row.get('fabric_code'),
+        'fabric_color': row.get('fabric_color'),
+        'dye_lot': row.get('dye_lot'),
+        'item_type': row.get('item_type'),
+        'table_id': table_id,
+        'row_id': row.get('row_id'),
+        'sequence_number': row.get('sequence_number'),
+        'updated_at': now
+    }
+
+
+def _collaretto_detail_values(row, detail, mattress_id, now):
+    item_type = row.get('item_type')
+    values = {
+        'mattress_id': mattress_id,
+        'pieces': detail.get('pieces'),
+        # Bias rows send the usable width as total_width
+        'usable_width': detail.get('total_width') if item_type == 'CB' else detail.get('usable_width'),
+        'gross_length': detail.get('gross_length'),
+        'roll_width': detail.get('roll_width'),
+        'scrap_rolls': detail.get('scrap_rolls'),
+        'rolls_planned': detail.get('rolls_planned'),
+        'cons_planned': detail.get('cons_planned'),
+        'extra': detail.get('extra'),
+        'applicable_sizes': _applicable_sizes(row),
+        'updated_at': now
+    }
+    if item_type in MATTRESS_TYPES:
+        values['pcs_seam'] = _float_or_none(detail.get('pcs_seam'))
+    else:
+        # Along rows also carry the actual values
+        values.update({
+            'rolls_actual': detail.get('rolls_actual'),
+            'cons_actual': detail.get('cons_actual'),
+            'total_collaretto': detail.get('total_collaretto')
+        })
+    return values
+
+
+def _ids_by_row_id(model, row_ids):
+    found = {}
+    for chunk in chunked(row_ids):
+        found.update(db.session.query(model.row_id, model.id).filter(model.row_id.in_(chunk)).all())
+    return found
+
+
+def _ids_by_parent(column, parent_ids):
+    """{parent id: child id} for a one-to-one child table"""
+    found = {}
+    for chunk in chunked(parent_ids):
+        found.update(db.session.query(column, column.class_.id).filter(column.in_(chunk)).all())
+    return found
+
+
+def _write(table, updates, inserts, extra_values=None):
+    """One executemany UPDATE (rows keyed by b_id) and one executemany INSERT"""
+    if updates:
+        statement = table.update().where(table.c.id == bindparam('b_id'))
+        if extra_values:
+            statement = statement.values(extra_values)
+        db.session.execute(statement, updates)
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+
+
+def _delete_rows(collaretto_ids):
+    """Delete collarettos (and the mattress of weft/bias rows) through the ORM cascades"""
+    if not collaretto_ids:
+        return
+    collarettos = Collaretto.query.filter(Collaretto.id.in_(collaretto_ids)).all()
+    details = CollarettoDetail.query.filter(CollarettoDetail.collaretto_id.in_(collaretto_ids)).all()
+
+    item_types = {collaretto.id: collaretto.item_type for collaretto in collarettos}
+    owned = [detail.mattress_id for detail in details
+             if detail.mattress_id and item_types.get(detail.collaretto_id) in MATTRESS_TYPES]
+    if owned:
+        for mattress in Mattresses.query.filter(Mattresses.id.in_(owned)).all():
+            print(f"🗑️ Deleting mattress: {mattress.mattress}")
+            db.session.delete(mattress)
+
+    for collaretto in collarettos:
+        print(f"🗑️ Deleting collaretto: {collaretto.collaretto}")
+        db.session.delete(collaretto)
+
+    # Flush now: new rows may reuse the names of the deleted ones
+    db.session.flush()
+
+
+def _save_production_center(table_id, item_type, production_center):
+    record = MattressProductionCenter.query.filter_by(table_id=table_id).first()
+    if not record:
+        record = MattressProductionCenter(table_id=table_id)
+        db.session.add(record)
+    record.table_type = TABLE_TYPES[item_type]
+    record.production_center = production_center.get('production_center')
+    record.cutting_room = production_center.get('cutting_room')
+    record.destination = production_center.get('destination')
+
+
+@transactional
+def save_collaretto_table(table_id, rows, operator=None, production_center=None, delete_all=False):
+    """Insert or update every row of a collaretto table and delete the rows no longer in it.
+
+    rows are add_along_row / add_weft_row / add_bias_row payloads of one table; empty
+    rows delete the whole table and are refused unless delete_all is True.
+    production_center ({production_center, cutting_room, destination}) is saved for
+    the table when given. Returns the number of inserted, updated and deleted rows.
+    """
+    if not rows and not delete_all:
+        raise ValueError("No rows given: pass delete_all=True to delete every row of the table")
+    now = datetime.now()
+    row_ids = [row['row_id'] for row in rows]
+    item_type = rows[0].get('item_type') if rows else None
+
+    # Existing rows: the table's collarettos plus any payload row saved on another table
+    collaretto_ids = dict(db.session.query(Collaretto.row_id, Collaretto.id).filter(Collaretto.table_id == table_id).all())
+    collaretto_ids.update(_ids_by_row_id(Collaretto, [row_id for row_id in row_ids if row_id not in collaretto_ids]))
+    fabric_codes = {code for (code,) in db.session.query(Collaretto.fabric_code)
+                    .filter(Collaretto.table_id == table_id).distinct()}
+
+    payload_row_ids = set(row_ids)
+    removed = [collaretto_id for row_id, collaretto_id in collaretto_ids.items() if row_id not in payload_row_ids]
+    _delete_rows(removed)
+
+    # Weft/bias mattresses share the row_id of their collaretto
+    mattress_rows = [row for row in rows if row.get('item_type') in MATTRESS_TYPES]
+    mattress_ids = _ids_by_row_id(Mattresses, [row['row_id'] for row in mattress_rows])
+
+    mattress_table = Mattresses.__table__
+    _write(
+        mattress_table,
+        [{'b_id': mattress_ids[row['row_id']], **_mattress_values(row, table_id, now)}
+         for row in mattress_rows if row['row_id'] in mattress_ids],
+        [{**_mattress_values(row, table_id, now), 'created_at': now}
+         for row in mattress_rows if row['row_id'] not in mattress_ids]
+    )
+
+    new_mattress_row_ids = [row['row_id'] for row in mattress_rows if row['row_id'] not in mattress_ids]
+    if new_mattress_row_ids:
+        new_mattress_ids = _ids_by_row_id(Mattresses, new_mattress_row_ids)
+        mattress_ids.update(new_mattress_ids)
+        db.session.execute(MattressPhase.__table__.insert(), [
+            {'mattress_id': mattress_id, 'status': status, 'active': active,
+             'operator': operator if active else None, 'created_at': now, 'updated_at': now}
+            for mattress_id in new_mattress_ids.values()
+            for status, active in DEFAULT_PHASES
+        ])
+
+    mattress_detail_ids = _ids_by_parent(MattressDetail.mattress_id, mattress_ids.values())
+    mattress_detail_updates = []
+    mattress_detail_inserts = []
+    for row in mattress_rows:
+        detail = _first_detail(row)
+        if detail is None:
+            continue
+        mattress_id = mattress_ids[row['row_id']]
+        values = _mattress_detail_values(row, detail, now)
+        if mattress_id in mattress_detail_ids:
+            mattress_detail_updates.append({'b_id': mattress_detail_ids[mattress_id], **values})
+        else:
+            mattress_detail_inserts.append({'mattress_id': mattress_id, 'created_at': now, **values})
+    _write(MattressDetail.__table__, mattress_detail_updates, mattress_detail_inserts)
+
+    # Collarettos
+    kept = {row_id: collaretto_id for row_id, collaretto_id in collaretto_ids.items() if row_id in payload_row_ids}
+    _write(
+        Collaretto.__table__,
+        [{'b_id': kept[row['row_id']], **_collaretto_values(row, table_id, now)} for row in rows if row['row_id'] in kept],
+        [{**_collaretto_values(row, table_id, now), 'collaretto': row.get('collaretto'), 'created_at': now}
+         for row in rows if row['row_id'] not in kept]
+    )
+    inserted = len([row for row in rows if row['row_id'] not in kept])
+    if inserted:
+        kept.update(_ids_by_row_id(Collaretto, [row['row_id'] for row in rows if row['row_id'] not in kept]))
+
+    # Collaretto details (one per collaretto), grouped by the columns each type writes
+    collaretto_detail_ids = _ids_by_parent(CollarettoDetail.collaretto_id, kept.values())
+    detail_updates = {}
+    detail_inserts = {}
+    for row in rows:
+        detail = _first_detail(row)
+        if detail is None:
+            continue
+        collaretto_id = kept[row['row_id']]
+        mattress_id = mattress_ids.get(row['row_id']) if row.get('item_type') in MATTRESS_TYPES else detail.get('mattress_id')
+        values = _collaretto_detail_values(row, detail, mattress_id, now)
+        if collaretto_id in collaretto_detail_ids:
+            detail_updates.setdefault(tuple(values), []).append({'b_id': collaretto_detail_ids[collaretto_id], **values})
+        else:
+            detail_inserts.setdefault(tuple(values), []).append({'collaretto_id': collaretto_id, 'created_at': now, **values})
+
+    collaretto_detail_table = CollarettoDetail.__table__
+    for params in detail_updates.values():
+        # Logistic screens holding the old version must reload before saving
+        _write(collaretto_detail_table, params, [], {'version': collaretto_detail_table.c.version + 1})
+    for params in detail_inserts.values():
+        _write(collaretto_detail_table, [], params)
+
+    if production_center is not None and item_type in TABLE_TYPES:
+        _save_production_center(table_id, item_type, production_center)
+
+    # Core writes skip the session flush hooks: bump the consumption caches here
+    fabric_codes.update(row.get('fabric_code') for row in rows)
+    fabric_codes.discard(None)
+    if fabric_codes:
+        bump_versions(db.session.connection(), [consumption_version_key(code) for code in fabric_codes])
+
+    return {"inserted": inserted, "updated": len(rows) - inserted, "deleted": len(removed)}
@@ -42,6 +42,13 @@ def load_database_config():
 
     return defaults
 
+def env_flag(name, default):
+    """Boolean environment variable: 1/true/yes/on"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
 class BaseConfig():
 
     SECRET_KEY = os.getenv('SECRET_KEY') or ''.join(random.choice(string.ascii_lowercase) for _ in range(32))
@@ -69,4 +76,21 @@ class BaseConfig():
     SQLALCHEMY_DATABASE_URI = (
     f"mssql+pyodbc://{DB_USERNAME}:{DB_PASS}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
     f"?driver={driver_for_url}&TrustServerCertificate=yes&charset=utf8"
-    )
\ No newline at end of file
+    )
+
+    # Connection pool per gunicorn worker (see api/db_pool.py). 9 workers x 2 threads:
+    # 3 + 2 overflow connections per worker stays under 50 sessions on the server
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 3))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 2))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = env_flag('DB_POOL_PRE_PING', True)
+    DB_FAST_EXECUTEMANY = env_flag('DB_FAST_EXECUTEMANY', True)
+    DB_ODBC_POOLING = env_flag('DB_ODBC_POOLING', False)
+
+    # Background jobs (see api/jobs.py): SQLite queue shared by the API workers and run_jobs.py
+    JOBS_DB_PATH = os.getenv('JOBS_DB_PATH', os.path.join(BASE_DIR, '..', 'instance', 'jobs.sqlite3'))
+    JOBS_RETENTION_HOURS = int(os.getenv('JOBS_RETENTION_HOURS', 24))
+    JOBS_STALE_SECONDS = int(os.getenv('JOBS_STALE_SECONDS', 120))
+    JOBS_MAX_ATTEMPTS = int(os.getenv('JOBS_MAX_ATTEMPTS', 2))
+    JOBS_IN_PROCESS = env_flag('JOBS_IN_PROCESS', False)
@@ -0,0 +1,191 @@
+"""
+Collaretto consumption figures per (style, fabric_code).
+
+Used by /orders/collaretto_consumption/<style>/<fabric_code> to propose
+consumption for new collaretto rows from the most recent ones of the same
+style and fabric. Everything is read with two aggregated joins and memoized
+per worker; the memo is invalidated (through cache_versions) whenever a
+mattress with that fabric completes or a collaretto with that fabric changes.
+"""
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from api.cache import Memo, bump_versions
+from api.models import (db, Collaretto, CollarettoDetail, Mattresses, MattressPhase, MattressSize,
+                        OrderLinesView, OrderLineReplica)
+from api.order_lines_sync import replica_ready
+
+# Number of most recent collaretto records the figures are based on
+RECENT_COLLARETTO_LIMIT = 5
+
+consumption_memo = Memo(ttl=600)
+
+
+def consumption_version_key(fabric_code):
+    return f"collaretto_consumption:{fabric_code}"
+
+
+def _number(value):
+    return float(value) if value else 0
+
+
+def compute_collaretto_consumption(style, fabric_code):
+    """Return (data, debug_info) for the style and fabric; data is {} when there is nothing to show"""
+    model = OrderLineReplica if replica_ready() else OrderLinesView
+    style_orders = db.session.query(model.order_commessa).filter(model.style == style)
+
+    # Limit to the most recent records based on order_commessa (assuming higher order numbers are newer)
+    recent = db.session.query(Collaretto.id)\
+        .filter(Collaretto.order_commessa.in_(style_orders), Collaretto.fabric_code == fabric_code)\
+        .order_by(Collaretto.order_commessa.desc(), Collaretto.id.desc())\
+        .limit(RECENT_COLLARETTO_LIMIT)\
+        .subquery()
+
+    # Query 1: the recent collarettos with their details and the bagno (dye_lot) of the mattress
+    rows = db.session.query(Collaretto, CollarettoDetail, Mattresses.dye_lot)\
+        .join(recent, recent.c.id == Collaretto.id)\
+        .join(CollarettoDetail, CollarettoDetail.collaretto_id == Collaretto.id)\
+        .outerjoin(Mattresses, Mattresses.id == CollarettoDetail.mattress_id)\
+        .order_by(Collaretto.order_commessa.desc(), Collaretto.id.desc(), CollarettoDetail.id)\
+        .all()
+
+    if not rows:
+        return {}, f"No collaretto records found for style: {style}, fabric: {fabric_code}"
+
+    collaretto_records = []
+    bagno_groups = {}  # Group records by bagno
+    total_pieces = 0
+    total_consumption = 0
+    total_length = 0
+    seen = set()
+
+    for collaretto, detail, bagno in rows:
+        # One detail per collaretto, as before
+        if collaretto.id in seen:
+            continue
+        seen.add(collaretto.id)
+
+        pieces = _number(detail.pieces)
+        cons_planned = _number(detail.cons_planned)
+        gross_length = _number(detail.gross_length)
+
+        if bagno not in bagno_groups:
+            bagno_groups[bagno] = {
+                'bagno': bagno,
+                'total_pieces': 0,
+                'total_consumption': 0,
+                'records': []
+            }
+
+        bagno_groups[bagno]['total_pieces'] += pieces
+        bagno_groups[bagno]['total_consumption'] += cons_planned
+
+        record_data = {
+            'order_commessa': collaretto.order_commessa,
+            'collaretto_id': collaretto.id,
+            'fabric_type': collaretto.fabric_type or 'N/A',
+            'item_type': collaretto.item_type,  # Add item_type for grain direction
+            'pieces': pieces,
+            'usable_width': _number(detail.usable_width),
+            'gross_length': gross_length,
+            'cons_planned': cons_planned,
+            'pcs_seam': _number(detail.pcs_seam),
+            'collarettoWidth': _number(detail.roll_width),  # Use frontend field name
+            'consumption_per_piece': round(cons_planned / pieces, 4) if pieces > 0 else 0,
+            'bagno': bagno,
+            'mattress_id': detail.mattress_id,
+            'applicable_sizes': detail.applicable_sizes  # Add the stored applicable sizes
+        }
+        bagno_groups[bagno]['records'].append(record_data)
+        collaretto_records.append(record_data)
+
+        total_pieces += pieces
+        total_consumption += cons_planned
+        total_length += gross_length
+
+    # Query 2: planned quantities per bagno and size, summed over all mattresses of the bagno
+    bagno_planned_quantities = {}
+    bagnos = [bagno for bagno in bagno_groups if bagno]
+    if bagnos:
+        planned_rows = db.session.query(Mattresses.dye_lot, MattressSize.size, func.sum(MattressSize.pcs_planned))\
+            .join(MattressSize, MattressSize.mattress_id == Mattresses.id)\
+            .filter(Mattresses.dye_lot.in_(bagnos))\
+            .group_by(Mattresses.dye_lot, MattressSize.size)\
+            .all()
+        for bagno in bagnos:
+            bagno_planned_quantities[bagno] = {}
+        for bagno, size, planned in planned_rows:
+            bagno_planned_quantities[bagno][size] = _number(planned)
+
+    # Add bagno grouping info to each record for frontend matching
+    for record in collaretto_records:
+        bagno = record['bagno']
+        record['bagno_info'] = {
+            'bagno': bagno,
+            'total_pieces_in_bagno': bagno_groups[bagno]['total_pieces'],
+            'pieces_to_match': bagno_groups[bagno]['total_pieces'],  # Use total for matching
+            'mattress_id': record['mattress_id'],
+            'individual_pieces': record['pieces'],  # Keep individual record pieces for reference
+            'planned_quantities': bagno_planned_quantities.get(bagno, {})
+        }
+
+    data = {
+        'style': style,
+        'fabric_code': fabric_code,
+        'fabric_type': collaretto_records[0]['fabric_type'],
+        'description': f"Collaretto - {collaretto_records[0]['fabric_type']}",
+        'total_records': len(collaretto_records),
+        'bagno_groups': bagno_groups,
+        'statistics': {
+            'total_pieces': total_pieces,
+            'total_consumption': round(total_consumption, 2),
+            'avg_consumption_per_piece': round(total_consumption / total_pieces, 4) if total_pieces > 0 else 0,
+            'avg_length': round(total_length / len(collaretto_records), 2),
+            'avg_pieces': round(total_pieces / len(collaretto_records), 1)
+        },
+        'records': collaretto_records
+    }
+    return data, None
+
+
+def get_collaretto_consumption(style, fabric_code):
+    """Memoized compute_collaretto_consumption"""
+    return consumption_memo.get_or_compute(
+        (style, fabric_code),
+        consumption_version_key(fabric_code),
+        lambda: compute_collaretto_consumption(style, fabric_code)
+    )
+
+
+@event.listens_for(Session, 'after_flush')
+def invalidate_collaretto_consumption(session, flush_context):
+    """Bump the consumption version of every fabric touched by a completed mattress or a collaretto change"""
+    fabric_codes = set()
+    mattress_ids = set()
+    collaretto_ids = set()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, MattressPhase):
+            if obj.status == '5 - COMPLETED' and obj.active:
+                mattress_ids.add(obj.mattress_id)
+        elif isinstance(obj, Collaretto):
+            fabric_codes.add(obj.fabric_code)
+        elif isinstance(obj, CollarettoDetail):
+            collaretto_ids.add(obj.collaretto_id)
+
+    if not (fabric_codes or mattress_ids or collaretto_ids):
+        return
+
+    # Plain SELECTs on the flush connection: querying through the session here would autoflush
+    connection = session.connection()
+    if mattress_ids:
+        fabric_codes.update(connection.execute(
+            select(Mattresses.fabric_code).where(Mattresses.id.in_(mattress_ids))).scalars())
+    if collaretto_ids:
+        fabric_codes.update(connection.execute(
+            select(Collaretto.fabric_code).where(Collaretto.id.in_(collaretto_ids))).scalars())
+
+    fabric_codes.discard(None)
+    if fabric_codes:
+        bump_versions(connection, [consumption_version_key(code) for code in fabric_codes])
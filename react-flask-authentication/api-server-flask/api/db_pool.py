@@ -0,0 +1,100 @@
+"""
+Connection pool of the SQL Server engine.
+
+engine_options() builds SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings of
+BaseConfig (environment variables): pool size and overflow per worker,
+recycle, pre-ping and fast_executemany (pyodbc sends an executemany as one
+parameter array instead of one round trip per row). ODBC driver manager pooling is turned off by
+default: connections returned to the SQLAlchemy pool would otherwise be pooled
+a second time by the driver.
+
+TimedQueuePool measures how long each checkout waits for a connection (queue
+wait plus connect time when the pool grows) into a histogram per worker,
+exposed by pool_stats() on /health/pool.
+"""
+
+import threading
+import time
+
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import QueuePool
+
+# Upper bounds of the checkout wait buckets, in milliseconds (the last bucket is open)
+WAIT_BUCKETS_MS = (1, 5, 10, 50, 100, 500, 1000, 5000)
+
+_stats_lock = threading.Lock()
+_stats = {
+    'checkouts': 0, 'timeouts': 0, 'wait_ms_total': 0.0, 'wait_ms_max': 0.0,
+    'histogram': [0] * (len(WAIT_BUCKETS_MS) + 1)
+}
+
+
+def _record_wait(wait_ms, timed_out=False):
+    bucket = next((index for index, bound in enumerate(WAIT_BUCKETS_MS) if wait_ms <= bound), len(WAIT_BUCKETS_MS))
+    with _stats_lock:
+        _stats['checkouts'] += 1
+        _stats['timeouts'] += int(timed_out)
+        _stats['wait_ms_total'] += wait_ms
+        _stats['wait_ms_max'] = max(_stats['wait_ms_max'], wait_ms)
+        _stats['histogram'][bucket] += 1
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records the checkout wait time"""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            _record_wait((time.perf_counter() - started) * 1000, timed_out=True)
+            raise
+        _record_wait((time.perf_counter() - started) * 1000)
+        return connection
+
+
+def reset_pool_stats():
+    with _stats_lock:
+        _stats.update(checkouts=0, timeouts=0, wait_ms_total=0.0, wait_ms_max=0.0,
+                      histogram=[0] * (len(WAIT_BUCKETS_MS) + 1))
+
+
+def pool_stats(engine=None):
+    """Checkout wait histogram of this worker, plus the current state of the engine's pool"""
+    with _stats_lock:
+        stats = dict(_stats, histogram=list(_stats['histogram']))
+
+    bounds = [f"<={bound}ms" for bound in WAIT_BUCKETS_MS] + [f">{WAIT_BUCKETS_MS[-1]}ms"]
+    stats['histogram'] = dict(zip(bounds, stats['histogram']))
+    stats['wait_ms_avg'] = round(stats['wait_ms_total'] / stats['checkouts'], 3) if stats['checkouts'] else 0
+    stats['wait_ms_total'] = round(stats['wait_ms_total'], 3)
+    stats['wait_ms_max'] = round(stats['wait_ms_max'], 3)
+
+    pool = getattr(engine, 'pool', None)
+    if isinstance(pool, QueuePool):
+        stats['pool'] = {
+            'size': pool.size(), 'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(), 'overflow': pool.overflow()
+        }
+    return stats
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings of an app config (SQL Server only)"""
+    if not config['SQLALCHEMY_DATABASE_URI'].startswith('mssql+pyodbc'):
+        return {}
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'fast_executemany': config['DB_FAST_EXECUTEMANY']
+    }
+
+
+def configure_odbc_pooling(enabled):
+    """pyodbc.pooling only applies if set before the first connection of the process"""
+    import pyodbc
+    pyodbc.pooling = enabled
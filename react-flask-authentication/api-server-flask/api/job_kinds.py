@@ -0,0 +1,100 @@
+"""
+Job kinds of the background job runner (api/jobs.py).
+
+dashboard_report and batch_import_markers replay the existing endpoints
+through a request context, so a report computed by a job returns the same
+body as the endpoint (the frontend renders job.result like the response).
+width_validation_sync and ops_script run the sync and maintenance scripts that
+used to be started by hand or from a request.
+"""
+
+import base64
+import io
+import os
+import re
+import subprocess
+import sys
+
+from flask import current_app
+
+from api.jobs import job, report_progress
+from api.width_validation import sync_handling_units
+
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Dashboard reports that can take longer than the gunicorn timeout over a year
+DASHBOARD_REPORTS = (
+    'orders-worked-on', 'markers-imported', 'markers-imported-trend', 'statistics', 'long-mattress-percentage',
+    'meters-spreaded', 'meters-raw-data', 'pieces-spreaded', 'top-fabrics', 'coverage', 'coverage/to-load-cut',
+    'italian-ratio-analysis'
+)
+
+# Queued only by the roles of KIND_ROLES (api/routes/jobs.py): these scripts change data
+OPS_SCRIPTS = ('sync_order_lines.py', 'sync_handling_units.py', 'fix_wrong_status_phases.py',
+               'check_mattress_cons_actual.py')
+# Arguments always passed to a script: the jobs have no terminal to answer prompts
+OPS_SCRIPT_ARGS = {'fix_wrong_status_phases.py': ['--yes']}
+OPS_SCRIPT_TIMEOUT = 3600
+OUTPUT_TAIL_LINES = 200
+
+
+def _dispatch(path, **request_options):
+    """Response body of an endpoint of this app, called without going through HTTP"""
+    with current_app.test_request_context(path, **request_options):
+        response = current_app.full_dispatch_request()
+    body = response.get_json(silent=True)
+    if response.status_code >= 400:
+        msg = (body or {}).get('msg') or (body or {}).get('message') or response.status
+        raise RuntimeError(f"{path} returned {response.status_code}: {msg}")
+    return body
+
+
+@job('dashboard_report', concurrency=2)
+def dashboard_report(params):
+    """params: {"report": one of DASHBOARD_REPORTS, "args": {query string of the endpoint}}"""
+    report = params.get('report')
+    if report not in DASHBOARD_REPORTS:
+        raise ValueError(f"Unknown dashboard report: {report}")
+    report_progress(0, message=f"Running {report}")
+    return _dispatch(f"/api/dashboard/{report}", query_string=params.get('args') or {})
+
+
+@job('batch_import_markers')
+def batch_import_markers(params):
+    """params: {"files": [{"filename", "content" (base64)}], "creationType", "markerContentData"}"""
+    files = params.get('files') or []
+    data = {
+        'files[]': [(io.BytesIO(base64.b64decode(f['content'])), f['filename']) for f in files],
+        'creationType': params.get('creationType', '')
+    }
+    if params.get('markerContentData') is not None:
+        data['markerContentData'] = params['markerContentData']
+    return _dispatch('/api/markers/batch_import_markers', method='POST', data=data,
+                     content_type='multipart/form-data')
+
+
+@job('width_validation_sync')
+def width_validation_sync(params):
+    """params: {"full": bool, "since_entry_no": int or null}"""
+    report_progress(0, message="Syncing handling units")
+    return sync_handling_units(full=bool(params.get('full')), since_entry_no=params.get('since_entry_no'))
+
+
+@job('ops_script')
+def ops_script(params):
+    """params: {"script": one of OPS_SCRIPTS, "args": ["full", ...]}; returns the tail of its output"""
+    script = params.get('script')
+    args = [str(arg) for arg in params.get('args') or []]
+    if script not in OPS_SCRIPTS:
+        raise ValueError(f"Unknown script: {script}")
+    if not all(re.fullmatch(r'[\w.-]+', arg) for arg in args):
+        raise ValueError("Script arguments may only contain letters, digits, '.', '-' and '_'")
+
+    args = [arg for arg in OPS_SCRIPT_ARGS.get(script, []) if arg not in args] + args
+    report_progress(0, message=f"Running {script} {' '.join(args)}".strip())
+    completed = subprocess.run([sys.executable, script] + args, cwd=SERVER_DIR, stdin=subprocess.DEVNULL,
+                               capture_output=True, text=True, timeout=OPS_SCRIPT_TIMEOUT)
+    output = (completed.stdout + completed.stderr).splitlines()[-OUTPUT_TAIL_LINES:]
+    if completed.returncode != 0:
+        raise RuntimeError(f"{script} exited with code {completed.returncode}:\n" + "\n".join(output[-20:]))
+    return {"script": script, "args": args, "returncode": completed.returncode, "output": output}
@@ -0,0 +1,332 @@
+"""
+Background jobs.
+
+Long operations (reports over a year, batch marker imports, width validation
+syncs, ops scripts) used to run inside the HTTP request, against the 60 s
+gunicorn timeout and holding one of the 18 request threads. They are now
+submitted as jobs (POST /api/jobs) and run by a job runner outside the request
+path; clients poll GET /api/jobs/<id> for the status, the progress and the
+result.
+
+The queue is a SQLite file (JOBS_DB_PATH, WAL mode), shared by the gunicorn
+workers that submit and the runner that executes: jobs survive restarts, and a
+job whose runner stopped (no heartbeat for JOBS_STALE_SECONDS) is queued again,
+up to JOBS_MAX_ATTEMPTS runs. Finished jobs and their results are kept for
+JOBS_RETENTION_HOURS.
+
+Job kinds are registered with @job(kind, concurrency): a function
+func(params) -> JSON-serializable result, run in an app context. concurrency is
+the number of jobs of that kind running at once across all runners. Inside a
+job, report_progress(done, total, message) updates the progress; outside a job
+it does nothing, so the same code can also run in a request.
+
+The runner is run_jobs.py (sidecar process), or a thread of each gunicorn
+worker when JOBS_IN_PROCESS is set.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+from api.config import BaseConfig
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+FINISHED = (DONE, FAILED, CANCELLED)
+
+POLL_SECONDS = 1
+HEARTBEAT_SECONDS = 15
+
+_registry = {}
+_schema_lock = threading.Lock()
+_schema_ready = set()
+_current = threading.local()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    params TEXT NOT NULL,
+    status TEXT NOT NULL,
+    progress REAL NOT NULL DEFAULT 0,
+    message TEXT,
+    result TEXT,
+    error TEXT,
+    submitted_by TEXT,
+    worker TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL,
+    started_at TEXT,
+    finished_at TEXT,
+    heartbeat_at TEXT
+);
+CREATE INDEX IF NOT EXISTS ix_jobs_status_created ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS ix_jobs_kind_status ON jobs (kind, status);
+"""
+
+SUMMARY_COLUMNS = ('id', 'kind', 'status', 'progress', 'message', 'error', 'submitted_by', 'worker',
+                   'attempts', 'created_at', 'started_at', 'finished_at')
+
+
+def job(kind, concurrency=1):
+    """Register func(params) as the job kind"""
+    def decorator(func):
+        _registry[kind] = (func, concurrency)
+        return func
+    return decorator
+
+
+def job_kinds():
+    return {kind: {"concurrency": concurrency} for kind, (_, concurrency) in sorted(_registry.items())}
+
+
+def _now():
+    return datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+
+def _connect(path=None):
+    path = path or BaseConfig.JOBS_DB_PATH
+    connection = sqlite3.connect(path, timeout=30, isolation_level=None)
+    connection.row_factory = sqlite3.Row
+    if path not in _schema_ready:
+        with _schema_lock:
+            if path not in _schema_ready:
+                os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+                connection.execute("PRAGMA journal_mode=WAL")
+                connection.executescript(SCHEMA)
+                _schema_ready.add(path)
+    return connection
+
+
+def _job_dict(row, with_result=False):
+    data = {column: row[column] for column in SUMMARY_COLUMNS}
+    data['params'] = json.loads(row['params'])
+    if with_result:
+        data['result'] = json.loads(row['result']) if row['result'] is not None else None
+    return data
+
+
+def submit(kind, params=None, submitted_by=None):
+    """Queue a job; returns it (ValueError for an unknown kind)"""
+    if kind not in _registry:
+        raise ValueError(f"Unknown job kind: {kind}")
+    job_id = uuid.uuid4().hex
+    connection = _connect()
+    try:
+        connection.execute(
+            "INSERT INTO jobs (id, kind, params, status, submitted_by, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(params or {}), QUEUED, submitted_by, _now())
+        )
+        return _job_dict(connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+    finally:
+        connection.close()
+
+
+def get_job(job_id, with_result=True):
+    connection = _connect()
+    try:
+        row = connection.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_dict(row, with_result) if row else None
+    finally:
+        connection.close()
+
+
+def list_jobs(kind=None, status=None, limit=50):
+    """Most recent jobs first, without their results"""
+    query = "SELECT * FROM jobs WHERE 1 = 1"
+    args = []
+    if kind:
+        query += " AND kind = ?"
+        args.append(kind)
+    if status:
+        query += " AND status = ?"
+        args.append(status)
+    query += " ORDER BY created_at DESC LIMIT ?"
+    args.append(limit)
+
+    connection = _connect()
+    try:
+        return [_job_dict(row) for row in connection.execute(query, args).fetchall()]
+    finally:
+        connection.close()
+
+
+def cancel(job_id):
+    """Cancel a queued job; True if it was still queued"""
+    connection = _connect()
+    try:
+        cursor = connection.execute(
+            "UPDATE jobs SET status = ?, finished_at = ? WHERE id = ? AND status = ?",
+            (CANCELLED, _now(), job_id, QUEUED)
+        )
+        return cursor.rowcount == 1
+    finally:
+        connection.close()
+
+
+def report_progress(done, total=None, message=None):
+    """Progress of the running job (done out of total, or a percentage); no-op outside a job"""
+    job_id = getattr(_current, 'job_id', None)
+    if job_id is None:
+        return
+    progress = round(100.0 * done / total, 1) if total else float(done)
+    connection = _connect()
+    try:
+        connection.execute(
+            "UPDATE jobs SET progress = ?, message = COALESCE(?, message), heartbeat_at = ? WHERE id = ?",
+            (min(progress, 100.0), message, _now(), job_id)
+        )
+    finally:
+        connection.close()
+
+
+def _claim(worker):
+    """Mark the oldest runnable queued job as running for this worker; returns its row or None"""
+    connection = _connect()
+    try:
+        # BEGIN IMMEDIATE: one runner claims at a time, so the concurrency counts hold
+        connection.execute("BEGIN IMMEDIATE")
+        running = dict(connection.execute(
+            "SELECT kind, COUNT(*) FROM jobs WHERE status = ? GROUP BY kind", (RUNNING,)
+        ).fetchall())
+        runnable = [kind for kind, (_, concurrency) in _registry.items() if running.get(kind, 0) < concurrency]
+        if not runnable:
+            connection.execute("COMMIT")
+            return None
+
+        row = connection.execute(
+            f"SELECT * FROM jobs WHERE status = ? AND kind IN ({', '.join('?' * len(runnable))}) "
+            "ORDER BY created_at LIMIT 1",
+            [QUEUED] + runnable
+        ).fetchone()
+        if row is not None:
+            now = _now()
+            connection.execute(
+                "UPDATE jobs SET status = ?, worker = ?, attempts = attempts + 1, started_at = ?, heartbeat_at = ?, "
+                "progress = 0, message = NULL WHERE id = ?",
+                (RUNNING, worker, now, now, row['id'])
+            )
+        connection.execute("COMMIT")
+        return row
+    except Exception:
+        connection.execute("ROLLBACK")
+        raise
+    finally:
+        connection.close()
+
+
+def _finish(job_id, status, result=None, error=None):
+    connection = _connect()
+    try:
+        connection.execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ?, "
+            "progress = CASE WHEN ? = 'done' THEN 100 ELSE progress END WHERE id = ?",
+            (status, json.dumps(result, default=str) if result is not None else None, error, _now(), status, job_id)
+        )
+    finally:
+        connection.close()
+
+
+def _housekeeping(running_ids):
+    """Heartbeat of this runner's jobs, requeue of abandoned ones, purge of expired results"""
+    now = datetime.now()
+    stale_before = (now - timedelta(seconds=BaseConfig.JOBS_STALE_SECONDS)).strftime('%Y-%m-%d %H:%M:%S')
+    expired_before = (now - timedelta(hours=BaseConfig.JOBS_RETENTION_HOURS)).strftime('%Y-%m-%d %H:%M:%S')
+
+    connection = _connect()
+    try:
+        for job_id in running_ids:
+            connection.execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (_now(), job_id))
+
+        connection.execute(
+            "UPDATE jobs SET status = ?, worker = NULL WHERE status = ? AND heartbeat_at < ? AND attempts < ?",
+            (QUEUED, RUNNING, stale_before, BaseConfig.JOBS_MAX_ATTEMPTS)
+        )
+        connection.execute(
+            "UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE status = ? AND heartbeat_at < ?",
+            (FAILED, "The job runner stopped while the job was running", _now(), RUNNING, stale_before)
+        )
+        connection.execute(
+            f"DELETE FROM jobs WHERE status IN ({', '.join('?' * len(FINISHED))}) AND finished_at < ?",
+            list(FINISHED) + [expired_before]
+        )
+    finally:
+        connection.close()
+
+
+class JobRunner:
+    """Runs queued jobs on a few threads of this process"""
+
+    def __init__(self, app, threads=2):
+        self.app = app
+        self.threads = threads
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.running = set()
+        self.running_lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def _execute(self, row):
+        func, _ = _registry[row['kind']]
+        with self.running_lock:
+            self.running.add(row['id'])
+        _current.job_id = row['id']
+        started = time.perf_counter()
+        print(f"▶️ Job {row['kind']} {row['id']} started (attempt {row['attempts'] + 1})")
+        try:
+            with self.app.app_context():
+                result = func(json.loads(row['params']))
+            _finish(row['id'], DONE, result=result)
+            print(f"✅ Job {row['kind']} {row['id']} done in {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            _finish(row['id'], FAILED, error=str(e))
+            print(f"❌ Job {row['kind']} {row['id']} failed: {str(e)}")
+            print(traceback.format_exc())
+        finally:
+            _current.job_id = None
+            with self.running_lock:
+                self.running.discard(row['id'])
+
+    def _work(self):
+        while not self.stopping.is_set():
+            try:
+                row = _claim(self.worker)
+            except sqlite3.OperationalError as e:
+                print(f"⚠️ Job queue busy: {str(e)}")
+                row = None
+            if row is None:
+                self.stopping.wait(POLL_SECONDS)
+                continue
+            self._execute(row)
+
+    def _keep_alive(self):
+        while not self.stopping.is_set():
+            try:
+                with self.running_lock:
+                    running_ids = list(self.running)
+                _housekeeping(running_ids)
+            except Exception as e:
+                print(f"⚠️ Job housekeeping failed: {str(e)}")
+            self.stopping.wait(HEARTBEAT_SECONDS)
+
+    def start(self):
+        """Start the runner threads (daemons) and return"""
+        for target in [self._keep_alive] + [self._work] * self.threads:
+            threading.Thread(target=target, daemon=True).start()
+        print(f"🧵 Job runner {self.worker}: {self.threads} threads, kinds: {', '.join(sorted(_registry))}")
+
+    def run_forever(self):
+        self.start()
+        try:
+            while not self.stopping.wait(1):
+                pass
+        except KeyboardInterrupt:
+            self.stopping.set()
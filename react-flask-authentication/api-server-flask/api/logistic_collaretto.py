@@ -0,0 +1,299 @@
+"""
+Collaretto data for the logistic views.
+
+The along/weft/bias, destination and batch endpoints used to load the
+collaretto rows of an order and then look up the production center, the
+collaretto detail and the mattress of every row one by one, filtering for
+PXE3 in Python. collaretto_rows() returns all of it with one joined query
+(production center and destination filters in SQL) and collaretto_groups()
+aggregates by destination/bagno in the database, so each endpoint runs a
+fixed number of statements whatever the number of rows.
+
+update_collaretto_details() saves the rows of the configuration screen with one
+lookup, one version claim and one executemany UPDATE (retried on deadlocks).
+"""
+
+from datetime import datetime
+
+from sqlalchemy import bindparam, case, func
+from sqlalchemy.orm import aliased
+
+from api.cache import bump_versions
+from api.consumption import consumption_version_key
+from api.models import db, Collaretto, CollarettoDetail, Mattresses, MattressDetail, MattressProductionCenter
+from api.order_lines_sync import chunked
+from api.transactions import transactional
+
+# Logistic views only show collaretto produced by this production center
+LOGISTIC_PRODUCTION_CENTER = 'PXE3'
+
+TYPE_LABELS = {'CA': 'Along', 'CW': 'Weft', 'CB': 'Bias'}
+
+# MattressProductionCenter.table_type of each collaretto item type
+TABLE_TYPES = {'CA': 'ALONG', 'CW': 'WEFT', 'CB': 'BIAS'}
+
+
+def type_label(item_type):
+    return TYPE_LABELS.get(item_type, item_type)
+
+
+def _logistic_filters(query, order_commessa, item_types=None, destination=None, bagno=None, match_table_type=False):
+    query = query.filter(
+        Collaretto.order_commessa == order_commessa,
+        MattressProductionCenter.production_center == LOGISTIC_PRODUCTION_CENTER
+    )
+    if item_types:
+        query = query.filter(Collaretto.item_type.in_(item_types))
+    if match_table_type and item_types:
+        query = query.filter(MattressProductionCenter.table_type.in_([TABLE_TYPES[t] for t in item_types]))
+    if destination is not None:
+        query = query.filter(MattressProductionCenter.destination == destination)
+    if bagno is not None:
+        query = query.filter(Collaretto.dye_lot == bagno)
+    return query
+
+
+def collaretto_rows(order_commessa, item_types=None, destination=None, bagno=None, match_table_type=False):
+    """Return (collaretto, production_center, detail, mattress, mattress_detail) tuples of an order.
+
+    Only PXE3 tables are returned; match_table_type also requires the table type
+    to match the item type (ALONG for CA...). detail, mattress and mattress_detail
+    are None when missing.
+    """
+    linked_mattress = aliased(Mattresses)
+    linked_mattress_detail = aliased(MattressDetail)
+
+    query = db.session.query(
+        Collaretto, MattressProductionCenter, CollarettoDetail, linked_mattress, linked_mattress_detail
+    ).join(
+        MattressProductionCenter, Collaretto.table_id == MattressProductionCenter.table_id
+    ).outerjoin(
+        CollarettoDetail, CollarettoDetail.collaretto_id == Collaretto.id
+    ).outerjoin(
+        linked_mattress, CollarettoDetail.mattress_id == linked_mattress.id
+    ).outerjoin(
+        linked_mattress_detail, linked_mattress_detail.mattress_id == linked_mattress.id
+    )
+
+    query = _logistic_filters(query, order_commessa, item_types, destination, bagno, match_table_type)
+    return query.order_by(Collaretto.dye_lot, Collaretto.sequence_number, Collaretto.id).all()
+
+
+def mattresses_by_table(table_ids, order_commessa):
+    """{table_id: (mattress, mattress_detail)} for rows whose detail has no mattress_id (one query)"""
+    if not table_ids:
+        return {}
+    rows = db.session.query(Mattresses, MattressDetail).outerjoin(
+        MattressDetail, MattressDetail.mattress_id == Mattresses.id
+    ).filter(
+        Mattresses.table_id.in_(list(table_ids)),
+        Mattresses.order_commessa == order_commessa
+    ).order_by(Mattresses.id).all()
+
+    found = {}
+    for mattress, mattress_detail in rows:
+        found.setdefault(mattress.table_id, (mattress, mattress_detail))
+    return found
+
+
+def collaretto_groups(order_commessa, group_by_bagno=False, item_types=None, destination=None):
+    """Collaretto counts of an order per destination (or per bagno), grouped in SQL per table and bagno.
+
+    Returns an ordered list of dicts: key (destination or bagno), table_ids, count and
+    the fabric / production center data of the first table of the group.
+    """
+    # Always grouped per table and bagno: the bagno of a destination is the one of its first collaretto
+    columns = [
+        MattressProductionCenter.destination,
+        Collaretto.table_id,
+        Collaretto.dye_lot,
+        Collaretto.item_type,
+        Collaretto.fabric_type,
+        Collaretto.fabric_code,
+        Collaretto.fabric_color,
+        MattressProductionCenter.production_center,
+        MattressProductionCenter.cutting_room
+    ]
+
+    query = db.session.query(
+        *columns,
+        func.count(Collaretto.id).label('count')
+    ).join(
+        MattressProductionCenter, Collaretto.table_id == MattressProductionCenter.table_id
+    )
+    query = _logistic_filters(query, order_commessa, item_types, destination)
+    rows = query.group_by(*columns).order_by(func.min(Collaretto.id)).all()
+
+    groups = {}
+    for row in rows:
+        if group_by_bagno:
+            key = row.dye_lot or "NO_BAGNO"
+        else:
+            key = row.destination or 'N/A'
+
+        if key not in groups:
+            groups[key] = {
+                "key": key,
+                "destination": row.destination,
+                "bagno": row.dye_lot,
+                "itemType": row.item_type,
+                "fabricType": row.fabric_type,
+                "fabricCode": row.fabric_code,
+                "fabricColor": row.fabric_color,
+                "productionCenter": row.production_center,
+                "cuttingRoom": row.cutting_room,
+                "tableIds": [],
+                "count": 0
+            }
+        groups[key]["count"] += row.count
+        if row.table_id not in groups[key]["tableIds"]:
+            groups[key]["tableIds"].append(row.table_id)
+
+    return list(groups.values())
+
+
+# Payload key: collaretto_details column, for the fields the configuration screen can change
+DETAIL_FIELDS = {
+    'pieces': 'pieces',
+    'usableWidth': 'usable_width',
+    'grossLength': 'gross_length',
+    'rollWidth': 'roll_width',
+    'pcsSeam': 'pcs_seam',
+    'scrapRolls': 'scrap_rolls',
+    'rollsPlanned': 'rolls_planned',
+    'rollsActual': 'rolls_actual',
+    'consPlanned': 'cons_planned',
+    'extra': 'extra',
+    'applicableSizes': 'applicable_sizes'
+}
+
+
+def _rolls_actual(value):
+    if value == '' or value is None:
+        return None
+    return float(value) if isinstance(value, str) else value
+
+
+def _panels_actual(pieces, extra, rolls_actual, pcs_seam):
+    """Weft/bias panels: (pieces * (1 + extra/100)) / (rolls_actual * pcs_seam), rounded up above .15"""
+    panels_calculation = (pieces * (1 + (extra or 0) / 100)) / (rolls_actual * pcs_seam)
+    decimal_part = panels_calculation - int(panels_calculation)
+    return int(panels_calculation) + 1 if decimal_part > 0.15 else int(panels_calculation)
+
+
+def _cons_actual(item_type, values, rewound_width):
+    rolls_actual = values['rolls_actual']
+    if not (rolls_actual and rolls_actual > 0):
+        return None
+
+    if item_type == 'CA':
+        # Along: cons_actual = total_collaretto / rolls_actual
+        total_collaretto = values['total_collaretto']
+        if total_collaretto and total_collaretto > 0:
+            return round(total_collaretto / rolls_actual, 2)
+        return None
+
+    if item_type in ['CW', 'CB']:
+        # Weft/Bias: cons_actual = panels_actual * rewound width (MattressDetail.length_mattress)
+        if values['pieces'] and values['pcs_seam'] and rewound_width:
+            panels_actual = _panels_actual(values['pieces'], values['extra'], rolls_actual, values['pcs_seam'])
+            return round(panels_actual * rewound_width, 2)
+        return None
+
+    return None
+
+
+@transactional
+def update_collaretto_details(rows):
+    """Apply the configuration screen rows to collaretto_details in one transaction.
+
+    Rows are matched by rowId; rows without a collaretto or a detail are skipped.
+    Returns ({row_id: new version}, None), or (None, {row_id: current version}) without
+    writing anything when a row carries the 'version' it was loaded with and the
+    detail was saved by someone else since.
+    """
+    submitted = {row.get('rowId'): row for row in rows if row.get('rowId')}
+
+    found = []
+    for chunk in chunked(list(submitted)):
+        found.extend(db.session.query(Collaretto, CollarettoDetail)
+                     .join(CollarettoDetail, CollarettoDetail.collaretto_id == Collaretto.id)
+                     .filter(Collaretto.row_id.in_(chunk)).all())
+
+    if len(found) < len(submitted):
+        print(f"⚠️ {len(submitted) - len(found)} collaretto rows not found or without detail, skipped")
+    if not found:
+        return {}, None
+
+    stale = {}
+    for collaretto, detail in found:
+        expected_version = submitted[collaretto.row_id].get('version')
+        if expected_version is not None and int(expected_version) != detail.version:
+            stale[collaretto.row_id] = detail.version
+    if stale:
+        return None, stale
+
+    # New values: submitted fields over the stored ones
+    updates = []
+    for collaretto, detail in found:
+        row = submitted[collaretto.row_id]
+        values = {column: row.get(key, getattr(detail, column)) for key, column in DETAIL_FIELDS.items()}
+        values['rolls_actual'] = _rolls_actual(values['rolls_actual'])
+        updates.append((collaretto, detail, row, values))
+
+    # total_collaretto = pieces * gross_length unless the screen sent one
+    import numpy as np  # imported on first save: numpy is not loaded at worker boot
+    pieces = np.array([values['pieces'] or 0 for _, _, _, values in updates], dtype=float)
+    gross_length = np.array([values['gross_length'] or 0 for _, _, _, values in updates], dtype=float)
+    computed_totals = pieces * gross_length
+    for (_, _, row, values), computed in zip(updates, computed_totals):
+        total_from_request = row.get('totalCollaretto')
+        if total_from_request is not None and total_from_request != '':
+            values['total_collaretto'] = total_from_request
+        elif values['pieces'] and values['gross_length']:
+            values['total_collaretto'] = float(computed)
+        else:
+            values['total_collaretto'] = None
+
+    # Rewound widths of the weft/bias mattresses, one lookup for all rows
+    mattress_ids = {detail.mattress_id for collaretto, detail, _, _ in updates
+                    if collaretto.item_type in ('CW', 'CB') and detail.mattress_id}
+    rewound_widths = {}
+    for chunk in chunked(mattress_ids):
+        rewound_widths.update(db.session.query(MattressDetail.mattress_id, MattressDetail.length_mattress)
+                              .filter(MattressDetail.mattress_id.in_(chunk)).all())
+
+    now = datetime.now()
+    params = []
+    for collaretto, detail, _, values in updates:
+        values['cons_actual'] = _cons_actual(collaretto.item_type, values, rewound_widths.get(detail.mattress_id))
+        params.append({'b_id': detail.id, 'updated_at': now, **values})
+
+    table = CollarettoDetail.__table__
+
+    # Claim the next version of every row atomically so a concurrent save cannot slip in between
+    claimed = 0
+    for chunk in chunked([detail for _, detail in found]):
+        claimed += db.session.execute(
+            table.update()
+            .where(table.c.id.in_([detail.id for detail in chunk]))
+            .where(table.c.version == case({detail.id: detail.version for detail in chunk}, value=table.c.id))
+            .values(version=table.c.version + 1)
+        ).rowcount
+    if claimed != len(found):
+        detail_ids = [detail.id for _, detail in found]
+        db.session.rollback()
+        current = {}
+        for chunk in chunked(detail_ids):
+            current.update(db.session.query(Collaretto.row_id, CollarettoDetail.version)
+                           .join(CollarettoDetail, CollarettoDetail.collaretto_id == Collaretto.id)
+                           .filter(CollarettoDetail.id.in_(chunk)).all())
+        return None, current
+
+    db.session.execute(table.update().where(table.c.id == bindparam('b_id')), params)
+
+    # Core updates skip the session flush hooks: bump the consumption caches here
+    fabric_codes = {collaretto.fabric_code for collaretto, _ in found if collaretto.fabric_code}
+    bump_versions(db.session.connection(), [consumption_version_key(code) for code in fabric_codes])
+
+    return {collaretto.row_id: detail.version + 1 for collaretto, detail in found}, None
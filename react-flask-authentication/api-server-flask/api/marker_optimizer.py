@@ -0,0 +1,241 @@
+"""
+Marker-mix optimizer for the marker calculator.
+
+Given the pieces to cut per size and a set of candidate markers, chooses which
+markers to spread and how many layers of each so that every size is covered
+while fabric meters and overcut stay as low as possible.
+
+The search is a vectorized greedy fill followed by a seeded local search
+(remove layers / drop a marker, then refill). It stops at a time budget or an
+iteration cap, whichever comes first, so large orders stay interactive and a
+fixed seed plus iteration cap gives reproducible results.
+"""
+
+import time
+
+import numpy as np
+
+
+def build_problem(demand, markers):
+    """Turn the request data into NumPy arrays.
+
+    demand:  {size: pieces}
+    markers: list of dicts with at least 'marker_name', 'marker_length' and
+             'size_quantities' ({size: pcs_on_layer})
+
+    Returns (sizes, demand_vector, pcs_matrix, lengths, markers, uncovered_sizes).
+    Markers that are unusable (no length, no pieces on a demanded size) are
+    dropped; sizes no marker can cut are reported and left out of the search.
+    """
+    sizes = [size for size, qty in demand.items() if qty and qty > 0]
+
+    usable = []
+    rows = []
+    for marker in sorted(markers, key=lambda m: (m['marker_name'], m.get('id') or 0)):
+        length = marker.get('marker_length') or 0
+        if length <= 0:
+            continue
+        row = [float(marker['size_quantities'].get(size) or 0) for size in sizes]
+        if not any(row):
+            continue
+        usable.append(marker)
+        rows.append(row)
+
+    pcs = np.array(rows, dtype=float).reshape(len(rows), len(sizes))
+    covered = (pcs > 0).any(axis=0) if len(rows) else np.zeros(len(sizes), dtype=bool)
+    uncovered_sizes = [size for size, ok in zip(sizes, covered) if not ok]
+
+    # Solve only for the sizes at least one marker can cut
+    keep = np.flatnonzero(covered)
+    sizes = [sizes[i] for i in keep]
+    pcs = pcs[:, keep]
+    demand_vector = np.array([float(demand[size]) for size in sizes], dtype=float)
+    lengths = np.array([float(m['marker_length']) for m in usable], dtype=float)
+
+    # Markers left without pieces on the kept sizes cannot help
+    has_pieces = pcs.sum(axis=1) > 0
+    usable = [m for m, ok in zip(usable, has_pieces) if ok]
+    return sizes, demand_vector, pcs[has_pieces], lengths[has_pieces], usable, uncovered_sizes
+
+
+def evaluate(layers, pcs, lengths, demand, overcut_penalty):
+    """Return (cost, meters, overcut_pieces) for a layer vector."""
+    produced = layers @ pcs
+    overcut = float(np.maximum(produced - demand, 0).sum())
+    meters = float(layers @ lengths)
+    return meters + overcut_penalty * overcut, meters, overcut
+
+
+def _fill(layers, pcs, lengths, demand, max_markers, overcut_penalty, banned=None):
+    """Add layers until every size is covered.
+
+    First takes the largest block of whole layers that fits the residual
+    without overcut (preferring efficient markers), then finishes the tail one
+    layer at a time by cheapest cost per useful piece.
+    """
+    layers = layers.copy()
+    total_pcs = pcs.sum(axis=1)
+    pcs_per_meter = total_pcs / lengths
+    safe_pcs = np.where(pcs > 0, pcs, 1)
+
+    while True:
+        residual = np.maximum(demand - layers @ pcs, 0)
+        if not residual.any():
+            return layers
+
+        allowed = np.ones(len(lengths), dtype=bool)
+        if banned is not None:
+            allowed[banned] = False
+        used = layers > 0
+        if max_markers and used.sum() >= max_markers:
+            limited = allowed & used
+            # Stay within the marker limit as long as the used markers can still cut every missing size
+            if ((pcs[limited] > 0).any(axis=0) | (residual == 0)).all():
+                allowed = limited
+
+        fit = np.where(pcs > 0, np.floor(residual / safe_pcs), np.inf).min(axis=1)
+        fit = np.where(allowed, fit, 0)
+        if fit.max() >= 1:
+            gain = fit * total_pcs * pcs_per_meter
+            best = int(np.argmax(gain))
+            layers[best] += int(fit[best])
+            continue
+
+        useful = np.minimum(pcs, residual).sum(axis=1)
+        waste = total_pcs - useful
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cost = (lengths + overcut_penalty * waste) / useful
+        cost[~allowed | (useful == 0)] = np.inf
+        if not np.isfinite(cost).any():
+            if banned is None:
+                return layers
+            banned = None
+            continue
+        best = int(np.argmin(cost))
+        # The chosen marker stays cheapest until one of its missing sizes is filled, so add those layers at once
+        open_sizes = (pcs[best] > 0) & (residual > 0)
+        layers[best] += max(1, int(np.floor(residual[open_sizes] / pcs[best][open_sizes]).min()))
+
+
+def _trim(layers, pcs, demand):
+    """Remove single layers that are not needed to cover the demand."""
+    layers = layers.copy()
+    while True:
+        produced = layers @ pcs
+        used = np.flatnonzero(layers)
+        if not used.size:
+            return layers
+        removable = used[((produced[None, :] - pcs[used]) >= demand[None, :]).all(axis=1)]
+        if not removable.size:
+            return layers
+        # Drop the layer that removes the most overcut first
+        layers[removable[int(np.argmax(pcs[removable].sum(axis=1)))]] -= 1
+
+
+def optimize_marker_mix(demand, markers, time_budget=1.5, max_iterations=None,
+                        max_layers=None, max_markers=None, extra=0.0,
+                        overcut_weight=1.0, seed=0):
+    """Search a marker mix and layer counts for the given demand.
+
+    demand:         {size: pieces to cut}
+    markers:        candidate markers (see build_problem)
+    time_budget:    seconds allowed for the local search
+    max_iterations: optional hard cap on local search moves (for reproducible runs)
+    max_layers:     split a marker into several rows when it exceeds this many layers
+    max_markers:    soft cap on distinct markers in the plan
+    extra:          spreading extra added to every layer, as in cons_planned
+    overcut_weight: cost of one overcut piece, in average marker meters per piece
+    seed:           seed for the local search moves
+    """
+    started = time.perf_counter()
+    sizes, demand_vector, pcs, lengths, usable, uncovered_sizes = build_problem(demand, markers)
+
+    result = {
+        "sizes": sizes,
+        "demand": {size: float(qty) for size, qty in zip(sizes, demand_vector)},
+        "uncovered_sizes": uncovered_sizes,
+        "plan": [],
+        "produced": {},
+        "overcut": {},
+        "total_meters": 0.0,
+        "total_layers": 0,
+        "total_overcut": 0.0,
+        "stats": {"candidates": len(usable), "iterations": 0, "improvements": 0,
+                  "greedy_meters": 0.0, "elapsed_ms": 0.0}
+    }
+    if not usable or not demand_vector.any():
+        result["stats"]["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+    spread_lengths = lengths + (extra or 0)
+    overcut_penalty = overcut_weight * float(np.median(spread_lengths / pcs.sum(axis=1)))
+
+    best = _trim(_fill(np.zeros(len(usable), dtype=np.int64), pcs, spread_lengths, demand_vector,
+                       max_markers, overcut_penalty), pcs, demand_vector)
+    best_cost, greedy_meters, _ = evaluate(best, pcs, spread_lengths, demand_vector, overcut_penalty)
+    result["stats"]["greedy_meters"] = round(greedy_meters, 3)
+
+    rng = np.random.default_rng(seed)
+    deadline = started + (time_budget or 0)
+    iterations = 0
+    improvements = 0
+    while time.perf_counter() < deadline and (max_iterations is None or iterations < max_iterations):
+        iterations += 1
+        used = np.flatnonzero(best)
+        target = int(rng.choice(used))
+        candidate = best.copy()
+        banned = None
+        if used.size > 1 and rng.random() < 0.3:
+            candidate[target] = 0
+            banned = target
+        else:
+            candidate[target] -= int(rng.integers(1, candidate[target] + 1))
+            # Occasionally shave a second marker to escape local optima
+            if used.size > 1 and rng.random() < 0.5:
+                other = int(rng.choice(used))
+                if candidate[other] > 0:
+                    candidate[other] -= 1
+
+        candidate = _trim(_fill(candidate, pcs, spread_lengths, demand_vector, max_markers,
+                                overcut_penalty, banned), pcs, demand_vector)
+        cost, _, _ = evaluate(candidate, pcs, spread_lengths, demand_vector, overcut_penalty)
+        fewer_markers = np.count_nonzero(candidate) < np.count_nonzero(best)
+        if cost < best_cost - 1e-9 or (abs(cost - best_cost) <= 1e-9 and fewer_markers):
+            best, best_cost = candidate, cost
+            improvements += 1
+
+    _, meters, overcut = evaluate(best, pcs, spread_lengths, demand_vector, overcut_penalty)
+    produced = best @ pcs
+
+    plan = []
+    for index in np.flatnonzero(best):
+        marker = usable[index]
+        remaining = int(best[index])
+        row_size = max_layers if max_layers and max_layers > 0 else remaining
+        while remaining > 0:
+            row_layers = min(row_size, remaining)
+            plan.append({
+                "marker_id": marker.get('id'),
+                "marker_name": marker['marker_name'],
+                "marker_width": marker.get('marker_width'),
+                "marker_length": marker['marker_length'],
+                "efficiency": marker.get('efficiency'),
+                "layers": row_layers,
+                "quantities": {size: marker['size_quantities'].get(size, 0) for size in sizes}
+            })
+            remaining -= row_layers
+
+    result.update({
+        "plan": plan,
+        "produced": {size: float(qty) for size, qty in zip(sizes, produced)},
+        "overcut": {size: float(qty) for size, qty in zip(sizes, np.maximum(produced - demand_vector, 0))},
+        "total_meters": round(meters, 3),
+        "total_layers": int(best.sum()),
+        "total_overcut": overcut
+    })
+    result["stats"].update({
+        "iterations": iterations,
+        "improvements": improvements,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    })
+    return result
@@ -127,6 +127,12 @@ class MarkerHeader(db.Model):
     created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
     updated_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
 
+    # Lookup indexes (see migrations/add_marker_lookup_indexes.py)
+    # marker_name is not unique: replaced markers are kept as NOT ACTIVE under the same name
+    __table_args__ = (
+        db.Index('ix_marker_headers_marker_name', 'marker_name'),
+        db.Index('ix_marker_headers_status_model_variant', 'status', 'model', 'variant'),
+    )
 
     # Relationship to marker_lines
     relation_lines = db.relationship('MarkerLine', backref='header', cascade="all, delete-orphan", lazy=True)
@@ -143,6 +149,11 @@ class MarkerLine(db.Model):
     created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
     updated_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
 
+    # Covering index for size lookups by marker
+    __table_args__ = (
+        db.Index('ix_marker_lines_marker_header_id', 'marker_header_id', mssql_include=['style', 'size', 'pcs_on_layer']),
+    )
+
 class MarkerLineRotation(db.Model):
     __tablename__ = 'marker_lines_rotation'
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -175,6 +186,81 @@ class OrderLinesView(db.Model):
     def to_dict(self):
         return {c.key: getattr(self, c.key) for c in inspect(self).mapper.column_attrs}
 
+class OrderLineReplica(db.Model):
+    __tablename__ = 'order_lines_replica'  # Local copy of nav_order_lines, filled by api/order_lines_sync.py
+
+    # Same key as the NAV view
+    order_commessa = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), primary_key=True, nullable=False)
+    size = db.Column(db.String(10, collation='SQL_Latin1_General_CP1_CI_AS'), primary_key=True, nullable=False)
+
+    season = db.Column(db.String(10, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=False)
+    prod_order_no = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=False)
+    style = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=False)
+    color_code = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=False)
+    quantity = db.Column(db.Float, nullable=False)
+    status = db.Column(db.Integer, nullable=False)
+    synced_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.Index('ix_order_lines_replica_style', 'style'),
+        db.Index('ix_order_lines_replica_season', 'season'),
+        db.Index('ix_order_lines_replica_status', 'status'),
+    )
+
+    # Same shape as OrderLinesView.to_dict so the API response does not change
+    def to_dict(self):
+        return {
+            'order_commessa': self.order_commessa,
+            'size': self.size,
+            'season': self.season,
+            'prod_order_no': self.prod_order_no,
+            'style': self.style,
+            'color_code': self.color_code,
+            'quantity': self.quantity,
+            'status': self.status
+        }
+
+class SyncState(db.Model):
+    __tablename__ = 'sync_state'  # Watermarks of the periodic NAV sync jobs
+
+    name = db.Column(db.String(100, collation='SQL_Latin1_General_CP1_CI_AS'), primary_key=True)
+    watermark = db.Column(db.String(100, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=True)
+    last_incremental_sync = db.Column(db.DateTime, nullable=True)
+    last_full_sync = db.Column(db.DateTime, nullable=True)
+    last_row_count = db.Column(db.Integer, nullable=True)
+    last_duration_ms = db.Column(db.Float, nullable=True)
+    last_error = db.Column(db.String(1000, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=True)
+    updated_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'watermark': self.watermark,
+            'last_incremental_sync': self.last_incremental_sync.isoformat() if self.last_incremental_sync else None,
+            'last_full_sync': self.last_full_sync.isoformat() if self.last_full_sync else None,
+            'last_row_count': self.last_row_count,
+            'last_duration_ms': self.last_duration_ms,
+            'last_error': self.last_error
+        }
+
+class OrderRatioBacklog(db.Model):
+    __tablename__ = 'order_ratio_backlog'  # Orders still waiting for Italian ratios, maintained by api/ratio_backlog.py
+
+    order_commessa = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), primary_key=True, nullable=False)
+    style = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=False)
+    added_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.Index('ix_order_ratio_backlog_style', 'style'),
+    )
+
+class CacheVersion(db.Model):
+    __tablename__ = 'cache_versions'  # Shared invalidation counters for the per-worker caches in api/cache.py
+
+    key = db.Column(db.String(255, collation='SQL_Latin1_General_CP1_CI_AS'), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
+
 class ProdOrderComponentView(db.Model):
     __tablename__ = 'nav_col_components'  # SQL View
     __table_args__ = {'info': {'read_only': True}}  # Read-only view
@@ -421,6 +507,7 @@ class MarkerCalculatorData(db.Model):
     combination_id = db.Column(db.String(36), nullable=False)  # Links to OrderProductionCenter.combination_id
     tab_number = db.Column(db.String(10), nullable=False)  # Tab identifier (e.g., '01', '02', '03')
     selected_baseline = db.Column(db.String(50), nullable=False, default='original')  # 'original', table_id, or 'calc_tab_XX'
+    version = db.Column(db.Integer, nullable=False, default=1)  # Bumped on every save, used to reject stale saves
     created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
     updated_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
 
@@ -436,6 +523,7 @@ class MarkerCalculatorData(db.Model):
             "combination_id": self.combination_id,
             "tab_number": self.tab_number,
             "selected_baseline": self.selected_baseline,
+            "version": self.version,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "updated_at": self.updated_at.isoformat() if self.updated_at else None,
         }
@@ -513,7 +601,7 @@ class MarkerCalculatorMarker(db.Model):
     updated_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
 
     # Relationship
-    calculator_data = db.relationship('MarkerCalculatorData', backref=db.backref('markers', cascade='all, delete-orphan'))
+    calculator_data = db.relationship('MarkerCalculatorData', backref=db.backref('markers', cascade='all, delete-orphan', order_by='MarkerCalculatorMarker.id'))
 
     def to_dict(self):
         return {
@@ -621,6 +709,7 @@ class CollarettoDetail(db.Model):
     total_collaretto = db.Column(db.Float, nullable=True)
 
     applicable_sizes = db.Column(db.String(100, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=True)
+    version = db.Column(db.Integer, nullable=False, default=1)  # Bumped on every save from the logistic screen, used to reject stale saves
 
     created_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
     updated_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
@@ -858,6 +947,11 @@ class WidthChangeRequest(db.Model):
     updated_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp(), onupdate=db.func.current_timestamp())
     approved_at = db.Column(db.DateTime, nullable=True)
 
+    # Pending lookups by mattress (see migrations/add_width_change_request_indexes.py)
+    __table_args__ = (
+        db.Index('ix_width_change_requests_status_mattress', 'status', 'mattress_id'),
+    )
+
     # Relationships
     mattress = db.relationship('Mattresses', backref=db.backref('width_change_requests', cascade='all, delete-orphan'))
     selected_marker = db.relationship('MarkerHeader', backref=db.backref('width_change_requests', lazy=True))
@@ -972,6 +1066,95 @@ class NavBom(db.Model):
     def __repr__(self):
         return f"<NavBom {self.shortcut_dimension_2_code}, Item {self.item_no}>"
 
+class OrderBomSignature(db.Model):
+    __tablename__ = 'order_bom_signatures'  # Fabric BOM signature per order, filled by api/bom_signatures.py
+
+    order_commessa = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), primary_key=True, nullable=False)
+    style = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=False)
+    signature = db.Column(db.String(64, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=False)  # SHA-256 of the normalized items
+    items = db.Column(db.String(4000, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=False)  # "ITEM=qty;ITEM=qty", for nearest matches
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    computed_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.Index('ix_order_bom_signatures_style_signature', 'style', 'signature'),
+    )
+
+    def __repr__(self):
+        return f"<OrderBomSignature {self.order_commessa}, {self.signature[:8]}>"
+
+class OrderBomSnapshot(db.Model):
+    __tablename__ = 'order_bom_snapshots'  # Local copy of the nav_bom rows per order, maintained by api/bom_cache.py
+
+    order_commessa = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), primary_key=True, nullable=False)
+    lines = db.Column(db.Text(collation='SQL_Latin1_General_CP1_CI_AS'), nullable=False)  # JSON list of NavBom.to_dict() rows
+    line_count = db.Column(db.Integer, nullable=False, default=0)
+    fetched_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.Index('ix_order_bom_snapshots_fetched_at', 'fetched_at'),
+    )
+
+    def __repr__(self):
+        return f"<OrderBomSnapshot {self.order_commessa}, {self.line_count} lines>"
+
+class HandlingUnitReplica(db.Model):
+    __tablename__ = 'handling_units_replica'  # Local copy of View_PickedHandlingUnits, synced by api/width_validation.py
+
+    entry_no = db.Column(db.BigInteger, primary_key=True, autoincrement=False)  # [Entry No_]
+    item_no = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=True)
+    description = db.Column(db.String(255, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=True)
+    bin_code = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=True)
+    quantity = db.Column(db.Float, nullable=True)
+    unit_of_measure_code = db.Column(db.String(20, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=True)
+    width = db.Column(db.Float, nullable=True)
+    length = db.Column(db.Float, nullable=True)
+    status = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=True)
+    order_commessa = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=True)
+    hu_no = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=True)
+    batch_dye_lot = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=True)
+    synced_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.Index('ix_handling_units_replica_order_commessa', 'order_commessa'),
+    )
+
+    def to_dict(self):
+        return {
+            'entry_no': self.entry_no,
+            'item_no': self.item_no,
+            'description': self.description,
+            'bin_code': self.bin_code,
+            'quantity': self.quantity or 0.0,
+            'unit_of_measure_code': self.unit_of_measure_code,
+            'width': self.width or 0.0,
+            'length': self.length or 0.0,
+            'status': self.status,
+            'order_commessa': self.order_commessa,
+            'hu_no': self.hu_no,
+            'batch_dye_lot': self.batch_dye_lot
+        }
+
+class WidthValidationResult(db.Model):
+    __tablename__ = 'width_validation_results'  # Orders whose measured widths differ from the plan, see api/width_validation.py
+
+    order_commessa = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), primary_key=True, nullable=False)
+    status = db.Column(db.String(20, collation='SQL_Latin1_General_CP1_CI_AS'), nullable=False)
+    priority = db.Column(db.Integer, nullable=False)
+    result = db.Column(db.Text(collation='SQL_Latin1_General_CP1_CI_AS'), nullable=False)  # JSON of the validation result
+    computed_at = db.Column(db.DateTime, nullable=False, default=db.func.current_timestamp())
+
+    __table_args__ = (
+        db.Index('ix_width_validation_results_priority', 'priority', 'order_commessa'),
+    )
+
+
+class WidthValidationInput(db.Model):
+    __tablename__ = 'width_validation_inputs'  # Planned marker rows of each order at its last width validation
+
+    order_commessa = db.Column(db.String(50, collation='SQL_Latin1_General_CP1_CI_AS'), primary_key=True, nullable=False)
+    planned_rows = db.Column(db.Integer, nullable=False)
+
 
 class WipMasterReport(db.Model):
     __tablename__ = 'wip_master_report'
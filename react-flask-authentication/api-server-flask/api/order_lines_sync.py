@@ -0,0 +1,197 @@
+"""
+Sync of the nav_order_lines NAV view into the local order_lines_replica table.
+
+The orders screens read order lines from the replica, so they no longer wait on
+the cross-database NAV view. The replica is refreshed by sync_order_lines.py:
+
+- incremental (every few minutes): the view has no change column, so the
+  watermark is the highest order_commessa synced so far. An incremental run
+  re-reads the orders above the watermark (new orders) and the orders that are
+  still open in NAV or in the replica (status up to Released), which are the
+  only ones whose lines still change.
+- full (nightly): re-reads the whole view and also removes replica rows that
+  are no longer in NAV.
+
+Rows are compared in Python and written with executemany inserts, updates and
+deletes, so an incremental run that finds no changes writes nothing.
+"""
+
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam, or_
+
+from api.models import db, OrderLinesView, OrderLineReplica, SyncState
+
+ORDER_LINES_SYNC = 'order_lines'
+
+# Orders before this prefix are never shown and are not replicated
+REPLICA_MIN_PREFIX = '24'
+
+# NAV production order status: 0 Simulated, 1 Planned, 2 Firm Planned, 3 Released, 4 Finished
+OPEN_STATUS_MAX = 3
+
+# SQL Server allows ~2100 parameters per statement
+KEY_CHUNK_SIZE = 1000
+
+SYNC_FIELDS = ['season', 'prod_order_no', 'style', 'color_code', 'quantity', 'status']
+
+
+def order_prefix_filter(model, min_prefix=REPLICA_MIN_PREFIX):
+    """Orders starting with digits 2-9, from min_prefix onwards"""
+    return or_(
+        model.order_commessa.like('2%') & (model.order_commessa >= min_prefix),
+        *[model.order_commessa.like(f'{digit}%') for digit in '3456789']
+    )
+
+
+def get_sync_state(name=ORDER_LINES_SYNC):
+    state = db.session.get(SyncState, name)
+    if state is None:
+        state = SyncState(name=name)
+        db.session.add(state)
+    return state
+
+
+def chunked(items, size=KEY_CHUNK_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _read_rows(model, *conditions):
+    """Return {(order_commessa, size): (season, prod_order_no, ...)} for the matching rows"""
+    columns = [model.order_commessa, model.size] + [getattr(model, field) for field in SYNC_FIELDS]
+    rows = db.session.query(*columns).filter(*conditions).all()
+    return {(row[0], row[1]): tuple(row[2:]) for row in rows}
+
+
+def _read_orders(model, orders):
+    """Read every line of the given orders in chunks"""
+    rows = {}
+    for chunk in chunked(orders):
+        rows.update(_read_rows(model, model.order_commessa.in_(chunk)))
+    return rows
+
+
+def _apply(nav_rows, replica_rows, synced_at):
+    """Write the difference between NAV and the replica, return (inserts, updated, deleted)"""
+    table = OrderLineReplica.__table__
+
+    inserts = []
+    updates = []
+    for key, values in nav_rows.items():
+        current = replica_rows.get(key)
+        if current == values:
+            continue
+        row = dict(zip(SYNC_FIELDS, values))
+        if current is None:
+            row.update(order_commessa=key[0], size=key[1], synced_at=synced_at)
+            inserts.append(row)
+        else:
+            row = {f'b_{field}': value for field, value in row.items()}
+            row.update(b_order_commessa=key[0], b_size=key[1], b_synced_at=synced_at)
+            updates.append(row)
+
+    deletes = [{'b_order_commessa': key[0], 'b_size': key[1]}
+               for key in replica_rows.keys() - nav_rows.keys()]
+
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+    if updates:
+        db.session.execute(
+            table.update()
+            .where(table.c.order_commessa == bindparam('b_order_commessa'))
+            .where(table.c.size == bindparam('b_size'))
+            .values({table.c[field]: bindparam(f'b_{field}') for field in SYNC_FIELDS + ['synced_at']}),
+            updates
+        )
+    if deletes:
+        db.session.execute(
+            table.delete()
+            .where(table.c.order_commessa == bindparam('b_order_commessa'))
+            .where(table.c.size == bindparam('b_size')),
+            deletes
+        )
+    return inserts, len(updates), len(deletes)
+
+
+def sync_order_lines(full=False):
+    """Refresh order_lines_replica from nav_order_lines.
+
+    Must run inside an app context. Commits on success, records the error on
+    the sync state and re-raises on failure. Returns a summary dict.
+    """
+    started = time.perf_counter()
+    synced_at = datetime.now()
+    state = get_sync_state()
+    # A replica that was never fully loaded has nothing to be incremental on
+    full = full or state.last_full_sync is None
+
+    try:
+        if full:
+            nav_rows = _read_rows(OrderLinesView, order_prefix_filter(OrderLinesView))
+            replica_rows = _read_rows(OrderLineReplica)
+        else:
+            nav_rows = _read_rows(
+                OrderLinesView,
+                order_prefix_filter(OrderLinesView),
+                or_(OrderLinesView.status <= OPEN_STATUS_MAX,
+                    OrderLinesView.order_commessa > (state.watermark or REPLICA_MIN_PREFIX))
+            )
+
+            # Orders open in the replica that NAV no longer reports as open were closed or removed
+            open_in_replica = {row[0] for row in db.session.query(OrderLineReplica.order_commessa)
+                               .filter(OrderLineReplica.status <= OPEN_STATUS_MAX).distinct()}
+            closed = open_in_replica - {key[0] for key in nav_rows}
+            nav_rows.update(_read_orders(OrderLinesView, closed))
+
+            # Compare (and delete sizes) only within the orders that were re-read
+            replica_rows = _read_orders(OrderLineReplica, {key[0] for key in nav_rows} | closed)
+
+        inserts, updated, deleted = _apply(nav_rows, replica_rows, synced_at)
+
+        # New orders start without ratios
+        from api.ratio_backlog import add_to_backlog
+        backlog_added = add_to_backlog({row['order_commessa']: row['style'] for row in inserts})
+
+        if nav_rows:
+            highest = max(key[0] for key in nav_rows)
+            if not state.watermark or highest > state.watermark:
+                state.watermark = highest
+
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        if full:
+            state.last_full_sync = synced_at
+        state.last_incremental_sync = synced_at
+        state.last_row_count = len(nav_rows)
+        state.last_duration_ms = duration_ms
+        state.last_error = None
+        db.session.commit()
+
+        return {
+            "mode": "full" if full else "incremental",
+            "read": len(nav_rows),
+            "inserted": len(inserts),
+            "updated": updated,
+            "deleted": deleted,
+            "backlog_added": backlog_added,
+            "watermark": state.watermark,
+            "duration_ms": duration_ms
+        }
+
+    except Exception as e:
+        db.session.rollback()
+        try:
+            state = get_sync_state()
+            state.last_error = str(e)[:1000]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+        raise
+
+
+def replica_ready():
+    """True once the replica has been fully loaded at least once"""
+    state = db.session.get(SyncState, ORDER_LINES_SYNC)
+    return state is not None and state.last_full_sync is not None
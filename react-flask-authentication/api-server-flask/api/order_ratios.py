@@ -0,0 +1,130 @@
+"""
+Bulk writer for order_ratios.
+
+Saving ratios used to merge one (order, size) row at a time, each a SELECT
+plus an INSERT or UPDATE. upsert_order_ratios() applies a whole payload (any
+number of orders) with one set-based statement per chunk: MERGE on SQL Server,
+INSERT ... ON CONFLICT on SQLite.
+"""
+
+from sqlalchemy import bindparam, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from api.models import db, OrderRatio
+
+# 3 parameters per row, SQL Server allows ~2100 per statement
+MERGE_CHUNK_SIZE = 600
+
+
+def normalize_ratio_rows(rows):
+    """Validate the payload and keep the last value per (order, size). Raises ValueError."""
+    ratios = {}
+    for index, row in enumerate(rows):
+        try:
+            order_commessa = str(row["order_commessa"]).strip()
+            size = str(row["size"]).strip()
+            theoretical_ratio = float(row["theoretical_ratio"])
+        except (KeyError, TypeError, ValueError):
+            raise ValueError(f"Row {index}: order_commessa, size and a numeric theoretical_ratio are required")
+        if not order_commessa or not size:
+            raise ValueError(f"Row {index}: order_commessa and size cannot be empty")
+        # MERGE rejects a source with the same key twice
+        ratios[(order_commessa, size)] = theoretical_ratio
+    return ratios
+
+
+def _chunks(ratios):
+    items = list(ratios.items())
+    for start in range(0, len(items), MERGE_CHUNK_SIZE):
+        yield items[start:start + MERGE_CHUNK_SIZE]
+
+
+def _merge_mssql(ratios, counts):
+    for chunk in _chunks(ratios):
+        values = ", ".join(f"(:o{i}, :s{i}, :r{i})" for i in range(len(chunk)))
+        params = {}
+        for i, ((order_commessa, size), ratio) in enumerate(chunk):
+            params.update({f"o{i}": order_commessa, f"s{i}": size, f"r{i}": ratio})
+
+        result = db.session.execute(text(f"""
+            MERGE order_ratios WITH (HOLDLOCK) AS target
+            USING (VALUES {values}) AS source (order_commessa, size, theoretical_ratio)
+            ON target.order_commessa = source.order_commessa AND target.size = source.size
+            WHEN MATCHED THEN
+                UPDATE SET theoretical_ratio = source.theoretical_ratio, updated_at = GETDATE()
+            WHEN NOT MATCHED THEN
+                INSERT (order_commessa, size, theoretical_ratio, created_at, updated_at)
+                VALUES (source.order_commessa, source.size, source.theoretical_ratio, GETDATE(), GETDATE())
+            OUTPUT $action, source.order_commessa;
+        """), params)
+
+        for action, order_commessa in result.fetchall():
+            counts[order_commessa]["inserted" if action == "INSERT" else "updated"] += 1
+
+
+def _existing_keys(ratios):
+    orders = sorted({order_commessa for order_commessa, _ in ratios})
+    existing = set()
+    for start in range(0, len(orders), MERGE_CHUNK_SIZE):
+        existing.update(db.session.query(OrderRatio.order_commessa, OrderRatio.size)
+                        .filter(OrderRatio.order_commessa.in_(orders[start:start + MERGE_CHUNK_SIZE])).all())
+    return existing
+
+
+def _upsert_sqlite(ratios, counts):
+    existing = _existing_keys(ratios)
+    table = OrderRatio.__table__
+    statement = sqlite_insert(table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[table.c.order_commessa, table.c.size],
+        set_={"theoretical_ratio": statement.excluded.theoretical_ratio, "updated_at": db.func.current_timestamp()}
+    )
+    db.session.execute(statement, [
+        {"order_commessa": order_commessa, "size": size, "theoretical_ratio": ratio}
+        for (order_commessa, size), ratio in ratios.items()
+    ])
+    for key in ratios:
+        counts[key[0]]["updated" if key in existing else "inserted"] += 1
+
+
+def _upsert_generic(ratios, counts):
+    existing = _existing_keys(ratios)
+    table = OrderRatio.__table__
+    inserts = []
+    updates = []
+    for (order_commessa, size), ratio in ratios.items():
+        if (order_commessa, size) in existing:
+            updates.append({"b_order_commessa": order_commessa, "b_size": size, "b_ratio": ratio})
+            counts[order_commessa]["updated"] += 1
+        else:
+            inserts.append({"order_commessa": order_commessa, "size": size, "theoretical_ratio": ratio})
+            counts[order_commessa]["inserted"] += 1
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+    if updates:
+        db.session.execute(
+            table.update()
+            .where(table.c.order_commessa == bindparam("b_order_commessa"))
+            .where(table.c.size == bindparam("b_size"))
+            .values(theoretical_ratio=bindparam("b_ratio"), updated_at=db.func.current_timestamp()),
+            updates
+        )
+
+
+def upsert_order_ratios(ratios):
+    """Insert or update {(order_commessa, size): ratio} (caller commits).
+
+    Returns {order_commessa: {"inserted": n, "updated": m}}.
+    """
+    counts = {order_commessa: {"inserted": 0, "updated": 0} for order_commessa, _ in ratios}
+    if not ratios:
+        return counts
+
+    dialect = db.engine.dialect.name
+    if dialect == "mssql":
+        _merge_mssql(ratios, counts)
+    elif dialect == "sqlite":
+        _upsert_sqlite(ratios, counts)
+    else:
+        _upsert_generic(ratios, counts)
+    return counts
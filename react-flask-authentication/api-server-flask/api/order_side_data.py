@@ -0,0 +1,125 @@
+"""
+Order side data in one read.
+
+The order panel used to call comments/get_combined, style_settings/get,
+production_center/get, production_center_combinations/get and audit/<order>
+separately. load_order_side_data() resolves the style of every requested
+order once and reads each dataset with one query for all orders (per chunk of
+1000), so a list view can prefetch many orders in the same round trip.
+"""
+
+from collections import defaultdict
+
+from api.models import (db, OrderLinesView, OrderLineReplica, OrderComments, StyleComments, StyleSettings,
+                        ProductionCenter, OrderProductionCenter, OrderAudit)
+from api.order_lines_sync import chunked, replica_ready
+
+
+def _by_order(rows, orders_by_key):
+    """Group rows by the requested spelling of their order_commessa"""
+    grouped = defaultdict(list)
+    for row in rows:
+        order = orders_by_key.get((row.order_commessa or '').upper())
+        if order is not None:
+            grouped[order].append(row)
+    return grouped
+
+
+def _query_chunks(query, column, keys):
+    rows = []
+    for chunk in chunked(keys):
+        rows.extend(query.filter(column.in_(chunk)).all())
+    return rows
+
+
+def _order_styles(orders):
+    """(order_commessa, style) rows: from the replica, and from NAV for the orders it does not hold"""
+    def read_styles(model, keys):
+        query = db.session.query(model.order_commessa, model.style).filter(model.style.isnot(None)).distinct()
+        return _query_chunks(query, model.order_commessa, keys)
+
+    rows = read_styles(OrderLineReplica, orders) if replica_ready() else []
+    # Orders outside order_prefix_filter, or created since the last sync
+    replicated = {(row.order_commessa or '').upper() for row in rows}
+    not_replicated = [order for order in orders if order.upper() not in replicated]
+    if not_replicated:
+        rows.extend(read_styles(OrderLinesView, not_replicated))
+    return rows
+
+
+def order_styles(orders):
+    """{order_commessa: style} of the given orders (one query per 1000 orders)"""
+    orders_by_key = {order.upper(): order for order in orders if order}
+    return {order: rows[0].style
+            for order, rows in _by_order(_order_styles(list(orders_by_key.values())), orders_by_key).items()}
+
+
+def load_order_side_data(orders):
+    """Return {order_commessa: side data} for the given orders (7 or 8 queries per 1000 orders)"""
+    orders = list(dict.fromkeys(order.strip() for order in orders if order and order.strip()))
+    orders_by_key = {order.upper(): order for order in orders}
+
+    styles = {order: rows[0].style for order, rows in _by_order(_order_styles(orders), orders_by_key).items()}
+    style_keys = sorted({style for style in styles.values()})
+
+    comments = _by_order(_query_chunks(OrderComments.query, OrderComments.order_commessa, orders), orders_by_key)
+    combinations = _by_order(_query_chunks(
+        OrderProductionCenter.query.filter_by(is_active=True).order_by(OrderProductionCenter.created_at),
+        OrderProductionCenter.order_commessa, orders
+    ), orders_by_key)
+    production_centers = _by_order(_query_chunks(ProductionCenter.query, ProductionCenter.order_commessa, orders),
+                                   orders_by_key)
+    audits = _by_order(_query_chunks(OrderAudit.query, OrderAudit.order_commessa, orders), orders_by_key)
+    style_comments = {row.style.upper(): row for row in
+                      _query_chunks(StyleComments.query, StyleComments.style, style_keys)}
+    style_settings = {row.style.upper(): row for row in
+                      _query_chunks(StyleSettings.query, StyleSettings.style, style_keys)}
+
+    result = {}
+    for order in orders:
+        style = styles.get(order)
+        style_key = style.upper() if style else None
+        order_combinations = combinations.get(order, [])
+        combination_info = {combo.combination_id: combo for combo in order_combinations}
+
+        order_comments = []
+        for comment in comments.get(order, []):
+            comment_data = comment.to_dict()
+            combo = combination_info.get(comment.combination_id)
+            if combo:
+                comment_data['production_center_info'] = {
+                    'production_center': combo.production_center,
+                    'cutting_room': combo.cutting_room,
+                    'destination': combo.destination
+                }
+            order_comments.append(comment_data)
+
+        # The order-level comment is the one without a combination (as in comments/get)
+        order_comment = next((c for c in order_comments if c['combination_id'] is None),
+                             order_comments[0] if order_comments else None)
+        production_center = production_centers.get(order, [None])[0]
+        audit = audits.get(order, [None])[0]
+        style_comment = style_comments.get(style_key)
+        settings = style_settings.get(style_key)
+
+        result[order] = {
+            "order_commessa": order,
+            "style": style,
+            "order_comment": order_comment,
+            "comments": order_comments,
+            "style_comment": style_comment.to_dict() if style_comment else None,
+            "style_settings": settings.to_dict() if settings else None,
+            "production_center": {
+                "production_center": production_center.production_center,
+                "cutting_room": production_center.cutting_room,
+                "destination": production_center.destination
+            } if production_center else None,
+            "production_center_combinations": [{
+                "combination_id": combo.combination_id,
+                "production_center": combo.production_center,
+                "cutting_room": combo.cutting_room,
+                "destination": combo.destination
+            } for combo in order_combinations],
+            "audit": audit.to_dict() if audit else None
+        }
+    return result
@@ -0,0 +1,117 @@
+"""
+Sizes of an order, for validating the applicable sizes of collaretto rows.
+
+The planning screen saves collaretto rows one at a time, and every save used
+to run SELECT DISTINCT size on the NAV view. The size set of each order is now
+memoized per worker for ORDER_SIZES_TTL seconds, which covers a save burst on
+one order. The sets are read from the order lines replica, or from the NAV view
+for orders that are not replicated (yet). validate_sizes_batch() checks many rows
+with at most one lookup per source.
+"""
+
+from api.cache import Memo
+from api.models import db, OrderLinesView, OrderLineReplica
+from api.order_lines_sync import replica_ready, chunked
+
+ORDER_SIZES_TTL = 120
+
+order_sizes_memo = Memo(ttl=ORDER_SIZES_TTL, max_entries=2000)
+
+
+def _read_sizes(model, orders):
+    sizes = {order: set() for order in orders}
+    for chunk in chunked(orders):
+        rows = db.session.query(model.order_commessa, model.size)\
+            .filter(model.order_commessa.in_(chunk))\
+            .distinct().all()
+        for order_commessa, size in rows:
+            if size:
+                sizes.setdefault(order_commessa, set()).add(size)
+    return sizes
+
+
+def load_order_sizes(orders):
+    """{order_commessa: set of sizes}, memoized per order"""
+    result = {}
+    missing = []
+    for order in set(orders):
+        found, sizes = order_sizes_memo.get(order, 0)
+        if found:
+            result[order] = sizes
+        else:
+            missing.append(order)
+
+    if missing:
+        loaded = _read_sizes(OrderLineReplica, missing) if replica_ready() else {}
+        not_replicated = [order for order in missing if not loaded.get(order)]
+        if not_replicated:
+            loaded.update(_read_sizes(OrderLinesView, not_replicated))
+
+        for order in missing:
+            sizes = frozenset(loaded.get(order, ()))
+            if sizes:
+                # Orders without lines are looked up again: NAV may add them any moment
+                order_sizes_memo.set(order, 0, sizes)
+            result[order] = sizes
+
+    return result
+
+
+def check_applicable_sizes(applicable_sizes, order_commessa, valid_sizes):
+    """(is_valid, error_message) of a dash-separated size list against the sizes of the order"""
+    if not applicable_sizes or applicable_sizes.strip() == '':
+        return True, None  # Empty means ALL, which is always valid
+
+    if not valid_sizes:
+        return False, f"No sizes found for order {order_commessa}"
+
+    # Parse the applicable_sizes string
+    requested_sizes = set(size.strip() for size in applicable_sizes.split('-') if size.strip())
+
+    # Check if all requested sizes are valid
+    invalid_sizes = requested_sizes - valid_sizes
+    if invalid_sizes:
+        return False, f"Invalid sizes for order {order_commessa}: {', '.join(invalid_sizes)}. Valid sizes: {', '.join(sorted(valid_sizes))}"
+
+    return True, None
+
+
+def validate_applicable_sizes(applicable_sizes, order_commessa):
+    """
+    Validate that the applicable_sizes string contains only valid sizes for the given order.
+
+    Args:
+        applicable_sizes (str): Dash-separated sizes like "S-M-L" or None/empty for ALL
+        order_commessa (str): Order number to validate against
+
+    Returns:
+        tuple: (is_valid: bool, error_message: str or None)
+    """
+    if not applicable_sizes or applicable_sizes.strip() == '':
+        return True, None
+
+    try:
+        valid_sizes = load_order_sizes([order_commessa])[order_commessa]
+        return check_applicable_sizes(applicable_sizes, order_commessa, valid_sizes)
+
+    except Exception as e:
+        return False, f"Error validating sizes: {str(e)}"
+
+
+def validate_sizes_batch(rows):
+    """Validate many (applicable_sizes, order_commessa) pairs, loading each order's sizes once.
+
+    Returns a list of (is_valid, error_message) in the order of rows.
+    """
+    orders = [order for applicable_sizes, order in rows
+              if applicable_sizes and applicable_sizes.strip() not in ('', 'ALL')]
+    try:
+        sizes = load_order_sizes(orders) if orders else {}
+    except Exception as e:
+        return [(False, f"Error validating sizes: {str(e)}")] * len(rows)
+
+    return [
+        (True, None) if not applicable_sizes or applicable_sizes == 'ALL'
+        else check_applicable_sizes(applicable_sizes, order, sizes.get(order))
+        for applicable_sizes, order in rows
+    ]
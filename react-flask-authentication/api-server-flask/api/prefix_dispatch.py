@@ -0,0 +1,31 @@
+"""
+WSGI middleware for API calls made through the VPN proxy.
+
+The VPN publishes the application under /web_forward_CuttingApplicationAPI/.
+API calls under that prefix used to be replayed by a Flask route through
+current_app.test_client(), so every call ran the whole Flask stack twice with
+a copy of the body and headers. PrefixDispatch moves the prefix from PATH_INFO
+to SCRIPT_NAME before Flask sees the request, so the call is routed to the API
+once. The request body (wsgi.input) and the response iterable are passed
+through untouched, so both stream.
+
+Only the forwarded sub-paths (api/ by default) are rewritten: the static files
+and React routes under the prefix are still served by serve_react_app_vpn.
+"""
+
+VPN_PREFIX = '/web_forward_CuttingApplicationAPI'
+
+
+class PrefixDispatch:
+    def __init__(self, app, prefix=VPN_PREFIX, forward=('/api/',)):
+        self.app = app
+        self.prefix = prefix.rstrip('/')
+        self.forward = tuple(self.prefix + path for path in forward)
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if path.startswith(self.forward):
+            # url_for() and redirects keep the prefix through SCRIPT_NAME
+            environ['PATH_INFO'] = path[len(self.prefix):]
+            environ['SCRIPT_NAME'] = environ.get('SCRIPT_NAME', '').rstrip('/') + self.prefix
+        return self.app(environ, start_response)
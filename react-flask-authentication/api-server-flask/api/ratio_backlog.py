@@ -0,0 +1,131 @@
+"""
+Backlog of orders that still need Italian ratios.
+
+The to-do list and the navbar badge used to compare every order in the NAV
+view with every order in order_ratios on each call. Instead, the orders
+missing ratios are kept in order_ratio_backlog:
+
+- added by the order lines sync when new orders show up
+- removed when ratios are saved (/orders/ratios/update)
+- rebuilt from scratch by reconcile_ratio_backlog() (nightly full sync,
+  "python sync_order_lines.py backlog", or POST /orders/order_lines/without_ratios/reconcile)
+"""
+
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam
+
+from api.models import db, OrderLinesView, OrderLineReplica, OrderRatio, OrderRatioBacklog, SyncState
+from api.order_lines_sync import get_sync_state, replica_ready, chunked
+
+RATIO_BACKLOG_SYNC = 'ratio_backlog'
+
+# Orders from this number on need ratios
+BACKLOG_MIN_ORDER = '25'
+
+
+def backlog_ready():
+    """True once the backlog has been reconciled at least once"""
+    state = db.session.get(SyncState, RATIO_BACKLOG_SYNC)
+    return state is not None and state.last_full_sync is not None
+
+
+def _orders_with_ratios(orders):
+    found = set()
+    for chunk in chunked(orders):
+        found.update(row[0] for row in db.session.query(OrderRatio.order_commessa)
+                     .filter(OrderRatio.order_commessa.in_(chunk)).distinct())
+    return found
+
+
+def _orders_in_backlog(orders):
+    found = set()
+    for chunk in chunked(orders):
+        found.update(row[0] for row in db.session.query(OrderRatioBacklog.order_commessa)
+                     .filter(OrderRatioBacklog.order_commessa.in_(chunk)))
+    return found
+
+
+def add_to_backlog(order_styles):
+    """Queue {order_commessa: style} orders that have no ratios yet (caller commits). Returns the number added."""
+    order_styles = {order: style for order, style in order_styles.items()
+                    if order and style and order >= BACKLOG_MIN_ORDER}
+    if not order_styles:
+        return 0
+
+    skip = _orders_with_ratios(order_styles) | _orders_in_backlog(order_styles)
+    rows = [{'order_commessa': order, 'style': style, 'added_at': datetime.now()}
+            for order, style in order_styles.items() if order not in skip]
+    if rows:
+        db.session.execute(OrderRatioBacklog.__table__.insert(), rows)
+    return len(rows)
+
+
+def remove_from_backlog(orders):
+    """Drop orders that now have ratios (caller commits). Returns the number removed."""
+    removed = 0
+    for chunk in chunked(set(orders)):
+        removed += OrderRatioBacklog.query.filter(OrderRatioBacklog.order_commessa.in_(chunk))\
+            .delete(synchronize_session=False)
+    return removed
+
+
+def reconcile_ratio_backlog():
+    """Rebuild the backlog from the order lines and order_ratios. Commits. Returns a summary dict."""
+    started = time.perf_counter()
+    state = get_sync_state(RATIO_BACKLOG_SYNC)
+
+    try:
+        model = OrderLineReplica if replica_ready() else OrderLinesView
+        has_ratios = db.session.query(OrderRatio.order_commessa)\
+            .filter(OrderRatio.order_commessa == model.order_commessa).exists()
+        expected = dict(db.session.query(model.order_commessa, model.style)
+                        .filter(model.order_commessa >= BACKLOG_MIN_ORDER)
+                        .filter(model.style.isnot(None))
+                        .filter(~has_ratios)
+                        .distinct().all())
+        current = dict(db.session.query(OrderRatioBacklog.order_commessa, OrderRatioBacklog.style).all())
+
+        table = OrderRatioBacklog.__table__
+        now = datetime.now()
+        inserts = [{'order_commessa': order, 'style': style, 'added_at': now}
+                   for order, style in expected.items() if order not in current]
+        updates = [{'b_order_commessa': order, 'b_style': style}
+                   for order, style in expected.items() if order in current and current[order] != style]
+        deletes = [{'b_order_commessa': order} for order in current.keys() - expected.keys()]
+
+        if inserts:
+            db.session.execute(table.insert(), inserts)
+        if updates:
+            db.session.execute(
+                table.update().where(table.c.order_commessa == bindparam('b_order_commessa'))
+                .values(style=bindparam('b_style')),
+                updates
+            )
+        if deletes:
+            db.session.execute(table.delete().where(table.c.order_commessa == bindparam('b_order_commessa')), deletes)
+
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        state.last_full_sync = datetime.now()
+        state.last_row_count = len(expected)
+        state.last_duration_ms = duration_ms
+        state.last_error = None
+        db.session.commit()
+
+        return {
+            "orders": len(expected),
+            "inserted": len(inserts),
+            "updated": len(updates),
+            "deleted": len(deletes),
+            "duration_ms": duration_ms
+        }
+
+    except Exception as e:
+        db.session.rollback()
+        try:
+            get_sync_state(RATIO_BACKLOG_SYNC).last_error = str(e)[:1000]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+        raise
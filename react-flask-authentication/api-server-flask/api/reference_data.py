@@ -0,0 +1,174 @@
+"""
+Reference data cache.
+
+Brands, item descriptions, styles, operators and production center options
+change a few times a day but were read from the database (or a config file)
+on every call, often by every tablet. Each set is loaded in bulk, held per
+worker with an ETag, and served with If-None-Match support so clients that
+already have the current version get a 304.
+
+Sets with a version key (operators, production center configuration) are
+reloaded as soon as a write bumps the key in cache_versions; the NAV sets
+expire with a TTL.
+"""
+
+import hashlib
+import json
+
+from flask import Response, request
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from api.cache import Memo, bump_versions
+from api.models import db, ZalliItemsView, ItemDescriptions, Operator, OrderLinesView, OrderLineReplica
+
+# NAV views are refreshed by NAV itself, so they can only expire
+NAV_TTL = 900
+LOCAL_TTL = 3600
+
+# Real production center combinations based on the system configuration
+PRODUCTION_CENTER_OPTIONS = [
+    # PXE1 - ZALLI combinations
+    {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "ZALLI 1 - SECTOR 1"},
+    {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "ZALLI 1 - SECTOR 2"},
+    {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "ZALLI 1 - SECTOR 3"},
+    {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "ZALLI 2"},
+    {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "ZALLI 3"},
+    {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "TEXCONS"},
+    {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "VERONA"},
+    {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "INTERTOP"},
+    {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "SANIA"},
+    {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "CUTTING SECTION"},
+
+    # PXE1 - VERONA combinations
+    {"production_center": "PXE1", "cutting_room": "VERONA", "destination": "VERONA"},
+
+    # PXE1 - TEXCONS combinations
+    {"production_center": "PXE1", "cutting_room": "TEXCONS", "destination": "TEXCONS"},
+
+    # PXE3 - VEGATEX combinations
+    {"production_center": "PXE3", "cutting_room": "VEGATEX", "destination": "VEGATEX"},
+
+    # PXE3 - SINA STYLE combinations
+    {"production_center": "PXE3", "cutting_room": "SINA STYLE", "destination": "SINA STYLE"},
+
+    # PXE3 - ZEYNTEX combinations
+    {"production_center": "PXE3", "cutting_room": "ZEYNTEX", "destination": "ZEYNTEX"},
+
+    # PXE3 - DELICIA combinations
+    {"production_center": "PXE3", "cutting_room": "DELICIA", "destination": "DELICIA"},
+    {"production_center": "PXE3", "cutting_room": "DELICIA", "destination": "SUNAI"},
+    {"production_center": "PXE3", "cutting_room": "DELICIA", "destination": "NADJI"},
+    {"production_center": "PXE3", "cutting_room": "DELICIA", "destination": "SABRI89"},
+
+    # PXE3 - VAIDE MOLA combinations
+    {"production_center": "PXE3", "cutting_room": "VAIDE MOLA", "destination": "VAIDE MOLA"},
+
+    # PXE3 - HADJIOLI combinations
+    {"production_center": "PXE3", "cutting_room": "HADJIOLI", "destination": "HADJIOLI"},
+
+    # PXE3 - YUMER combinations
+    {"production_center": "PXE3", "cutting_room": "YUMER", "destination": "YUMER"},
+
+    # PXE3 - RILA TEXTILE combinations
+    {"production_center": "PXE3", "cutting_room": "RILA TEXTILE", "destination": "RILA TEXTILE"},
+]
+
+reference_memo = Memo(ttl=LOCAL_TTL, max_entries=50)
+
+
+def _load_brands():
+    return [item.to_dict() for item in ZalliItemsView.query.all()]
+
+
+def _load_brand_index():
+    # item_no comparisons are case-insensitive in the database collation
+    _, brands = get_reference('brands')
+    return {item['item_no'].upper(): item['brand'] for item in brands if item['item_no']}
+
+
+def _load_item_descriptions():
+    items = ItemDescriptions.query.filter(
+        ItemDescriptions.Code.isnot(None),
+        ItemDescriptions.Description.isnot(None)
+    ).distinct().all()
+    return [item.to_dict() for item in items]
+
+
+def _load_styles():
+    from api.order_lines_sync import replica_ready, order_prefix_filter
+
+    def read_styles(model, *conditions):
+        rows = db.session.query(model.style).filter(model.style.isnot(None), *conditions).distinct().all()
+        return {row[0] for row in rows if row[0]}
+
+    if not replica_ready():
+        return sorted(read_styles(OrderLinesView))
+    # The replica only holds the orders of order_prefix_filter: the older ones are read from NAV
+    return sorted(read_styles(OrderLineReplica) | read_styles(OrderLinesView, ~order_prefix_filter(OrderLinesView)))
+
+
+def _load_operators():
+    return [op.to_dict() for op in Operator.query.order_by(Operator.id).all()]
+
+
+def _load_production_center_config():
+    from api.routes.config_management import read_production_center_config
+
+    return read_production_center_config()
+
+
+# name: (loader, version key bumped by writes or None, TTL in seconds)
+DATASETS = {
+    'brands': (_load_brands, None, NAV_TTL),
+    'brand_index': (_load_brand_index, None, NAV_TTL),
+    'item_descriptions': (_load_item_descriptions, None, NAV_TTL),
+    'styles': (_load_styles, None, NAV_TTL),
+    'operators': (_load_operators, 'reference:operators', LOCAL_TTL),
+    'production_center_options': (lambda: PRODUCTION_CENTER_OPTIONS, None, LOCAL_TTL),
+    'production_center_config': (_load_production_center_config, 'reference:production_center_config', LOCAL_TTL),
+}
+
+
+def compute_etag(data):
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def get_reference(name):
+    """Return (etag, data) of a reference data set, loading it when missing, expired or outdated"""
+    loader, version_key, ttl = DATASETS[name]
+
+    def load():
+        data = loader()
+        return compute_etag(data), data
+
+    return reference_memo.get_or_compute(name, version_key, load, ttl)
+
+
+def invalidate_reference(name):
+    """Make every worker reload a versioned set on its next request (commits)"""
+    bump_versions(db.session.connection(), [DATASETS[name][1]])
+    db.session.commit()
+
+
+def etag_response(etag, build_body, variant=None):
+    """304 if the client already has this version, else the body with its ETag.
+
+    variant distinguishes filtered views of the same set (e.g. operators by type).
+    """
+    if variant:
+        etag = f"{etag}-{hashlib.sha1(variant.encode('utf-8')).hexdigest()[:12]}"
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache'}
+
+    if etag in request.if_none_match:
+        return Response(status=304, headers=headers)
+    return build_body(), 200, headers
+
+
+@event.listens_for(Session, 'after_flush')
+def invalidate_operators(session, flush_context):
+    """Bump the operators version on any operator insert, update or delete"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Operator):
+            bump_versions(session.connection(), [DATASETS['operators'][1]])
+            return
@@ -6,6 +6,7 @@ from flask import request
 # Import Blueprints and Namespaces from all modules
 from .auth import auth_bp, auth_api
 from ..models import OrderLinesView  # Import the OrderLinesView model
+from ..serialization import output_json
 from .markers import markers_bp, markers_api
 from .orders import orders_bp, orders_api
 from .root import root_bp
@@ -20,6 +21,7 @@ from .marker_requests import marker_requests_bp, marker_requests_api  # Marker r
 from .navision import navision_bp, navision_api  # Navision integration module
 from .dashboard import dashboard_bp, dashboard_api  # Dashboard analytics module
 from .config_management import config_management_bp, config_management_api  # Configuration management module
+from .jobs import jobs_bp, jobs_api  # Background jobs module
 # VPN uses existing Flask-RESTX endpoints, no separate blueprint needed
 
 # Define the main RESTx API with Swagger documentation settings
@@ -36,6 +38,9 @@ rest_api = Api(
     ordered=True     # Ensure consistent ordering
 )
 
+# orjson encoder for every Resource response (api/serialization.py)
+rest_api.representation('application/json')(output_json)
+
 def register_blueprints(app):
     """Register all Blueprints (routes) and attach Namespaces for Swagger."""
     # Register Blueprints with URL prefixes where needed
@@ -56,6 +61,7 @@ def register_blueprints(app):
     app.register_blueprint(dashboard_bp, url_prefix="/api/dashboard")
     app.register_blueprint(navision_bp, url_prefix="/api/navision")
     app.register_blueprint(config_management_bp, url_prefix="/api/config")
+    app.register_blueprint(jobs_bp, url_prefix="/api/jobs")
 
     # VPN API requests are now handled by proxy in the VPN route
     print("🔥🔥🔥 VPN API REQUESTS WILL BE PROXIED TO REGULAR API ROUTES")
@@ -81,5 +87,6 @@ def register_blueprints(app):
     rest_api.add_namespace(dashboard_api, path="/api/dashboard")
     rest_api.add_namespace(navision_api, path="/api/navision")
     rest_api.add_namespace(config_management_api, path="/api/config")
+    rest_api.add_namespace(jobs_api, path="/api/jobs")
 
     print("✅ API ROUTES REGISTERED - VPN REQUESTS WILL BE PROXIED")
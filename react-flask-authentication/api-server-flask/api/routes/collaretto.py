@@ -3,69 +3,35 @@ from api.models import db, Collaretto, CollarettoDetail, Mattresses, MattressDet
 from flask_restx import Namespace, Resource
 from datetime import datetime
 import math
-import time
-from sqlalchemy.exc import OperationalError
+from api.logistic_collaretto import (collaretto_rows, collaretto_groups, mattresses_by_table, type_label,
+                                     update_collaretto_details)
+from api.transactions import transactional, retryable_error
+from api.order_sizes import validate_applicable_sizes, validate_sizes_batch
+from api.collaretto_tables import save_collaretto_table
 
 collaretto_bp = Blueprint('collaretto_bp', __name__)
 collaretto_api = Namespace('collaretto', description="Collaretto Management")
 
-def validate_applicable_sizes(applicable_sizes, order_commessa):
-    """
-    Validate that the applicable_sizes string contains only valid sizes for the given order.
-
-    Args:
-        applicable_sizes (str): Dash-separated sizes like "S-M-L" or None/empty for ALL
-        order_commessa (str): Order number to validate against
-
-    Returns:
-        tuple: (is_valid: bool, error_message: str or None)
-    """
-    if not applicable_sizes or applicable_sizes.strip() == '':
-        return True, None  # Empty means ALL, which is always valid
-
-    try:
-        # Get valid sizes for this order
-        order_sizes = db.session.query(OrderLinesView.size)\
-            .filter_by(order_commessa=order_commessa)\
-            .distinct().all()
-
-        valid_sizes = {size[0] for size in order_sizes if size[0]}
-
-        if not valid_sizes:
-            return False, f"No sizes found for order {order_commessa}"
-
-        # Parse the applicable_sizes string
-        requested_sizes = set(size.strip() for size in applicable_sizes.split('-') if size.strip())
-
-        # Check if all requested sizes are valid
-        invalid_sizes = requested_sizes - valid_sizes
-        if invalid_sizes:
-            return False, f"Invalid sizes for order {order_commessa}: {', '.join(invalid_sizes)}. Valid sizes: {', '.join(sorted(valid_sizes))}"
+@collaretto_api.route('/validate_sizes', methods=['POST'])
+class ValidateApplicableSizes(Resource):
+    def post(self):
+        """Validate the applicable sizes of many rows at once.
 
-        return True, None
+        Body: {"rows": [{"order_commessa": "...", "applicable_sizes": "S-M-L"}, ...]}
+        Returns one {"valid", "message"} per row, in the same order.
+        """
+        try:
+            rows = (request.get_json() or {}).get('rows', [])
+            results = validate_sizes_batch([(row.get('applicable_sizes'), row.get('order_commessa')) for row in rows])
 
-    except Exception as e:
-        return False, f"Error validating sizes: {str(e)}"
+            return {
+                "success": True,
+                "data": [{"valid": is_valid, "message": error_msg} for is_valid, error_msg in results],
+                "all_valid": all(is_valid for is_valid, _ in results)
+            }, 200
 
-def retry_on_deadlock(func, max_retries=3, delay=1):
-    """Retry function on deadlock errors"""
-    for attempt in range(max_retries):
-        try:
-            return func()
-        except OperationalError as e:
-            # Check if it's a deadlock error (SQL Server error 1205)
-            if '1205' in str(e) or 'deadlock' in str(e).lower():
-                if attempt < max_retries - 1:
-                    print(f"Deadlock detected, retrying in {delay * (attempt + 1)} seconds... (attempt {attempt + 1}/{max_retries})")
-                    time.sleep(delay * (attempt + 1))  # Exponential backoff
-                    continue
-                else:
-                    raise Exception(f"Operation failed after {max_retries} attempts due to deadlock")
-            else:
-                raise
         except Exception as e:
-            raise
-    return None
+            return {"success": False, "msg": str(e)}, 500
 
 @collaretto_api.route('/add_along_row')
 class CollarettoAlong(Resource):
@@ -460,6 +426,7 @@ class CollarettoWeft(Resource):
 @collaretto_api.route('/delete_weft_bias/<string:collaretto_name>', methods=['DELETE'])
 class DeleteWeft(Resource):
     def delete(self, collaretto_name):
+        @transactional(retries=5)
         def delete_operation():
             # ✅ Check if the collaretto exists
             collaretto = Collaretto.query.filter_by(collaretto=collaretto_name).first()
@@ -479,12 +446,10 @@ class DeleteWeft(Resource):
             # ✅ Delete the collaretto itself (cascade handles collaretto_details)
             db.session.delete(collaretto)
 
-            db.session.commit()
             return {"success": True, "message": f"{collaretto_name} and linked mattress deleted successfully"}
 
         try:
-            # Execute delete with deadlock retry
-            result = retry_on_deadlock(delete_operation, max_retries=5, delay=0.5)
+            result = delete_operation()
             return jsonify(result)
 
         except Exception as e:
@@ -493,7 +458,7 @@ class DeleteWeft(Resource):
             print(f"❌ Error deleting weft {collaretto_name}: {error_msg}")
 
             # Check if it's a deadlock error and provide user-friendly message
-            if '1205' in error_msg or 'deadlock' in error_msg.lower():
+            if retryable_error(e):
                 return jsonify({"success": False, "message": "Database is busy, please try again in a moment."})
             else:
                 return jsonify({"success": False, "message": error_msg})
@@ -502,6 +467,7 @@ class DeleteWeft(Resource):
 class DeleteCollarettoByRowId(Resource):
     def delete(self, row_id):
         """Delete collaretto by row_id - more reliable than collaretto name"""
+        @transactional(retries=5)
         def delete_operation():
             # ✅ Check if the collaretto exists by row_id
             collaretto = Collaretto.query.filter_by(row_id=row_id).first()
@@ -522,13 +488,11 @@ class DeleteCollarettoByRowId(Resource):
 
             # ✅ Delete the collaretto itself (cascade handles collaretto_details)
             db.session.delete(collaretto)
-            db.session.commit()
 
             return {"success": True, "message": f"Deleted collaretto {collaretto_name} (row_id: {row_id})"}
 
         try:
-            # Execute delete with deadlock retry
-            result = retry_on_deadlock(delete_operation, max_retries=5, delay=0.5)
+            result = delete_operation()
             return jsonify(result)
 
         except Exception as e:
@@ -537,11 +501,55 @@ class DeleteCollarettoByRowId(Resource):
             print(f"❌ Error deleting collaretto by row_id {row_id}: {error_msg}")
 
             # Check if it's a deadlock error and provide user-friendly message
-            if '1205' in error_msg or 'deadlock' in error_msg.lower():
+            if retryable_error(e):
                 return jsonify({"success": False, "message": "Database is busy, please try again in a moment."})
             else:
                 return jsonify({"success": False, "message": error_msg})
 
+@collaretto_api.route('/tables/<string:table_id>/bulk_save', methods=['POST'])
+class BulkSaveCollarettoTable(Resource):
+    def post(self, table_id):
+        """Save all the rows of an along, weft or bias table in one transaction.
+
+        Body: {"rows": [add_along_row / add_weft_row / add_bias_row payloads],
+               "operator": "...", "production_center": {"production_center", "cutting_room", "destination"}}
+        Rows of the table missing from "rows" are deleted; an empty "rows" also
+        needs "delete_all": true, so a truncated body cannot empty the table.
+        """
+        data = request.get_json() or {}
+        rows = data.get('rows')
+        delete_all = data.get('delete_all') is True
+        try:
+            if not isinstance(rows, list):
+                return {"success": False, "message": "rows is required (a list of rows)"}, 400
+            if not rows and not delete_all:
+                return {"success": False, "message": "rows is empty: send \"delete_all\": true to delete every row of the table"}, 400
+            if any(not row.get('row_id') for row in rows):
+                return {"success": False, "message": "Every row needs a row_id"}, 400
+            if len({row.get('item_type') for row in rows}) > 1:
+                return {"success": False, "message": "All the rows of a table must have the same item_type"}, 400
+
+            results = validate_sizes_batch([(row.get('applicable_sizes'), row.get('order_commessa')) for row in rows])
+            # Not "errors": output_json reads that key as Flask-RESTX validation errors
+            invalid = [{"row_id": row.get('row_id'), "message": error_msg}
+                       for row, (is_valid, error_msg) in zip(rows, results) if not is_valid]
+            if invalid:
+                return {"success": False, "message": invalid[0]["message"], "rows": invalid}, 400
+
+            summary = save_collaretto_table(table_id, rows, data.get('operator'), data.get('production_center'),
+                                            delete_all=delete_all)
+            print(f"💾 Saved collaretto table {table_id}: {summary}")
+            return {"success": True, "data": summary}, 200
+
+        except Exception as e:
+            db.session.rollback()
+            error_msg = str(e)
+            print(f"❌ Error saving collaretto table {table_id}: {error_msg}")
+
+            if retryable_error(e):
+                return {"success": False, "message": "Database is busy, please try again in a moment."}, 503
+            return {"success": False, "message": error_msg}, 500
+
 @collaretto_api.route('/get_weft_by_order/<order_id>', methods=['GET'])
 class GetWeftByOrder(Resource):
     def get(self, order_id):
@@ -955,6 +963,44 @@ class GetOrdersByProductionCenter(Resource):
             return {"success": False, "msg": str(e)}, 500
 
 
+def collaretto_id_suffix(collaretto):
+    """Last 3 parts of the collaretto name (e.g. "CA-02-001" from "Z12-378867-CA-02-001")"""
+    if collaretto.collaretto:
+        parts = collaretto.collaretto.split('-')
+        if len(parts) >= 3:
+            return '-'.join(parts[-3:])
+    return ""
+
+
+def logistic_tables(order_commessa, item_type, table_extra, build_row):
+    """PXE3 tables of one collaretto type for an order, with their rows (one query)"""
+    rows = collaretto_rows(order_commessa, item_types=[item_type], match_table_type=True)
+
+    tables = {}
+    for collaretto, prod_center, detail, mattress, mattress_detail in rows:
+        table_id = collaretto.table_id
+
+        # Initialize table if not exists
+        if table_id not in tables:
+            tables[table_id] = {
+                "id": table_id,
+                "fabricType": collaretto.fabric_type,
+                "fabricCode": collaretto.fabric_code,
+                "fabricColor": collaretto.fabric_color,
+                "dyeLot": collaretto.dye_lot,
+                "productionCenter": prod_center.production_center,
+                "cuttingRoom": prod_center.cutting_room,
+                "destination": prod_center.destination,
+                **table_extra,
+                "rows": []
+            }
+
+        if detail:
+            tables[table_id]["rows"].append(build_row(collaretto, detail, mattress_detail))
+
+    return list(tables.values())
+
+
 @collaretto_api.route('/logistic/along_by_order/<string:order_commessa>', methods=['GET'])
 class GetLogisticAlongByOrder(Resource):
     def get(self, order_commessa):
@@ -962,82 +1008,26 @@ class GetLogisticAlongByOrder(Resource):
         try:
             print(f"🔍 Fetching along collaretto for order: {order_commessa}")
 
-            # First check if we have any along collaretto for this order (ordered by bagno, then sequence_number)
-            along_collaretto = Collaretto.query.filter_by(
-                order_commessa=order_commessa,
-                item_type='CA'
-            ).order_by(Collaretto.dye_lot, Collaretto.sequence_number).all()
-
-            print(f"🔍 Found {len(along_collaretto)} along collaretto records")
-
-            if not along_collaretto:
-                return {"success": True, "data": []}, 200
-
-            # Group by table_id and check for PXE3 production center
-            tables = {}
-            for collaretto in along_collaretto:
-                # Check if this table has PXE3 production center assignment
-                prod_center = MattressProductionCenter.query.filter_by(
-                    table_id=collaretto.table_id,
-                    production_center='PXE3',
-                    table_type='ALONG'
-                ).first()
-
-                if not prod_center:
-                    continue  # Skip if not assigned to PXE3
-
-                table_id = collaretto.table_id
-                print(f"🔍 Found PXE3 along table: {table_id}")
-
-                # Initialize table if not exists
-                if table_id not in tables:
-                    tables[table_id] = {
-                        "id": table_id,
-                        "fabricType": collaretto.fabric_type,
-                        "fabricCode": collaretto.fabric_code,
-                        "fabricColor": collaretto.fabric_color,
-                        "dyeLot": collaretto.dye_lot,
-                        "productionCenter": prod_center.production_center,
-                        "cuttingRoom": prod_center.cutting_room,
-                        "destination": prod_center.destination,
-                        "alongExtra": "3",  # Default value
-                        "rows": []
-                    }
-
-                # Get collaretto details for this specific collaretto record
-                details = CollarettoDetail.query.filter_by(collaretto_id=collaretto.id).all()
-
-                for detail in details:
-                    # Get bagno from collaretto dye_lot
-                    bagno = collaretto.dye_lot or ""
-
-                    # Extract collaretto ID suffix (e.g., "CA-02-001" from "Z12-378867-CA-02-001")
-                    collaretto_id_suffix = ""
-                    if collaretto.collaretto:
-                        parts = collaretto.collaretto.split('-')
-                        if len(parts) >= 3:
-                            # Take the last 3 parts (CA-02-001)
-                            collaretto_id_suffix = '-'.join(parts[-3:])
+            def build_row(collaretto, detail, mattress_detail):
+                return {
+                    "id": collaretto.row_id,
+                    "collarettoId": collaretto_id_suffix(collaretto),
+                    "pieces": detail.pieces,
+                    "usableWidth": detail.usable_width,
+                    "theoreticalConsumption": detail.gross_length,
+                    "collarettoWidth": detail.roll_width,
+                    "scrapRoll": detail.scrap_rolls,
+                    "rolls": detail.rolls_planned,
+                    "rollsActual": detail.rolls_actual or "",
+                    "actualRolls": detail.rolls_actual or "",  # New field for actual rolls
+                    "totalCollaretto": detail.total_collaretto,
+                    "consPlanned": detail.cons_planned,
+                    "consActual": detail.cons_actual or "",
+                    "bagno": collaretto.dye_lot or "",
+                    "sizes": detail.applicable_sizes
+                }
 
-                    tables[table_id]["rows"].append({
-                        "id": collaretto.row_id,
-                        "collarettoId": collaretto_id_suffix,
-                        "pieces": detail.pieces,
-                        "usableWidth": detail.usable_width,
-                        "theoreticalConsumption": detail.gross_length,
-                        "collarettoWidth": detail.roll_width,
-                        "scrapRoll": detail.scrap_rolls,
-                        "rolls": detail.rolls_planned,
-                        "rollsActual": detail.rolls_actual or "",
-                        "actualRolls": detail.rolls_actual or "",  # New field for actual rolls
-                        "totalCollaretto": detail.total_collaretto,
-                        "consPlanned": detail.cons_planned,
-                        "consActual": detail.cons_actual or "",
-                        "bagno": bagno,
-                        "sizes": detail.applicable_sizes
-                    })
-
-            result_tables = list(tables.values())
+            result_tables = logistic_tables(order_commessa, 'CA', {"alongExtra": "3"}, build_row)
 
             return {"success": True, "data": result_tables}, 200
 
@@ -1053,91 +1043,32 @@ class GetLogisticWeftByOrder(Resource):
         try:
             print(f"🔍 Fetching weft collaretto for order: {order_commessa}")
 
-            # First check if we have any weft collaretto for this order (ordered by bagno, then sequence_number)
-            weft_collaretto = Collaretto.query.filter_by(
-                order_commessa=order_commessa,
-                item_type='CW'
-            ).order_by(Collaretto.dye_lot, Collaretto.sequence_number).all()
-
-            print(f"🔍 Found {len(weft_collaretto)} weft collaretto records")
-
-            if not weft_collaretto:
-                return {"success": True, "data": []}, 200
-
-            # Group by table_id and check for PXE3 production center
-            tables = {}
-            for collaretto in weft_collaretto:
-                # Check if this table has PXE3 production center assignment
-                prod_center = MattressProductionCenter.query.filter_by(
-                    table_id=collaretto.table_id,
-                    production_center='PXE3',
-                    table_type='WEFT'
-                ).first()
+            def build_row(collaretto, detail, mattress_detail):
+                # Panels are the layers of the linked mattress when available
+                panels = detail.rolls_planned
+                if mattress_detail and mattress_detail.layers:
+                    panels = mattress_detail.layers
 
-                if not prod_center:
-                    continue  # Skip if not assigned to PXE3
-
-                table_id = collaretto.table_id
-                print(f"🔍 Found PXE3 weft table: {table_id}")
-
-                # Initialize table if not exists
-                if table_id not in tables:
-                    tables[table_id] = {
-                        "id": table_id,
-                        "fabricType": collaretto.fabric_type,
-                        "fabricCode": collaretto.fabric_code,
-                        "fabricColor": collaretto.fabric_color,
-                        "dyeLot": collaretto.dye_lot,
-                        "productionCenter": prod_center.production_center,
-                        "cuttingRoom": prod_center.cutting_room,
-                        "destination": prod_center.destination,
-                        "spreading": "AUTOMATIC",  # Default value
-                        "weftExtra": "3",  # Default value
-                        "rows": []
-                    }
+                return {
+                    "id": collaretto.row_id,
+                    "collarettoId": collaretto_id_suffix(collaretto),
+                    "pieces": detail.pieces,
+                    "usableWidth": detail.usable_width,
+                    "pcsSeamtoSeam": detail.pcs_seam,
+                    "rewoundWidth": detail.gross_length,  # Use gross_length as rewound width
+                    "collarettoWidth": detail.roll_width,  # Use roll_width as collaretto width
+                    "scrapRoll": detail.scrap_rolls,
+                    "rolls": detail.rolls_planned,
+                    "rollsActual": detail.rolls_actual or "",
+                    "actualRolls": detail.rolls_actual or "",  # New field for actual rolls
+                    "panels": panels,
+                    "consPlanned": detail.cons_planned,
+                    "consActual": detail.cons_actual or "",
+                    "bagno": collaretto.dye_lot or "",
+                    "sizes": detail.applicable_sizes
+                }
 
-                # Get collaretto details for this specific collaretto record
-                details = CollarettoDetail.query.filter_by(collaretto_id=collaretto.id).all()
-
-                for detail in details:
-                    # Get bagno from collaretto dye_lot
-                    bagno = collaretto.dye_lot or ""
-
-                    # Extract collaretto ID suffix (e.g., "CA-02-001" from "Z12-378867-CA-02-001")
-                    collaretto_id_suffix = ""
-                    if collaretto.collaretto:
-                        parts = collaretto.collaretto.split('-')
-                        if len(parts) >= 3:
-                            # Take the last 3 parts (CW-02-001)
-                            collaretto_id_suffix = '-'.join(parts[-3:])
-
-                    # Get panels from mattress_details.layers if available
-                    panels = detail.rolls_planned  # Default fallback
-                    if detail.mattress_id:
-                        mattress_detail = MattressDetail.query.filter_by(mattress_id=detail.mattress_id).first()
-                        if mattress_detail and mattress_detail.layers:
-                            panels = mattress_detail.layers
-
-                    tables[table_id]["rows"].append({
-                        "id": collaretto.row_id,
-                        "collarettoId": collaretto_id_suffix,
-                        "pieces": detail.pieces,
-                        "usableWidth": detail.usable_width,
-                        "pcsSeamtoSeam": detail.pcs_seam,
-                        "rewoundWidth": detail.gross_length,  # Use gross_length as rewound width
-                        "collarettoWidth": detail.roll_width,  # Use roll_width as collaretto width
-                        "scrapRoll": detail.scrap_rolls,
-                        "rolls": detail.rolls_planned,
-                        "rollsActual": detail.rolls_actual or "",
-                        "actualRolls": detail.rolls_actual or "",  # New field for actual rolls
-                        "panels": panels,  # Use mattress_details.layers if available
-                        "consPlanned": detail.cons_planned,
-                        "consActual": detail.cons_actual or "",
-                        "bagno": bagno,
-                        "sizes": detail.applicable_sizes
-                    })
-
-            result_tables = list(tables.values())
+            result_tables = logistic_tables(order_commessa, 'CW', {"spreading": "AUTOMATIC", "weftExtra": "3"}, build_row)
 
             return {"success": True, "data": result_tables}, 200
 
@@ -1153,81 +1084,25 @@ class GetLogisticBiasByOrder(Resource):
         try:
             print(f"🔍 Fetching bias collaretto for order: {order_commessa}")
 
-            # First check if we have any bias collaretto for this order (ordered by bagno, then sequence_number)
-            bias_collaretto = Collaretto.query.filter_by(
-                order_commessa=order_commessa,
-                item_type='CB'
-            ).order_by(Collaretto.dye_lot, Collaretto.sequence_number).all()
-
-            print(f"🔍 Found {len(bias_collaretto)} bias collaretto records")
-
-            if not bias_collaretto:
-                return {"success": True, "data": []}, 200
-
-            # Group by table_id and check for PXE3 production center
-            tables = {}
-            for collaretto in bias_collaretto:
-                # Check if this table has PXE3 production center assignment
-                prod_center = MattressProductionCenter.query.filter_by(
-                    table_id=collaretto.table_id,
-                    production_center='PXE3',
-                    table_type='BIAS'
-                ).first()
-
-                if not prod_center:
-                    continue  # Skip if not assigned to PXE3
-
-                table_id = collaretto.table_id
-                print(f"🔍 Found PXE3 bias table: {table_id}")
-
-                # Initialize table if not exists
-                if table_id not in tables:
-                    tables[table_id] = {
-                        "id": table_id,
-                        "fabricType": collaretto.fabric_type,
-                        "fabricCode": collaretto.fabric_code,
-                        "fabricColor": collaretto.fabric_color,
-                        "dyeLot": collaretto.dye_lot,
-                        "productionCenter": prod_center.production_center,
-                        "cuttingRoom": prod_center.cutting_room,
-                        "destination": prod_center.destination,
-                        "biasExtra": "3",  # Default value
-                        "rows": []
-                    }
-
-                # Get collaretto details for this specific collaretto record
-                details = CollarettoDetail.query.filter_by(collaretto_id=collaretto.id).all()
-
-                for detail in details:
-                    # Get bagno from collaretto dye_lot
-                    bagno = collaretto.dye_lot or ""
-
-                    # Extract collaretto ID suffix (e.g., "CA-02-001" from "Z12-378867-CA-02-001")
-                    collaretto_id_suffix = ""
-                    if collaretto.collaretto:
-                        parts = collaretto.collaretto.split('-')
-                        if len(parts) >= 3:
-                            # Take the last 3 parts (CB-02-001)
-                            collaretto_id_suffix = '-'.join(parts[-3:])
+            def build_row(collaretto, detail, mattress_detail):
+                return {
+                    "id": collaretto.row_id,
+                    "collarettoId": collaretto_id_suffix(collaretto),
+                    "pieces": detail.pieces,
+                    "usableWidth": detail.usable_width,
+                    "pcsSeam": detail.pcs_seam,
+                    "rollWidth": detail.roll_width,
+                    "scrapRolls": detail.scrap_rolls,
+                    "rolls": detail.rolls_planned,
+                    "rollsPlanned": detail.rolls_planned,
+                    "rollsActual": detail.rolls_actual or "",
+                    "consPlanned": detail.cons_planned,
+                    "consActual": detail.cons_actual or "",
+                    "bagno": collaretto.dye_lot or "",
+                    "sizes": detail.applicable_sizes
+                }
 
-                    tables[table_id]["rows"].append({
-                        "id": collaretto.row_id,
-                        "collarettoId": collaretto_id_suffix,
-                        "pieces": detail.pieces,
-                        "usableWidth": detail.usable_width,
-                        "pcsSeam": detail.pcs_seam,
-                        "rollWidth": detail.roll_width,
-                        "scrapRolls": detail.scrap_rolls,
-                        "rolls": detail.rolls_planned,
-                        "rollsPlanned": detail.rolls_planned,
-                        "rollsActual": detail.rolls_actual or "",
-                        "consPlanned": detail.cons_planned,
-                        "consActual": detail.cons_actual or "",
-                        "bagno": bagno,
-                        "sizes": detail.applicable_sizes
-                    })
-
-            result_tables = list(tables.values())
+            result_tables = logistic_tables(order_commessa, 'CB', {"biasExtra": "3"}, build_row)
 
             return {"success": True, "data": result_tables}, 200
 
@@ -1243,58 +1118,22 @@ class GetCollarettosByOrder(Resource):
         try:
             print(f"🔍 Fetching collaretos for order: {order_commessa}")
 
-            # Query all collaretos for this order with item_type CA, CW, or CB
-            collaretos = Collaretto.query.filter(
-                Collaretto.order_commessa == order_commessa,
-                Collaretto.item_type.in_(['CA', 'CW', 'CB'])
-            ).all()
-
-            print(f"🔍 Found {len(collaretos)} total collaretos")
-
-            if not collaretos:
-                return {"success": True, "data": []}, 200
-
-            # Group by destination
-            destination_groups = {}
-
-            for collaretto in collaretos:
-                # Check if this collaretto is assigned to PXE3
-                prod_center = MattressProductionCenter.query.filter_by(
-                    table_id=collaretto.table_id
-                ).first()
-
-                if prod_center and prod_center.production_center == 'PXE3':
-                    destination = prod_center.destination or 'N/A'
-
-                    if destination not in destination_groups:
-                        # Determine the type label
-                        type_label = 'Along'
-                        if collaretto.item_type == 'CW':
-                            type_label = 'Weft'
-                        elif collaretto.item_type == 'CB':
-                            type_label = 'Bias'
-
-                        destination_groups[destination] = {
-                            "destination": destination,
-                            "fabricType": collaretto.fabric_type,
-                            "fabricCode": collaretto.fabric_code,
-                            "fabricColor": collaretto.fabric_color,
-                            "dyeLot": collaretto.dye_lot,
-                            "productionCenter": prod_center.production_center,
-                            "cuttingRoom": prod_center.cutting_room,
-                            "itemType": collaretto.item_type,
-                            "typeLabel": type_label,
-                            "tableIds": [collaretto.table_id],
-                            "count": 1
-                        }
-                    else:
-                        # Increment count and add table_id if not already present
-                        destination_groups[destination]["count"] += 1
-                        if collaretto.table_id not in destination_groups[destination]["tableIds"]:
-                            destination_groups[destination]["tableIds"].append(collaretto.table_id)
-
-            # Convert to list
-            result = list(destination_groups.values())
+            # Counted per destination in SQL
+            groups = collaretto_groups(order_commessa, item_types=['CA', 'CW', 'CB'])
+
+            result = [{
+                "destination": group["key"],
+                "fabricType": group["fabricType"],
+                "fabricCode": group["fabricCode"],
+                "fabricColor": group["fabricColor"],
+                "dyeLot": group["bagno"],
+                "productionCenter": group["productionCenter"],
+                "cuttingRoom": group["cuttingRoom"],
+                "itemType": group["itemType"],
+                "typeLabel": type_label(group["itemType"]),
+                "tableIds": group["tableIds"],
+                "count": group["count"]
+            } for group in groups]
 
             print(f"🔍 Found {len(result)} destinations with collaretos for PXE3")
 
@@ -1312,58 +1151,22 @@ class GetBatchesByDestination(Resource):
         try:
             print(f"🔍 Fetching batches for order: {order_commessa}, destination: {destination}")
 
-            # Get all collaretos for this order and destination
-            collaretos = db.session.query(Collaretto).join(
-                MattressProductionCenter,
-                Collaretto.table_id == MattressProductionCenter.table_id
-            ).filter(
-                Collaretto.order_commessa == order_commessa,
-                MattressProductionCenter.destination == destination,
-                MattressProductionCenter.production_center == 'PXE3'
-            ).all()
-
-            if not collaretos:
-                return {"success": True, "data": []}, 200
-
-            # Group by bagno (dye_lot)
-            batches = {}
-            for collaretto in collaretos:
-                bagno = collaretto.dye_lot or "NO_BAGNO"
-
-                if bagno not in batches:
-                    # Get production center info
-                    prod_center = MattressProductionCenter.query.filter_by(
-                        table_id=collaretto.table_id
-                    ).first()
-
-                    batches[bagno] = {
-                        "bagno": bagno,
-                        "count": 0,
-                        "tableIds": [],
-                        "itemType": collaretto.item_type,
-                        "fabricType": collaretto.fabric_type,
-                        "fabricCode": collaretto.fabric_code,
-                        "fabricColor": collaretto.fabric_color,
-                        "destination": prod_center.destination if prod_center else "",
-                        "productionCenter": prod_center.production_center if prod_center else "",
-                        "cuttingRoom": prod_center.cutting_room if prod_center else ""
-                    }
-
-                batches[bagno]["count"] += 1
-                if collaretto.table_id not in batches[bagno]["tableIds"]:
-                    batches[bagno]["tableIds"].append(collaretto.table_id)
-
-            # Convert to list and add type labels
-            type_labels = {
-                'CA': 'Along',
-                'CW': 'Weft',
-                'CB': 'Bias'
-            }
-
-            result = []
-            for batch in batches.values():
-                batch['typeLabel'] = type_labels.get(batch['itemType'], batch['itemType'])
-                result.append(batch)
+            # Counted per bagno (dye_lot) in SQL
+            groups = collaretto_groups(order_commessa, group_by_bagno=True, destination=destination)
+
+            result = [{
+                "bagno": group["key"],
+                "count": group["count"],
+                "tableIds": group["tableIds"],
+                "itemType": group["itemType"],
+                "fabricType": group["fabricType"],
+                "fabricCode": group["fabricCode"],
+                "fabricColor": group["fabricColor"],
+                "destination": group["destination"] or "",
+                "productionCenter": group["productionCenter"] or "",
+                "cuttingRoom": group["cuttingRoom"] or "",
+                "typeLabel": type_label(group["itemType"])
+            } for group in groups]
 
             # Sort by bagno
             result.sort(key=lambda x: x['bagno'])
@@ -1384,45 +1187,24 @@ class GetCollarettoDetailsByBatch(Resource):
         try:
             print(f"🔍 Fetching collaretto details for order={order_commessa}, destination={destination}, bagno={bagno}")
 
-            # First, get all collaretos for this order and bagno
-            collaretos_for_order = Collaretto.query.filter_by(
-                order_commessa=order_commessa,
-                dye_lot=bagno
-            ).all()
-
-            if not collaretos_for_order:
-                return {"success": False, "msg": "No collaretos found for this order and bagno"}, 404
-
-            # Get table_ids from these collaretos
-            table_ids_from_collaretos = [c.table_id for c in collaretos_for_order]
+            collaretto_data = collaretto_rows(order_commessa, destination=destination, bagno=bagno)
 
-            # Filter by production center and destination
-            prod_centers = MattressProductionCenter.query.filter(
-                MattressProductionCenter.table_id.in_(table_ids_from_collaretos),
-                MattressProductionCenter.production_center == 'PXE3',
-                MattressProductionCenter.destination == destination
-            ).all()
-
-            if not prod_centers:
+            if not collaretto_data:
+                # Only the error path needs to tell which filter removed everything
+                if not Collaretto.query.filter_by(order_commessa=order_commessa, dye_lot=bagno).first():
+                    return {"success": False, "msg": "No collaretos found for this order and bagno"}, 404
                 return {"success": False, "msg": "No production centers found for this destination"}, 404
 
-            table_ids = [pc.table_id for pc in prod_centers]
-
-            # Get all collaretos for these filtered table_ids
-            collaretos = Collaretto.query.filter(
-                Collaretto.table_id.in_(table_ids),
-                Collaretto.order_commessa == order_commessa,
-                Collaretto.dye_lot == bagno
-            ).order_by(Collaretto.sequence_number).all()
+            collaretto_data.sort(key=lambda row: (row[0].sequence_number is None, row[0].sequence_number or 0))
 
-            if not collaretos:
-                return {"success": False, "msg": "No collaretos found for this batch"}, 404
+            # Rows without a linked mattress fall back to the mattress of the same table and order
+            fallback = mattresses_by_table(
+                {collaretto.table_id for collaretto, _, detail, mattress, _ in collaretto_data if detail and not mattress},
+                order_commessa
+            )
 
             # Get the first collaretto to extract common info
-            first_collaretto = collaretos[0]
-
-            # Get production center info from the first collaretto
-            prod_center = MattressProductionCenter.query.filter_by(table_id=first_collaretto.table_id).first()
+            first_collaretto, prod_center = collaretto_data[0][0], collaretto_data[0][1]
 
             # Get the style name from the order
             order_style = None
@@ -1432,35 +1214,21 @@ class GetCollarettoDetailsByBatch(Resource):
 
             # Build rows data
             rows = []
-            for collaretto in collaretos:
-                # Get detail for this collaretto
-                detail = CollarettoDetail.query.filter_by(collaretto_id=collaretto.id).first()
-
+            for collaretto, _, detail, mattress, mattress_detail in collaretto_data:
                 if not detail:
                     continue
 
-                # Get mattress info - all collaretos should have a linked mattress
-                mattress_info = None
-                mattress = None
-
-                if detail.mattress_id:
-                    mattress = Mattresses.query.filter_by(id=detail.mattress_id).first()
-
-                # If no mattress_id, try to find mattress by matching table_id and order
                 if not mattress:
-                    mattress = Mattresses.query.filter_by(
-                        table_id=collaretto.table_id,
-                        order_commessa=collaretto.order_commessa
-                    ).first()
+                    mattress, mattress_detail = fallback.get(collaretto.table_id, (None, None))
 
+                mattress_info = None
                 if mattress:
-                    mattress_detail = MattressDetail.query.filter_by(mattress_id=mattress.id).first()
                     mattress_info = {
                         "mattressName": mattress.mattress,
                         "panels": mattress_detail.layers if mattress_detail else None
                     }
 
-                row_data = {
+                rows.append({
                     "rowId": collaretto.row_id,
                     "collarettoId": collaretto.collaretto,
                     "sequenceNumber": collaretto.sequence_number,
@@ -1477,23 +1245,15 @@ class GetCollarettoDetailsByBatch(Resource):
                     "extra": detail.extra,
                     "totalCollaretto": detail.total_collaretto,
                     "applicableSizes": detail.applicable_sizes,
+                    "version": detail.version,
                     "mattressInfo": mattress_info
-                }
-
-                rows.append(row_data)
-
-            # Determine type label
-            type_label = 'Along'
-            if first_collaretto.item_type == 'CW':
-                type_label = 'Weft'
-            elif first_collaretto.item_type == 'CB':
-                type_label = 'Bias'
+                })
 
             result = {
                 "orderCommessa": first_collaretto.order_commessa,
                 "style": order_style,
                 "itemType": first_collaretto.item_type,
-                "typeLabel": type_label,
+                "typeLabel": type_label(first_collaretto.item_type),
                 "fabricType": first_collaretto.fabric_type,
                 "fabricCode": first_collaretto.fabric_code,
                 "fabricColor": first_collaretto.fabric_color,
@@ -1604,119 +1364,28 @@ class GetCollarettoDetails(Resource):
 @collaretto_api.route('/logistic/update_collaretto_details', methods=['PUT'])
 class UpdateCollarettoDetails(Resource):
     def put(self):
-        """Update collaretto details from the configuration screen"""
+        """Update collaretto details from the configuration screen.
+
+        Rows carrying the 'version' returned by collaretto_details_by_batch are rejected
+        with 409 (and nothing is saved) if someone else saved them in the meantime.
+        """
         try:
             data = request.get_json()
             rows = data.get('rows', [])
 
             print(f"🔄 Updating {len(rows)} collaretto rows")
 
-            for row in rows:
-                row_id = row.get('rowId')
-
-                # Find the collaretto by row_id
-                collaretto = Collaretto.query.filter_by(row_id=row_id).first()
-
-                if not collaretto:
-                    print(f"⚠️ Collaretto not found for row_id: {row_id}")
-                    continue
-
-                # Get the detail
-                detail = CollarettoDetail.query.filter_by(collaretto_id=collaretto.id).first()
-
-                if not detail:
-                    print(f"⚠️ Detail not found for collaretto_id: {collaretto.id}")
-                    continue
-
-                # Update detail fields
-                detail.pieces = row.get('pieces', detail.pieces)
-                detail.usable_width = row.get('usableWidth', detail.usable_width)
-                detail.gross_length = row.get('grossLength', detail.gross_length)
-                detail.roll_width = row.get('rollWidth', detail.roll_width)
-                detail.pcs_seam = row.get('pcsSeam', detail.pcs_seam)
-                detail.scrap_rolls = row.get('scrapRolls', detail.scrap_rolls)
-                detail.rolls_planned = row.get('rollsPlanned', detail.rolls_planned)
-
-                # Convert rolls_actual to float if it's a string
-                rolls_actual_value = row.get('rollsActual', detail.rolls_actual)
-                if rolls_actual_value == '' or rolls_actual_value is None:
-                    detail.rolls_actual = None
-                else:
-                    detail.rolls_actual = float(rolls_actual_value) if isinstance(rolls_actual_value, str) else rolls_actual_value
-
-                detail.cons_planned = row.get('consPlanned', detail.cons_planned)
-                detail.extra = row.get('extra', detail.extra)
-                detail.applicable_sizes = row.get('applicableSizes', detail.applicable_sizes)
-
-                # Calculate total_collaretto if not provided or if it's null
-                # Formula: total_collaretto = pieces * gross_length
-                total_collaretto_from_request = row.get('totalCollaretto')
-                if total_collaretto_from_request is not None and total_collaretto_from_request != '':
-                    detail.total_collaretto = total_collaretto_from_request
-                elif detail.pieces and detail.gross_length:
-                    detail.total_collaretto = detail.pieces * detail.gross_length
-                    print(f"📐 Calculated total_collaretto: {detail.pieces} * {detail.gross_length} = {detail.total_collaretto}")
-                else:
-                    detail.total_collaretto = None
-
-                # Calculate cons_actual based on item type
-                # Get the collaretto to check item_type
-                item_type = collaretto.item_type if collaretto else None
-
-                print(f"🔍 Calculating cons_actual for item_type={item_type}")
-                print(f"   rolls_actual={detail.rolls_actual}, pieces={detail.pieces}, pcs_seam={detail.pcs_seam}")
-                print(f"   gross_length={detail.gross_length}, extra={detail.extra}")
-
-                if detail.rolls_actual and detail.rolls_actual > 0:
-                    if item_type == 'CA':
-                        # Along: cons_actual = total_collaretto / rolls_actual
-                        if detail.total_collaretto and detail.total_collaretto > 0:
-                            detail.cons_actual = round(detail.total_collaretto / detail.rolls_actual, 2)
-                            print(f"✅ Along cons_actual = {detail.total_collaretto} / {detail.rolls_actual} = {detail.cons_actual}")
-                        else:
-                            detail.cons_actual = None
-                            print(f"⚠️ cons_actual set to None (missing total_collaretto)")
-                    elif item_type in ['CW', 'CB']:
-                        # Weft/Bias: cons_actual = panels_actual * rewoundWidth
-                        # panels_actual = (pieces * (1 + extra/100)) / (rolls_actual * pcs_seam)
-                        # rewoundWidth is stored in MattressDetail.length_mattress
-
-                        # Fetch rewoundWidth from MattressDetail
-                        rewound_width = None
-                        if detail.mattress_id:
-                            mattress_detail = MattressDetail.query.filter_by(mattress_id=detail.mattress_id).first()
-                            if mattress_detail:
-                                rewound_width = mattress_detail.length_mattress
-
-                        print(f"   rewound_width from mattress={rewound_width}")
-
-                        if detail.pieces and detail.pcs_seam and rewound_width:
-                            extra_percent = (detail.extra or 0) / 100
-                            panels_calculation = (detail.pieces * (1 + extra_percent)) / (detail.rolls_actual * detail.pcs_seam)
-
-                            # Apply rounding logic: if decimal > 0.15, ceil, else floor
-                            decimal_part = panels_calculation - int(panels_calculation)
-                            panels_actual = int(panels_calculation) + 1 if decimal_part > 0.15 else int(panels_calculation)
-
-                            # Use rewoundWidth from MattressDetail and round to 2 decimals
-                            detail.cons_actual = round(panels_actual * rewound_width, 2)
-                            print(f"✅ Weft/Bias panels_actual = {panels_actual}, cons_actual = {panels_actual} * {rewound_width} = {detail.cons_actual}")
-                        else:
-                            detail.cons_actual = None
-                            print(f"⚠️ cons_actual set to None (missing pieces, pcs_seam, or rewound_width)")
-                    else:
-                        detail.cons_actual = None
-                        print(f"⚠️ Unknown item_type: {item_type}")
-                else:
-                    detail.cons_actual = None
-                    print(f"⚠️ cons_actual set to None (missing or zero rolls_actual)")
+            versions, stale = update_collaretto_details(rows)
+            if stale:
+                return {
+                    "success": False,
+                    "msg": "These collaretto rows were changed by someone else. Reload them before saving.",
+                    "versions": stale
+                }, 409
 
-                detail.updated_at = datetime.now()
-
-            db.session.commit()
             print("✅ Collaretto details updated successfully")
 
-            return {"success": True, "message": "Collaretto details updated successfully"}, 200
+            return {"success": True, "message": "Collaretto details updated successfully", "versions": versions}, 200
 
         except Exception as e:
             db.session.rollback()
@@ -7,6 +7,7 @@ import json
 import re
 import pyodbc
 from api.models import db, Users, EmailSettings
+from api.reference_data import get_reference, etag_response, invalidate_reference
 
 # Create Blueprint
 config_management_bp = Blueprint('config_management', __name__)
@@ -688,40 +689,36 @@ def generate_branding_config_file_content(data):
     return "\n".join(lines)
 
 
+def read_production_center_config():
+    """Parse the production center configuration file, None if it does not exist"""
+    if not os.path.exists(REACT_CONFIG_PATH):
+        return None
+
+    with open(REACT_CONFIG_PATH, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    # Parse all configuration sections
+    return {
+        "productionCenters": parse_js_object(content, 'PRODUCTION_CENTERS'),
+        "cuttingRooms": parse_js_object(content, 'CUTTING_ROOMS'),
+        "destinations": parse_js_object(content, 'DESTINATIONS'),
+        "productionCenterCuttingRooms": parse_js_array_object(content, 'PRODUCTION_CENTER_CUTTING_ROOMS'),
+        "cuttingRoomDestinations": parse_js_array_object(content, 'CUTTING_ROOM_DESTINATIONS'),
+        "combinationKeys": parse_combination_keys(content),
+        "cuttingRoomColors": parse_cutting_room_colors(content),
+        "machineSpecifications": parse_machine_specifications(content)
+    }
+
 @config_management_api.route('/get')
 class GetConfiguration(Resource):
     def get(self):
-        """Get the current production center configuration"""
+        """Get the current production center configuration (cached, with ETag)"""
         try:
-            if not os.path.exists(REACT_CONFIG_PATH):
+            etag, data = get_reference('production_center_config')
+            if data is None:
                 return {"success": False, "msg": "Configuration file not found"}, 404
 
-            with open(REACT_CONFIG_PATH, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            # Parse all configuration sections
-            production_centers = parse_js_object(content, 'PRODUCTION_CENTERS')
-            cutting_rooms = parse_js_object(content, 'CUTTING_ROOMS')
-            destinations = parse_js_object(content, 'DESTINATIONS')
-            production_center_cutting_rooms = parse_js_array_object(content, 'PRODUCTION_CENTER_CUTTING_ROOMS')
-            cutting_room_destinations = parse_js_array_object(content, 'CUTTING_ROOM_DESTINATIONS')
-            combination_keys = parse_combination_keys(content)
-            cutting_room_colors = parse_cutting_room_colors(content)
-            machine_specifications = parse_machine_specifications(content)
-
-            return {
-                "success": True,
-                "data": {
-                    "productionCenters": production_centers,
-                    "cuttingRooms": cutting_rooms,
-                    "destinations": destinations,
-                    "productionCenterCuttingRooms": production_center_cutting_rooms,
-                    "cuttingRoomDestinations": cutting_room_destinations,
-                    "combinationKeys": combination_keys,
-                    "cuttingRoomColors": cutting_room_colors,
-                    "machineSpecifications": machine_specifications
-                }
-            }, 200
+            return etag_response(etag, lambda: {"success": True, "data": data})
 
         except Exception as e:
             return {"success": False, "msg": str(e)}, 500
@@ -740,6 +737,9 @@ class SaveConfiguration(Resource):
             with open(REACT_CONFIG_PATH, 'w', encoding='utf-8') as f:
                 f.write(config_content)
 
+            # Workers reload the cached configuration on their next request
+            invalidate_reference('production_center_config')
+
             return {"success": True, "msg": "Configuration saved successfully"}, 200
 
         except Exception as e:
@@ -6,6 +6,7 @@ from api.models import (
     db, Mattresses, MarkerHeader, MattressProductionCenter,
     OrderLinesView, MattressDetail, MattressMarker, MattressPhase, MattressSize, ZalliItemsView, WipMasterReport, NavRoutingSewingSMV, OrderRatio
 )
+from api.order_side_data import order_styles
 
 # Create Blueprint and API instance
 dashboard_bp = Blueprint('dashboard', __name__)
@@ -1132,29 +1133,19 @@ class MetersRawData(Resource):
             # Execute query
             results = base_query.all()
 
-            # Get style info for each order
-            order_styles = {}
-            for row in results:
-                if row.order_commessa not in order_styles:
-                    style_info = db.session.query(
-                        OrderLinesView.style
-                    ).filter(
-                        OrderLinesView.order_commessa == row.order_commessa
-                    ).first()
-                    order_styles[row.order_commessa] = style_info.style if style_info else None
-
-            # Build mattress data
-            mattress_data = []
-            for row in results:
-                mattress_data.append({
-                    'mattress_id': row.id,
-                    'order_commessa': row.order_commessa,
-                    'cons_actual': float(row.cons_actual or 0),
-                    'completed_date': row.updated_at.strftime('%Y-%m-%d %H:%M:%S') if row.updated_at else None,
-                    'cutting_room': row.cutting_room,
-                    'style': order_styles.get(row.order_commessa),
-                    'fabric_code': row.fabric_code
-                })
+            # Style of every order in one lookup
+            styles = order_styles({row.order_commessa for row in results})
+
+            # Build mattress data (completed_date is formatted by output_json)
+            mattress_data = [{
+                'mattress_id': row.id,
+                'order_commessa': row.order_commessa,
+                'cons_actual': float(row.cons_actual or 0),
+                'completed_date': row.updated_at,
+                'cutting_room': row.cutting_room,
+                'style': styles.get(row.order_commessa),
+                'fabric_code': row.fabric_code
+            } for row in results]
 
             return {
                 "success": True,
@@ -1,6 +1,6 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint
 from flask_restx import Namespace, Resource
-from api.models import ZalliItemsView, ItemDescriptions
+from api.reference_data import get_reference, etag_response
 
 zalli_bp = Blueprint("zalli", __name__)
 zalli_api = Namespace("zalli", description="Zalli Items API")
@@ -8,10 +8,10 @@ zalli_api = Namespace("zalli", description="Zalli Items API")
 @zalli_api.route("/items")
 class ZalliItemsResource(Resource):
     def get(self):
-        """Fetch all items from the Zalli view"""
+        """Fetch all items from the Zalli view (cached, with ETag)"""
         try:
-            items = ZalliItemsView.query.all()
-            return jsonify([item.to_dict() for item in items])
+            etag, items = get_reference('brands')
+            return etag_response(etag, lambda: items)
         except Exception as e:
             return {"success": False, "msg": str(e)}, 500
 
@@ -20,9 +20,9 @@ class ZalliGetBrandResource(Resource):
     def get(self, style_code):
         """Fetch the brand by style_code (item_no)"""
         try:
-            item = ZalliItemsView.query.filter_by(item_no=style_code).first()
-            if item:
-                return {"success": True, "brand": item.brand}
+            _, brands = get_reference('brand_index')
+            if style_code.upper() in brands:
+                return {"success": True, "brand": brands[style_code.upper()]}
             else:
                 return {"success": False, "msg": "Style not found"}
         except Exception as e:
@@ -31,17 +31,12 @@ class ZalliGetBrandResource(Resource):
 @zalli_api.route("/item-descriptions")
 class ItemDescriptionsResource(Resource):
     def get(self):
-        """Fetch all distinct Item Descriptions (Code and Description)"""
+        """Fetch all distinct Item Descriptions (Code and Description), cached with ETag"""
         try:
-            # Query distinct values as specified in the SQL
-            items = ItemDescriptions.query.filter(
-                ItemDescriptions.Code.isnot(None),
-                ItemDescriptions.Description.isnot(None)
-            ).distinct().all()
-
-            return {
+            etag, items = get_reference('item_descriptions')
+            return etag_response(etag, lambda: {
                 "success": True,
-                "data": [item.to_dict() for item in items]
-            }
+                "data": items
+            })
         except Exception as e:
             return {"success": False, "msg": str(e)}, 500
\ No newline at end of file
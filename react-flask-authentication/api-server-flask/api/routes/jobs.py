@@ -0,0 +1,80 @@
+from flask import Blueprint, request
+from flask_restx import Namespace, Resource
+
+from api import job_kinds  # registers the job kinds
+from api.jobs import submit, get_job, list_jobs, cancel, job_kinds as registered_kinds, FINISHED
+from api.routes.auth import token_required
+
+jobs_bp = Blueprint('jobs', __name__)
+jobs_api = Namespace('jobs', description="Background jobs for long reports, imports and syncs")
+
+MAX_LIST_LIMIT = 200
+
+# Kinds that change data outside the app's own screens: only these roles may queue them
+KIND_ROLES = {'ops_script': ('Administrator', 'Project Admin')}
+
+
+@jobs_api.route('')
+class Jobs(Resource):
+    def get(self):
+        """Recent jobs (without results), optionally filtered by kind and status"""
+        try:
+            limit = min(request.args.get('limit', 50, type=int), MAX_LIST_LIMIT)
+            data = list_jobs(kind=request.args.get('kind'), status=request.args.get('status'), limit=limit)
+            return {"success": True, "data": data}, 200
+        except Exception as e:
+            return {"success": False, "msg": str(e)}, 500
+
+    @token_required
+    def post(current_user, self):  # token_required passes the user ahead of the resource
+        """Queue a job: {"kind", "params"}; poll GET /api/jobs/<id> for its result"""
+        try:
+            data = request.get_json() or {}
+            if not data.get('kind'):
+                return {"success": False, "msg": "kind is required"}, 400
+            allowed_roles = KIND_ROLES.get(data['kind'])
+            if allowed_roles and current_user.role not in allowed_roles:
+                return {"success": False, "msg": f"Role {current_user.role} cannot run {data['kind']} jobs"}, 403
+            queued = submit(data['kind'], data.get('params'), submitted_by=current_user.username)
+            print(f"📥 Job {queued['kind']} {queued['id']} queued")
+            return {"success": True, "data": queued}, 202
+        except ValueError as e:
+            return {"success": False, "msg": str(e)}, 400
+        except Exception as e:
+            return {"success": False, "msg": str(e)}, 500
+
+
+@jobs_api.route('/kinds')
+class JobKinds(Resource):
+    def get(self):
+        return {"success": True, "data": registered_kinds()}, 200
+
+
+@jobs_api.route('/<string:job_id>')
+class JobStatus(Resource):
+    def get(self, job_id):
+        """Status and progress of a job; its result once done"""
+        try:
+            found = get_job(job_id)
+            if found is None:
+                return {"success": False, "msg": "Job not found (finished jobs are kept for a limited time)"}, 404
+            return {"success": True, "data": found}, 200
+        except Exception as e:
+            return {"success": False, "msg": str(e)}, 500
+
+
+@jobs_api.route('/<string:job_id>/cancel')
+class CancelJob(Resource):
+    @token_required
+    def post(current_user, self, job_id):  # token_required passes the user ahead of the resource
+        """Cancel a job that has not started yet"""
+        try:
+            if cancel(job_id):
+                return {"success": True, "msg": "Job cancelled"}, 200
+            found = get_job(job_id, with_result=False)
+            if found is None:
+                return {"success": False, "msg": "Job not found"}, 404
+            state = "already finished" if found['status'] in FINISHED else "already running"
+            return {"success": False, "msg": f"Job {state}, it can no longer be cancelled"}, 409
+        except Exception as e:
+            return {"success": False, "msg": str(e)}, 500
@@ -1,33 +1,15 @@
 from flask import Blueprint, request, jsonify
-from api.models import MarkerCalculatorData, MarkerCalculatorMarker, MarkerCalculatorQuantity, db
+from api.models import MarkerCalculatorData, MarkerCalculatorMarker, MarkerCalculatorQuantity, MarkerHeader, MarkerLine, OrderLinesView, db
+from api.transactions import transactional, retryable_error
 from flask_restx import Namespace, Resource
-from sqlalchemy.exc import IntegrityError, OperationalError
-import time
+from sqlalchemy import bindparam
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 import traceback
 
 marker_calculator_bp = Blueprint('marker_calculator_bp', __name__)
 marker_calculator_api = Namespace('marker_calculator', description="Marker Calculator Data Management")
 
-def retry_on_deadlock(func, max_retries=3, delay=1):
-    """Retry function on deadlock errors"""
-    for attempt in range(max_retries):
-        try:
-            return func()
-        except OperationalError as e:
-            # Check if it's a deadlock error (SQL Server error 1205)
-            if '1205' in str(e) or 'deadlock' in str(e).lower():
-                if attempt < max_retries - 1:
-                    print(f"Deadlock detected, retrying in {delay * (attempt + 1)} seconds... (attempt {attempt + 1}/{max_retries})")
-                    time.sleep(delay * (attempt + 1))  # Exponential backoff
-                    continue
-                else:
-                    raise Exception(f"Operation failed after {max_retries} attempts due to deadlock")
-            else:
-                raise
-        except Exception as e:
-            raise
-    return None
-
 def generate_marker_name(marker_data, style):
     """Generate a marker name based on style and quantities"""
     quantities = marker_data.get('quantities', {})
@@ -50,10 +32,26 @@ def generate_marker_name(marker_data, style):
         # Return empty string if no quantities (matching client-side behavior)
         return ""
 
+def parse_quantities(marker_data):
+    """Return {size: int quantity} for a submitted marker, skipping invalid values"""
+    quantities = {}
+    for size, quantity in (marker_data.get('quantities') or {}).items():
+        try:
+            quantities[size] = int(quantity) if quantity != '' else 0
+        except (ValueError, TypeError):
+            continue
+    return quantities
+
 @marker_calculator_api.route('/save', methods=['POST'])
 class SaveCalculatorData(Resource):
     def post(self):
-        """Save calculator data for a specific table and order"""
+        """Save calculator data for a specific table and order.
+
+        Markers are matched to the saved ones by position, and only changed markers
+        and quantities are written, with one executemany per table and operation.
+        If the payload carries the 'version' returned by /load and the tab was saved
+        by someone else in the meantime, the save is rejected with 409.
+        """
         try:
             data = request.get_json()
 
@@ -69,34 +67,7 @@ class SaveCalculatorData(Resource):
             selected_baseline = data['selected_baseline']
             style = data.get('style', 'STYLE')  # Default to 'STYLE' if not provided
             markers_data = data['markers']
-
-            # Check if calculator data already exists for this order, combination and tab
-            existing_data = MarkerCalculatorData.query.filter_by(
-                order_commessa=order_commessa,
-                combination_id=combination_id,
-                tab_number=tab_number
-            ).first()
-
-            if existing_data:
-                # Update existing data
-                existing_data.selected_baseline = selected_baseline
-                calculator_data = existing_data
-
-                # Delete existing markers and quantities
-                for marker in existing_data.markers:
-                    db.session.delete(marker)
-            else:
-                # Create new calculator data
-                calculator_data = MarkerCalculatorData(
-                    order_commessa=order_commessa,
-                    combination_id=combination_id,
-                    tab_number=tab_number,
-                    selected_baseline=selected_baseline
-                )
-                db.session.add(calculator_data)
-
-            # Flush to get the ID
-            db.session.flush()
+            expected_version = data.get('version')
 
             # Check for duplicate marker names before saving
             marker_names = [marker_data.get('marker_name', '').strip() for marker_data in markers_data]
@@ -105,45 +76,139 @@ class SaveCalculatorData(Resource):
             if len(marker_names) != len(set(name.lower() for name in marker_names)):
                 return {"success": False, "message": "Duplicate marker names are not allowed within the same calculator"}, 400
 
-            # Save markers and quantities
-            for index, marker_data in enumerate(markers_data):
-                marker_name = marker_data.get('marker_name', '').strip()
-
-                # Use default name if empty - generate based on style and quantities
-                if not marker_name:
-                    marker_name = generate_marker_name(marker_data, style)
-
-                marker = MarkerCalculatorMarker(
-                    calculator_data_id=calculator_data.id,
-                    marker_name=marker_name,
-                    marker_width=marker_data.get('marker_width'),
-                    layers=marker_data.get('layers', 1)
-                )
-                db.session.add(marker)
-                db.session.flush()  # Get marker ID
-
-                # Save quantities for this marker
-                quantities = marker_data.get('quantities', {})
-                for size, quantity in quantities.items():
-                    # Save all quantities (including zeros) for completeness
-                    try:
-                        quantity_value = int(quantity) if quantity != '' else 0
-                        quantity_record = MarkerCalculatorQuantity(
-                            marker_id=marker.id,
-                            size=size,
-                            quantity=quantity_value
-                        )
-                        db.session.add(quantity_record)
-                    except (ValueError, TypeError):
-                        # Skip invalid quantity values
+            # The whole save runs again if SQL Server picks it as a deadlock victim
+            @transactional
+            def save_operation():
+                # Check if calculator data already exists for this order, combination and tab
+                existing_data = MarkerCalculatorData.query.options(
+                    selectinload(MarkerCalculatorData.markers).selectinload(MarkerCalculatorMarker.quantities)
+                ).filter_by(
+                    order_commessa=order_commessa,
+                    combination_id=combination_id,
+                    tab_number=tab_number
+                ).first()
+
+                if existing_data:
+                    if expected_version is not None and int(expected_version) != existing_data.version:
+                        return {
+                            "success": False,
+                            "message": "This calculator tab was changed by someone else. Reload it before saving.",
+                            "version": existing_data.version
+                        }, 409
+
+                    # Claim the next version atomically so a concurrent save cannot slip in between
+                    claimed = MarkerCalculatorData.query.filter(
+                        MarkerCalculatorData.id == existing_data.id,
+                        MarkerCalculatorData.version == existing_data.version
+                    ).update({
+                        MarkerCalculatorData.version: MarkerCalculatorData.version + 1,
+                        MarkerCalculatorData.selected_baseline: selected_baseline
+                    }, synchronize_session=False)
+
+                    if not claimed:
+                        db.session.rollback()
+                        return {
+                            "success": False,
+                            "message": "This calculator tab was changed by someone else. Reload it before saving."
+                        }, 409
+
+                    calculator_data = existing_data
+                    existing_markers = list(existing_data.markers)
+                else:
+                    # Create new calculator data
+                    calculator_data = MarkerCalculatorData(
+                        order_commessa=order_commessa,
+                        combination_id=combination_id,
+                        tab_number=tab_number,
+                        selected_baseline=selected_baseline,
+                        version=1
+                    )
+                    db.session.add(calculator_data)
+                    db.session.flush()  # Get the ID
+                    existing_markers = []
+
+                # Diff submitted markers against the saved ones (matched by position)
+                marker_updates = []
+                quantity_updates = []
+                quantity_inserts = []
+                quantity_deletes = []
+                new_markers = []
+
+                for index, marker_data in enumerate(markers_data):
+                    marker_name = marker_data.get('marker_name', '').strip()
+
+                    # Use default name if empty - generate based on style and quantities
+                    if not marker_name:
+                        marker_name = generate_marker_name(marker_data, style)
+
+                    values = {
+                        "marker_name": marker_name,
+                        "marker_width": marker_data.get('marker_width'),
+                        "layers": marker_data.get('layers', 1)
+                    }
+                    quantities = parse_quantities(marker_data)
+
+                    if index >= len(existing_markers):
+                        new_markers.append((values, quantities))
                         continue
 
-            def commit_operation():
-                db.session.commit()
+                    marker = existing_markers[index]
+                    if (marker.marker_name, marker.marker_width, marker.layers) != (values['marker_name'], values['marker_width'], values['layers']):
+                        marker_updates.append({"b_id": marker.id, **values})
+
+                    saved_quantities = {quantity.size: quantity for quantity in marker.quantities}
+                    for size, quantity_value in quantities.items():
+                        saved = saved_quantities.pop(size, None)
+                        if saved is None:
+                            quantity_inserts.append({"marker_id": marker.id, "size": size, "quantity": quantity_value})
+                        elif saved.quantity != quantity_value:
+                            quantity_updates.append({"b_id": saved.id, "quantity": quantity_value})
+                    # Sizes no longer submitted
+                    quantity_deletes.extend(saved.id for saved in saved_quantities.values())
+
+                removed_marker_ids = [marker.id for marker in existing_markers[len(markers_data):]]
+
+                marker_table = MarkerCalculatorMarker.__table__
+                quantity_table = MarkerCalculatorQuantity.__table__
+
+                if removed_marker_ids:
+                    db.session.execute(quantity_table.delete().where(quantity_table.c.marker_id.in_(removed_marker_ids)))
+                    db.session.execute(marker_table.delete().where(marker_table.c.id.in_(removed_marker_ids)))
+
+                if quantity_deletes:
+                    db.session.execute(quantity_table.delete().where(quantity_table.c.id.in_(quantity_deletes)))
+
+                if marker_updates:
+                    db.session.execute(
+                        marker_table.update().where(marker_table.c.id == bindparam('b_id')),
+                        marker_updates
+                    )
+
+                if quantity_updates:
+                    db.session.execute(
+                        quantity_table.update().where(quantity_table.c.id == bindparam('b_id')),
+                        quantity_updates
+                    )
+
+                # One INSERT per new marker: its ID comes from its own statement, never from
+                # reading back the latest IDs (another worker may insert markers meanwhile)
+                for values, quantities in new_markers:
+                    marker_id = db.session.execute(
+                        marker_table.insert().values(calculator_data_id=calculator_data.id, **values)
+                    ).inserted_primary_key[0]
+                    quantity_inserts.extend(
+                        {"marker_id": marker_id, "size": size, "quantity": quantity_value}
+                        for size, quantity_value in quantities.items()
+                    )
+
+                if quantity_inserts:
+                    db.session.execute(quantity_table.insert(), quantity_inserts)
+
                 return calculator_data
 
-            # Execute commit with deadlock retry
-            result_data = retry_on_deadlock(commit_operation)
+            result_data = save_operation()
+            if isinstance(result_data, tuple):
+                return result_data  # 409, the tab was saved by someone else
 
             return {
                 "success": True,
@@ -161,7 +226,7 @@ class SaveCalculatorData(Resource):
             print(traceback.format_exc())
 
             # Check if it's a deadlock error and provide user-friendly message
-            if '1205' in error_msg or 'deadlock' in error_msg.lower():
+            if retryable_error(e):
                 return {"success": False, "message": "Database is busy, please try again in a moment."}, 503
             else:
                 return {"success": False, "message": f"Error saving calculator data: {error_msg}"}, 500
@@ -171,49 +236,62 @@ class LoadCalculatorData(Resource):
     def get(self, order_commessa, combination_id):
         """Load calculator data for all tabs of a specific order and combination"""
         try:
-            # Find all calculator data for this order and combination
-            calculator_data_list = MarkerCalculatorData.query.filter_by(
-                order_commessa=order_commessa,
-                combination_id=combination_id
-            ).all()
-
-            if not calculator_data_list:
+            # Find all calculator data for this order and combination, with markers and
+            # quantities loaded in two extra queries regardless of the number of markers.
+            # SNAPSHOT: the three queries see the same committed state (versions match their
+            # markers) and do not wait behind a save holding locks on these tables.
+            # The tabs are built inside the unit of work: the commit expires the loaded objects
+            @transactional(isolation='SNAPSHOT')
+            def load_operation():
+                calculator_data_list = MarkerCalculatorData.query.options(
+                    selectinload(MarkerCalculatorData.markers).selectinload(MarkerCalculatorMarker.quantities)
+                ).filter_by(
+                    order_commessa=order_commessa,
+                    combination_id=combination_id
+                ).all()
+
+                # Build response with data organized by tab
+                tabs_data = {}
+
+                for calculator_data in calculator_data_list:
+                    # Build markers for this tab
+                    markers = []
+                    for marker in calculator_data.markers:
+                        quantities = {}
+                        for quantity in marker.quantities:
+                            quantities[quantity.size] = quantity.quantity
+
+                        markers.append({
+                            "id": marker.id,
+                            "marker_name": marker.marker_name,
+                            "marker_width": marker.marker_width,
+                            "layers": marker.layers,
+                            "quantities": quantities
+                        })
+
+                    # Store tab data
+                    tabs_data[calculator_data.tab_number] = {
+                        "id": calculator_data.id,
+                        "order_commessa": calculator_data.order_commessa,
+                        "tab_number": calculator_data.tab_number,
+                        "selected_baseline": calculator_data.selected_baseline,
+                        "version": calculator_data.version,
+                        "markers": markers,
+                        "created_at": calculator_data.created_at.isoformat() if calculator_data.created_at else None,
+                        "updated_at": calculator_data.updated_at.isoformat() if calculator_data.updated_at else None
+                    }
+
+                return tabs_data
+
+            tabs_data = load_operation()
+
+            if not tabs_data:
                 return {
                     "success": True,
                     "message": "No calculator data found",
                     "data": {}
                 }, 200
 
-            # Build response with data organized by tab
-            tabs_data = {}
-
-            for calculator_data in calculator_data_list:
-                # Build markers for this tab
-                markers = []
-                for marker in calculator_data.markers:
-                    quantities = {}
-                    for quantity in marker.quantities:
-                        quantities[quantity.size] = quantity.quantity
-
-                    markers.append({
-                        "id": marker.id,
-                        "marker_name": marker.marker_name,
-                        "marker_width": marker.marker_width,
-                        "layers": marker.layers,
-                        "quantities": quantities
-                    })
-
-                # Store tab data
-                tabs_data[calculator_data.tab_number] = {
-                    "id": calculator_data.id,
-                    "order_commessa": calculator_data.order_commessa,
-                    "tab_number": calculator_data.tab_number,
-                    "selected_baseline": calculator_data.selected_baseline,
-                    "markers": markers,
-                    "created_at": calculator_data.created_at.isoformat() if calculator_data.created_at else None,
-                    "updated_at": calculator_data.updated_at.isoformat() if calculator_data.updated_at else None
-                }
-
             return {
                 "success": True,
                 "message": "Calculator data loaded successfully",
@@ -223,6 +301,8 @@ class LoadCalculatorData(Resource):
         except Exception as e:
             print(f"Error loading calculator data: {str(e)}")
             print(traceback.format_exc())
+            if retryable_error(e):
+                return {"success": False, "message": "Database is busy, please try again in a moment."}, 503
             return {"success": False, "message": f"Error loading calculator data: {str(e)}"}, 500
 
 @marker_calculator_api.route('/delete/<order_commessa>/<combination_id>/<tab_number>', methods=['DELETE'])
@@ -256,6 +336,142 @@ class DeleteCalculatorData(Resource):
             print(traceback.format_exc())
             return {"success": False, "message": f"Error deleting calculator data: {str(e)}"}, 500
 
+def normalize_size(size):
+    """Normalize size labels so order sizes and marker sizes match ('3-4' -> '3_4')"""
+    if not size:
+        return size
+    return size.replace('-', '_')
+
+@marker_calculator_api.route('/optimize', methods=['POST'])
+class OptimizeMarkerMix(Resource):
+    def post(self):
+        """Suggest markers and layers that cover an order's quantities with the least fabric and overcut.
+
+        Body:
+        - order_commessa: order to plan (required)
+        - style: marker model filter (default: the order's style)
+        - quantities: optional {size: pieces} overriding the order quantities
+        - marker_width: optional width; matches markers from width to width + 0.9
+        - fabric_type: optional fabric type filter
+        - marker_ids: optional explicit list of candidate marker IDs
+        - extra: spreading extra per layer (default 0)
+        - time_budget_ms: search time budget (default 1500, max 10000)
+        - max_iterations, max_layers, max_markers, overcut_weight, seed: solver tuning
+        """
+        try:
+            data = request.get_json() or {}
+            order_commessa = data.get('order_commessa')
+
+            if not order_commessa:
+                return {"success": False, "message": "Missing required field: order_commessa"}, 400
+
+            order_lines = db.session.query(
+                OrderLinesView.size, OrderLinesView.quantity, OrderLinesView.style
+            ).filter(OrderLinesView.order_commessa == order_commessa).all()
+
+            style = data.get('style') or (order_lines[0].style if order_lines else None)
+            if not style:
+                return {"success": False, "message": f"No order lines found for order {order_commessa}"}, 404
+
+            # Demand keyed by the order's size labels
+            quantities = data.get('quantities')
+            if quantities:
+                demand = {size: float(qty or 0) for size, qty in quantities.items()}
+            else:
+                demand = {}
+                for line in order_lines:
+                    demand[line.size] = demand.get(line.size, 0) + float(line.quantity or 0)
+
+            size_labels = {normalize_size(size): size for size in demand}
+
+            # Candidate markers: ACTIVE markers for the style (or the explicit list)
+            query = MarkerHeader.query
+            if data.get('marker_ids'):
+                query = query.filter(MarkerHeader.id.in_(data['marker_ids']))
+            else:
+                query = query.filter(
+                    MarkerHeader.status == 'ACTIVE',
+                    MarkerHeader.model.ilike(f"%{style}%")
+                )
+            if data.get('marker_width'):
+                base_width = int(float(data['marker_width']))
+                query = query.filter(
+                    MarkerHeader.marker_width >= base_width,
+                    MarkerHeader.marker_width < base_width + 1
+                )
+            if data.get('fabric_type'):
+                query = query.filter(MarkerHeader.fabric_type == data['fabric_type'])
+
+            headers = query.all()
+            header_ids = [header.id for header in headers]
+
+            # Load all marker lines in one query
+            lines_by_marker = {}
+            if header_ids:
+                lines = db.session.query(
+                    MarkerLine.marker_header_id, MarkerLine.size, MarkerLine.pcs_on_layer
+                ).filter(MarkerLine.marker_header_id.in_(header_ids)).all()
+                for marker_header_id, size, pcs_on_layer in lines:
+                    lines_by_marker.setdefault(marker_header_id, []).append((size, pcs_on_layer))
+
+            candidates = []
+            for header in headers:
+                size_quantities = {}
+                fits_order = True
+                for size, pcs_on_layer in lines_by_marker.get(header.id, []):
+                    label = size_labels.get(normalize_size(size))
+                    if label is None:
+                        # Marker cuts a size the order does not have
+                        fits_order = False
+                        break
+                    size_quantities[label] = size_quantities.get(label, 0) + (pcs_on_layer or 0)
+
+                if fits_order and size_quantities:
+                    candidates.append({
+                        "id": header.id,
+                        "marker_name": header.marker_name,
+                        "marker_width": header.marker_width,
+                        "marker_length": header.marker_length,
+                        "efficiency": header.efficiency,
+                        "size_quantities": size_quantities
+                    })
+
+            if not candidates:
+                return {"success": False, "message": f"No usable markers found for style {style}"}, 404
+
+            time_budget_ms = min(int(data.get('time_budget_ms', 1500)), 10000)
+
+            # Imported on first use: numpy is not loaded at worker boot
+            from api.marker_optimizer import optimize_marker_mix
+            result = optimize_marker_mix(
+                demand,
+                candidates,
+                time_budget=time_budget_ms / 1000.0,
+                max_iterations=data.get('max_iterations'),
+                max_layers=data.get('max_layers'),
+                max_markers=data.get('max_markers'),
+                extra=float(data.get('extra') or 0),
+                overcut_weight=float(data.get('overcut_weight', 1.0)),
+                seed=int(data.get('seed', 0))
+            )
+
+            return {
+                "success": True,
+                "message": "Marker mix calculated successfully",
+                "data": {
+                    "order_commessa": order_commessa,
+                    "style": style,
+                    **result
+                }
+            }, 200
+
+        except (ValueError, TypeError) as e:
+            return {"success": False, "message": f"Invalid optimizer parameters: {str(e)}"}, 400
+        except Exception as e:
+            print(f"Error optimizing marker mix: {str(e)}")
+            print(traceback.format_exc())
+            return {"success": False, "message": f"Error optimizing marker mix: {str(e)}"}, 500
+
 @marker_calculator_api.route('/test', methods=['GET'])
 class TestCalculatorTables(Resource):
     def get(self):
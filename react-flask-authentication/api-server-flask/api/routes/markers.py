@@ -2,42 +2,39 @@ from flask import Blueprint, request
 from flask_restx import Namespace, Resource
 from api.models import db, MarkerHeader, MarkerLine, MarkerLineRotation, MattressMarker, Mattresses
 from sqlalchemy import func
+from datetime import datetime, timedelta
 import json
 import xml.etree.ElementTree as ET
 import os
 import logging
+from api.serialization import row_dicts
+from api.jobs import report_progress
 
 # Create Blueprint and API instance
 markers_bp = Blueprint('markers', __name__)
 markers_api = Namespace('markers', description="Marker Management")
 
 # ===================== Marker Headers ==========================
+MARKER_HEADER_FIELDS = ('id', 'marker_name', 'marker_width', 'marker_length', 'fabric_code', 'fabric_type',
+                        'efficiency', 'total_pcs', 'creation_type', 'model', 'variant')
+
 @markers_api.route('/marker_headers', methods=['GET'])
 class MarkerHeaders(Resource):
     def get(self):
         try:
-            headers = MarkerHeader.query.filter_by(status='ACTIVE').all()
-            result = []
-            for header in headers:
-                # Check if marker is being used in any mattresses
-                usage_count = db.session.query(func.count(MattressMarker.id)).filter(
-                    MattressMarker.marker_id == header.id
-                ).scalar()
+            # Usage count of every marker in one grouped query, rows read as column tuples
+            usage_counts = db.session.query(
+                MattressMarker.marker_id, func.count(MattressMarker.id).label('usage_count')
+            ).group_by(MattressMarker.marker_id).subquery()
 
-                result.append({
-                    "id": header.id,
-                    "marker_name": header.marker_name,
-                    "marker_width": header.marker_width,
-                    "marker_length": header.marker_length,
-                    "fabric_code": header.fabric_code,
-                    "fabric_type": header.fabric_type,
-                    "efficiency": header.efficiency,
-                    "total_pcs": header.total_pcs,
-                    "creation_type": header.creation_type,
-                    "model": header.model,
-                    "variant": header.variant,
-                    "usage_count": usage_count
-                })
+            rows = db.session.query(
+                *[getattr(MarkerHeader, field) for field in MARKER_HEADER_FIELDS],
+                func.coalesce(usage_counts.c.usage_count, 0)
+            ).outerjoin(
+                usage_counts, usage_counts.c.marker_id == MarkerHeader.id
+            ).filter(MarkerHeader.status == 'ACTIVE').order_by(MarkerHeader.id).all()
+
+            result = row_dicts(MARKER_HEADER_FIELDS + ('usage_count',), rows)
 
             return {"success": True, "data": result}, 200
         except Exception as e:
@@ -252,11 +249,17 @@ class MarkerHeadersPlanning(Resource):
             # Combine both lists and remove duplicates
             all_headers = active_headers + previously_selected_headers
 
+            # ✅ Fetch Marker Lines for all headers in one query
+            lines_by_header = {}
+            header_ids = [header.id for header in all_headers]
+            if header_ids:
+                for line in MarkerLine.query.filter(MarkerLine.marker_header_id.in_(header_ids)).all():
+                    lines_by_header.setdefault(line.marker_header_id, []).append(line)
+
             result = []
 
             for header in all_headers:
-                # ✅ Fetch Marker Lines for the current header
-                marker_lines = MarkerLine.query.filter_by(marker_header_id=header.id).all()
+                marker_lines = lines_by_header.get(header.id, [])
 
                 # ✅ Extract sizes used in this marker and normalize them
                 raw_marker_sizes = set(line.size for line in marker_lines)
@@ -616,7 +619,9 @@ class BatchImportMarkers(Resource):
                 print(f"Warning: Could not convert '{value}' to float, using default {default}")
                 return default
 
-        for file in files:
+        for index, file in enumerate(files):
+            # Progress of the batch when it runs as a background job (no-op in a request)
+            report_progress(index, len(files), f"{index} of {len(files)} files")
             result = {"filename": file.filename, "success": False, "msg": ""}
 
             try:
@@ -1062,7 +1067,121 @@ class MarkerPcs(Resource):
             print(f"❌ API Error: {str(e)}")  # ✅ Debugging log
             return {"success": False, "msg": f"An unexpected error occurred: {str(e)}"}, 500
 
+# ===================== Fetch Marker Pieces (Batch) ==========================
+@markers_api.route('/marker_pcs/batch', methods=['POST'])
+class MarkerPcsBatch(Resource):
+    def post(self):
+        """Fetch marker lines for many markers at once.
+
+        Body: {"marker_names": ["NAME1", "NAME2", ...]}
+        Returns {"marker_lines": {name: [lines]}, "not_found": [names]} using one indexed query.
+        """
+        try:
+            data = request.get_json() or {}
+            marker_names = [name for name in dict.fromkeys(data.get("marker_names") or []) if name]
+
+            if not marker_names:
+                return {"success": False, "msg": "marker_names is required"}, 400
+
+            rows = db.session.query(
+                MarkerHeader.id,
+                MarkerHeader.marker_name,
+                MarkerLine.style,
+                MarkerLine.size,
+                MarkerLine.pcs_on_layer
+            ).join(
+                MarkerLine, MarkerLine.marker_header_id == MarkerHeader.id
+            ).filter(
+                MarkerHeader.marker_name.in_(marker_names)
+            ).order_by(MarkerHeader.id, MarkerLine.id).all()
+
+            # Same as /marker_pcs: use the first header found for each name
+            header_by_name = {}
+            marker_lines = {}
+            for header_id, marker_name, style, size, pcs_on_layer in rows:
+                if header_by_name.setdefault(marker_name, header_id) != header_id:
+                    continue
+                marker_lines.setdefault(marker_name, []).append({
+                    "style": style,
+                    "size": size,
+                    "pcs_on_layer": pcs_on_layer
+                })
+
+            return {
+                "success": True,
+                "marker_lines": marker_lines,
+                "not_found": [name for name in marker_names if name not in marker_lines]
+            }, 200
+
+        except Exception as e:
+            print(f"❌ API Error: {str(e)}")
+            return {"success": False, "msg": f"An unexpected error occurred: {str(e)}"}, 500
+
 # ===================== Set NOT ACTIVE ==========================
+# SQL Server allows ~2100 parameters per statement, so ID lists are processed in chunks
+MARKER_CHUNK_SIZE = 1000
+
+def chunked(ids, size=MARKER_CHUNK_SIZE):
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+def build_marker_filter(data):
+    """Build filter conditions for bulk marker operations.
+
+    Supported keys: model, model_prefix, variant, fabric_code, creation_type, status,
+    older_than_days. Returns a list of SQLAlchemy conditions (empty if no filter given).
+    """
+    conditions = []
+    if data.get('model'):
+        conditions.append(MarkerHeader.model == data['model'])
+    if data.get('model_prefix'):
+        conditions.append(MarkerHeader.model.like(f"{data['model_prefix']}%"))
+    if data.get('variant'):
+        conditions.append(MarkerHeader.variant == data['variant'])
+    if data.get('fabric_code'):
+        conditions.append(MarkerHeader.fabric_code == data['fabric_code'])
+    if data.get('creation_type'):
+        conditions.append(MarkerHeader.creation_type == data['creation_type'])
+    if data.get('status'):
+        conditions.append(MarkerHeader.status == data['status'])
+    if data.get('older_than_days') is not None:
+        cutoff = datetime.now() - timedelta(days=int(data['older_than_days']))
+        conditions.append(MarkerHeader.created_at < cutoff)
+    return conditions
+
+def deactivate_markers(marker_ids):
+    """Set markers to NOT ACTIVE with one UPDATE per chunk. Returns the number of rows changed."""
+    updated = 0
+    for chunk in chunked(marker_ids):
+        updated += MarkerHeader.query.filter(
+            MarkerHeader.id.in_(chunk),
+            MarkerHeader.status != 'NOT ACTIVE'
+        ).update({MarkerHeader.status: 'NOT ACTIVE'}, synchronize_session=False)
+    return updated
+
+def delete_markers(marker_ids):
+    """Delete markers and their children in dependency order, one DELETE per table and chunk.
+
+    References from width change and marker requests are cleared, as the ORM
+    cascade did before. Returns row counts per table.
+    """
+    from api.models import WidthChangeRequest, MarkerRequest
+
+    counts = {"rotations": 0, "lines": 0, "headers": 0}
+    for chunk in chunked(marker_ids):
+        WidthChangeRequest.query.filter(WidthChangeRequest.selected_marker_id.in_(chunk)).update(
+            {WidthChangeRequest.selected_marker_id: None}, synchronize_session=False)
+        MarkerRequest.query.filter(MarkerRequest.created_marker_id.in_(chunk)).update(
+            {MarkerRequest.created_marker_id: None}, synchronize_session=False)
+
+        counts["rotations"] += MarkerLineRotation.query.filter(
+            MarkerLineRotation.marker_header_id.in_(chunk)).delete(synchronize_session=False)
+        counts["lines"] += MarkerLine.query.filter(
+            MarkerLine.marker_header_id.in_(chunk)).delete(synchronize_session=False)
+        counts["headers"] += MarkerHeader.query.filter(
+            MarkerHeader.id.in_(chunk)).delete(synchronize_session=False)
+    return counts
+
 @markers_api.route('/set_not_active', methods=['POST'])
 class NotActive(Resource):
     def post(self):
@@ -1072,21 +1191,57 @@ class NotActive(Resource):
         if not marker_ids:
             return {"success": False, "message": "No marker IDs provided"}, 400
 
-        # ✅ Update the database
-        markers_to_update = MarkerHeader.query.filter(MarkerHeader.id.in_(marker_ids)).all()
-        for marker in markers_to_update:
-            marker.status = "NOT ACTIVE"
+        try:
+            # ✅ Update the database with set-based UPDATEs
+            updated_count = deactivate_markers(marker_ids)
+            db.session.commit()
+
+            return {"success": True, "message": "Markers updated successfully", "updated_count": updated_count}
+
+        except Exception as e:
+            db.session.rollback()
+            return {"success": False, "message": f"Error updating markers: {str(e)}"}, 500
+
+# ===================== Set NOT ACTIVE By Filter ==========================
+@markers_api.route('/set_not_active_by_filter', methods=['POST'])
+class NotActiveByFilter(Resource):
+    def post(self):
+        """Set every ACTIVE marker matching a filter to NOT ACTIVE in one statement.
+
+        Body: any of model, model_prefix, variant, fabric_code, creation_type,
+        older_than_days (at least one is required), plus dry_run to only count.
+        """
+        data = request.json or {}
+
+        try:
+            conditions = build_marker_filter(data)
+            if not conditions:
+                return {"success": False, "message": "At least one filter is required"}, 400
+
+            query = MarkerHeader.query.filter(MarkerHeader.status == 'ACTIVE', *conditions)
+
+            if data.get("dry_run"):
+                return {"success": True, "dry_run": True, "matched_count": query.count()}, 200
+
+            updated_count = query.update({MarkerHeader.status: 'NOT ACTIVE'}, synchronize_session=False)
+            db.session.commit()
 
-        db.session.commit()
+            return {
+                "success": True,
+                "message": f"Set {updated_count} marker(s) to NOT ACTIVE",
+                "updated_count": updated_count
+            }, 200
 
-        return {"success": True, "message": "Markers updated successfully"}
+        except ValueError as e:
+            return {"success": False, "message": f"Invalid filter: {str(e)}"}, 400
+        except Exception as e:
+            db.session.rollback()
+            return {"success": False, "message": f"Error updating markers: {str(e)}"}, 500
 
 # ===================== Delete Markers ==========================
 @markers_api.route('/delete', methods=['POST'])
 class DeleteMarkers(Resource):
     def post(self):
-        from api.models import MattressMarker
-
         data = request.json
         marker_ids = data.get("marker_ids", [])
 
@@ -1095,16 +1250,16 @@ class DeleteMarkers(Resource):
 
         try:
             # Check if any of the markers are used in mattress_markers table
-            used_markers = db.session.query(MattressMarker.marker_id).filter(
-                MattressMarker.marker_id.in_(marker_ids)
-            ).distinct().all()
-
-            used_marker_ids = [marker.marker_id for marker in used_markers]
+            used_marker_ids = set()
+            for chunk in chunked(marker_ids):
+                used_marker_ids.update(row.marker_id for row in db.session.query(MattressMarker.marker_id).filter(
+                    MattressMarker.marker_id.in_(chunk)
+                ).distinct().all())
 
             if used_marker_ids:
                 # Get marker names for the error message
                 used_marker_names = db.session.query(MarkerHeader.marker_name).filter(
-                    MarkerHeader.id.in_(used_marker_ids)
+                    MarkerHeader.id.in_(list(used_marker_ids)[:MARKER_CHUNK_SIZE])
                 ).all()
                 marker_names_str = ", ".join([name.marker_name for name in used_marker_names])
 
@@ -1113,24 +1268,69 @@ class DeleteMarkers(Resource):
                     "message": f"Cannot delete markers that have been used: {marker_names_str}"
                 }, 400
 
-            # If no markers are used, proceed with deletion
-            markers_to_delete = MarkerHeader.query.filter(MarkerHeader.id.in_(marker_ids)).all()
+            # If no markers are used, delete rotations, lines and headers set-based
+            counts = delete_markers(marker_ids)
 
-            if not markers_to_delete:
+            if not counts["headers"]:
+                db.session.rollback()
                 return {"success": False, "message": "No markers found to delete"}, 404
 
-            deleted_count = 0
-            for marker in markers_to_delete:
-                db.session.delete(marker)
-                deleted_count += 1
-
             db.session.commit()
 
             return {
                 "success": True,
-                "message": f"Successfully deleted {deleted_count} marker(s)"
+                "message": f"Successfully deleted {counts['headers']} marker(s)",
+                "deleted": counts
+            }, 200
+
+        except Exception as e:
+            db.session.rollback()
+            return {"success": False, "message": f"Error deleting markers: {str(e)}"}, 500
+
+# ===================== Delete Markers By Filter ==========================
+@markers_api.route('/delete_by_filter', methods=['POST'])
+class DeleteMarkersByFilter(Resource):
+    def post(self):
+        """Purge unused markers matching a filter, committing chunk by chunk to keep locks short.
+
+        Body: same filters as /set_not_active_by_filter (at least one is required),
+        plus dry_run to only count. Markers used by mattresses are always skipped.
+        """
+        data = request.json or {}
+
+        try:
+            conditions = build_marker_filter(data)
+            if not conditions:
+                return {"success": False, "message": "At least one filter is required"}, 400
+
+            unused = ~db.session.query(MattressMarker.id).filter(
+                MattressMarker.marker_id == MarkerHeader.id
+            ).exists()
+            query = db.session.query(MarkerHeader.id).filter(unused, *conditions)
+
+            if data.get("dry_run"):
+                return {"success": True, "dry_run": True, "matched_count": query.count()}, 200
+
+            counts = {"rotations": 0, "lines": 0, "headers": 0}
+            while True:
+                chunk = [row.id for row in query.order_by(MarkerHeader.id).limit(MARKER_CHUNK_SIZE).all()]
+                if not chunk:
+                    break
+
+                chunk_counts = delete_markers(chunk)
+                db.session.commit()
+
+                for key, value in chunk_counts.items():
+                    counts[key] += value
+
+            return {
+                "success": True,
+                "message": f"Successfully deleted {counts['headers']} marker(s)",
+                "deleted": counts
             }, 200
 
+        except ValueError as e:
+            return {"success": False, "message": f"Invalid filter: {str(e)}"}, 400
         except Exception as e:
             db.session.rollback()
             return {"success": False, "message": f"Error deleting markers: {str(e)}"}, 500
@@ -1,14 +1,17 @@
 from flask import Blueprint, request, jsonify
-from api.models import Mattresses, db, MattressPhase, MattressDetail, MattressMarker, MarkerHeader, MattressSize, MattressKanban, CollarettoDetail, ProductionCenter, MattressProductionCenter, SystemSettings, WidthChangeRequest, Users
+from api.models import Mattresses, db, MattressPhase, MattressDetail, MattressMarker, MarkerHeader, MattressSize, MattressKanban, CollarettoDetail, ProductionCenter, MattressProductionCenter, SystemSettings, Users
 from flask_restx import Namespace, Resource
 from sqlalchemy import func
 from collections import defaultdict
-import time
 from datetime import datetime, date, timedelta
 from sqlalchemy.exc import OperationalError
 import jwt
 from api.config import BaseConfig
 from api.routes.config_management import read_installation_settings
+from api.reference_data import get_reference, etag_response
+from api.width_change_lookup import pending_width_change_mattresses
+from api.transactions import transactional
+from api.serialization import table_dicts
 
 mattress_bp = Blueprint('mattress_bp', __name__)
 mattress_api = Namespace('mattress', description="Mattress Management")
@@ -271,11 +274,8 @@ class GetMattressesByOrder(Resource):
             if not mattresses:
                 return {"success": False, "message": "No mattresses found for this order"}, 404
 
-            # Get all mattress IDs that have pending width change requests
-            pending_width_change_mattresses = set()
-            pending_requests = WidthChangeRequest.query.filter_by(status='pending').all()
-            for req in pending_requests:
-                pending_width_change_mattresses.add(req.mattress_id)
+            # Mattresses of this list that have a pending width change request
+            pending_width_change_ids = pending_width_change_mattresses([row[0].id for row in mattresses])
 
             result = []
             for mattress, layers, layers_a, extra, cons_planned, cons_actual, cons_real, bagno_ready, layers_updated_at, marker_name, marker_width, marker_length, efficiency, phase_status, phase_operator, production_center, cutting_room, destination in mattresses:
@@ -283,7 +283,7 @@ class GetMattressesByOrder(Resource):
                     "mattress": mattress.mattress,
                     "phase_status": phase_status,
                     "phase_operator": phase_operator if phase_operator is not None else "",
-                    "has_pending_width_change": mattress.id in pending_width_change_mattresses,
+                    "has_pending_width_change": mattress.id in pending_width_change_ids,
                     # Table-specific production center fields (before fabric info)
                     "production_center": production_center,
                     "cutting_room": cutting_room,
@@ -412,11 +412,8 @@ class GetAdhesivesByOrder(Resource):
             if not mattresses:
                 return {"success": True, "data": []}, 200  # Return empty array instead of error
 
-            # Get all mattress IDs that have pending width change requests
-            pending_width_change_mattresses = set()
-            pending_requests = WidthChangeRequest.query.filter_by(status='pending').all()
-            for req in pending_requests:
-                pending_width_change_mattresses.add(req.mattress_id)
+            # Mattresses of this list that have a pending width change request
+            pending_width_change_ids = pending_width_change_mattresses([row[0].id for row in mattresses])
 
             result = []
             for mattress, layers, layers_a, extra, cons_planned, cons_actual, cons_real, bagno_ready, layers_updated_at, marker_name, marker_width, marker_length, efficiency, phase_status, phase_operator, production_center, cutting_room, destination in mattresses:
@@ -450,7 +447,7 @@ class GetAdhesivesByOrder(Resource):
                     "sequence_number": mattress.sequence_number,
                     "phase_status": phase_status if phase_status is not None else "0 - NOT SET",
                     "phase_operator": phase_operator if phase_operator is not None else "",
-                    "has_pending_width_change": mattress.id in pending_width_change_mattresses,
+                    "has_pending_width_change": mattress.id in pending_width_change_ids,
                     # Production center fields
                     "production_center": production_center,
                     "cutting_room": cutting_room,
@@ -602,68 +599,52 @@ class SaveActualLayersResource(Resource):
 @mattress_api.route('/delete/<string:mattress_name>', methods=['DELETE'])
 class DeleteMattressResource(Resource):
     def delete(self, mattress_name):
-        max_retries = 2
-        retry_delay = 0.5  # seconds
+        @transactional(retries=2)
+        def delete_operation():
+            mattress = Mattresses.query.filter_by(mattress=mattress_name).first()
 
-        for attempt in range(max_retries + 1):
-            try:
-                mattress = Mattresses.query.filter_by(mattress=mattress_name).first()
-
-                if not mattress:
-                    return {"success": True, "message": f"Mattress {mattress_name} already deleted or not found"}, 200
-
-                db.session.delete(mattress)
-                db.session.commit()
-
-                return {"success": True, "message": f"Deleted mattress {mattress_name}"}, 200
-
-            except Exception as e:
-                db.session.rollback()  # 🔥 THIS is the missing piece
+            if not mattress:
+                return {"success": True, "message": f"Mattress {mattress_name} already deleted or not found"}, 200
 
-                if "deadlocked" in str(e).lower() and attempt < max_retries:
+            db.session.delete(mattress)
 
-                    time.sleep(retry_delay)
-                    continue
+            return {"success": True, "message": f"Deleted mattress {mattress_name}"}, 200
 
+        try:
+            return delete_operation()
 
-                return {"success": False, "message": str(e)}, 500
+        except Exception as e:
+            return {"success": False, "message": str(e)}, 500
 
 @mattress_api.route('/delete_by_row_id/<string:row_id>', methods=['DELETE'])
 class DeleteMattressByRowIdResource(Resource):
     def delete(self, row_id):
         """Delete mattress by row_id - more reliable than mattress name"""
-        max_retries = 2
-        retry_delay = 0.5  # seconds
-
-        for attempt in range(max_retries + 1):
-            try:
-                mattress = Mattresses.query.filter_by(row_id=row_id).first()
-
-                if not mattress:
-                    return {"success": True, "message": f"Mattress with row_id {row_id} already deleted or not found"}, 200
+        @transactional(retries=2)
+        def delete_operation():
+            mattress = Mattresses.query.filter_by(row_id=row_id).first()
 
-                mattress_name = mattress.mattress  # Store for logging
-                db.session.delete(mattress)
-                db.session.commit()
+            if not mattress:
+                return {"success": True, "message": f"Mattress with row_id {row_id} already deleted or not found"}, 200
 
-                return {"success": True, "message": f"Deleted mattress {mattress_name} (row_id: {row_id})"}, 200
+            mattress_name = mattress.mattress  # Store for logging
+            db.session.delete(mattress)
 
-            except Exception as e:
-                db.session.rollback()
+            return {"success": True, "message": f"Deleted mattress {mattress_name} (row_id: {row_id})"}, 200
 
-                if "deadlocked" in str(e).lower() and attempt < max_retries:
-                    time.sleep(retry_delay)
-                    continue
+        try:
+            return delete_operation()
 
-                return {"success": False, "message": str(e)}, 500
+        except Exception as e:
+            return {"success": False, "message": str(e)}, 500
 
 @ mattress_api.route('/all')
 class GetAllMattressesResource(Resource):
     def get(self):
         """Fetch all mattress records from the database."""
         try:
-            mattresses = Mattresses.get_all()  # Retrieve all mattresses
-            return {"success": True, "data": [m.to_dict() for m in mattresses]}, 200
+            # Same rows as Mattresses.to_dict(), read as column tuples (datetimes formatted by output_json)
+            return {"success": True, "data": table_dicts(Mattresses)}, 200
         except Exception as e:
             return {"success": False, "message": str(e)}, 500
 
@@ -814,15 +795,13 @@ class GetKanbanMattressesResource(Resource):
                 size_dict.setdefault(row.mattress_id, []).append(f"{row.size} - {pcs}")
                 pcs_sum_dict[row.mattress_id] = pcs_sum_dict.get(row.mattress_id, 0) + pcs
 
-            # Get all mattress IDs that have pending width change requests
-            pending_width_change_mattresses = set()
-            pending_requests = WidthChangeRequest.query.filter_by(status='pending').all()
-            for req in pending_requests:
-                pending_width_change_mattresses.add(req.mattress_id)
+            # Mattresses of this list that have a pending width change request
+            rows = query.all()
+            pending_width_change_ids = pending_width_change_mattresses([row.mattress_id for row in rows])
 
             # Build final result
             result = []
-            for row in query:
+            for row in rows:
                 pcs_per_layer = pcs_sum_dict.get(row.mattress_id, 0)
                 # Use actual layers (layers_a) when available, fallback to planned layers
                 effective_layers = row.layers_a if row.layers_a is not None else row.layers
@@ -830,7 +809,7 @@ class GetKanbanMattressesResource(Resource):
 
                 # Check if this mattress has a pending width change request
                 mattress_status = row.status
-                if row.mattress_id in pending_width_change_mattresses:
+                if row.mattress_id in pending_width_change_ids:
                     mattress_status = "PENDING APPROVAL"
 
                 result.append({
@@ -2425,57 +2404,11 @@ class MattressOrderIdsResource(Resource):
 @mattress_api.route('/production_center/options', methods=['GET'])
 class GetProductionCenterOptions(Resource):
     def get(self):
-        """Get all available production center options"""
+        """Get all available production center options (with ETag)"""
         try:
-            # Real production center combinations based on your system configuration
-            options = [
-                # PXE1 - ZALLI combinations
-                {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "ZALLI 1 - SECTOR 1"},
-                {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "ZALLI 1 - SECTOR 2"},
-                {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "ZALLI 1 - SECTOR 3"},
-                {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "ZALLI 2"},
-                {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "ZALLI 3"},
-                {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "TEXCONS"},
-                {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "VERONA"},
-                {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "INTERTOP"},
-                {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "SANIA"},
-                {"production_center": "PXE1", "cutting_room": "ZALLI", "destination": "CUTTING SECTION"},
-
-                # PXE1 - VERONA combinations
-                {"production_center": "PXE1", "cutting_room": "VERONA", "destination": "VERONA"},
-
-                # PXE1 - TEXCONS combinations
-                {"production_center": "PXE1", "cutting_room": "TEXCONS", "destination": "TEXCONS"},
-
-                # PXE3 - VEGATEX combinations
-                {"production_center": "PXE3", "cutting_room": "VEGATEX", "destination": "VEGATEX"},
-
-                # PXE3 - SINA STYLE combinations
-                {"production_center": "PXE3", "cutting_room": "SINA STYLE", "destination": "SINA STYLE"},
-
-                # PXE3 - ZEYNTEX combinations
-                {"production_center": "PXE3", "cutting_room": "ZEYNTEX", "destination": "ZEYNTEX"},
-
-                # PXE3 - DELICIA combinations
-                {"production_center": "PXE3", "cutting_room": "DELICIA", "destination": "DELICIA"},
-                {"production_center": "PXE3", "cutting_room": "DELICIA", "destination": "SUNAI"},
-                {"production_center": "PXE3", "cutting_room": "DELICIA", "destination": "NADJI"},
-                {"production_center": "PXE3", "cutting_room": "DELICIA", "destination": "SABRI89"},
-
-                # PXE3 - VAIDE MOLA combinations
-                {"production_center": "PXE3", "cutting_room": "VAIDE MOLA", "destination": "VAIDE MOLA"},
-
-                # PXE3 - HADJIOLI combinations
-                {"production_center": "PXE3", "cutting_room": "HADJIOLI", "destination": "HADJIOLI"},
-
-                # PXE3 - YUMER combinations
-                {"production_center": "PXE3", "cutting_room": "YUMER", "destination": "YUMER"},
-
-                # PXE3 - RILA TEXTILE combinations
-                {"production_center": "PXE3", "cutting_room": "RILA TEXTILE", "destination": "RILA TEXTILE"},
-            ]
+            etag, options = get_reference('production_center_options')
 
-            return {"success": True, "data": options}, 200
+            return etag_response(etag, lambda: {"success": True, "data": options})
 
         except Exception as e:
 
@@ -1,29 +1,35 @@
 from flask import Blueprint, request, jsonify
 from flask_restx import Namespace, Resource
 from api.models import db, Operator
+from api.reference_data import get_reference, etag_response
 from datetime import datetime
 
 operators_bp = Blueprint('operators_bp', __name__)
 operators_api = Namespace('operators', description="Unified Operators Management")
 
+def operators_response(operator_type=None, active_only=False):
+    """Operators from the reference data cache, filtered by type and active flag"""
+    etag, operators = get_reference('operators')
+    operator_type = operator_type.lower() if operator_type else None
+
+    def build():
+        data = [
+            op for op in operators
+            if (not operator_type or op['operator_type'] == operator_type) and (not active_only or op['active'])
+        ]
+        return {"success": True, "data": data}
+
+    return etag_response(etag, build, variant=f"{operator_type}:{active_only}")
+
 @operators_api.route('/')
 class OperatorsResource(Resource):
     def get(self):
-        """Get all operators, optionally filtered by type"""
+        """Get all operators, optionally filtered by type (cached, with ETag)"""
         try:
             operator_type = request.args.get('type')  # Optional filter by type
             active_only = request.args.get('active_only', 'false').lower() == 'true'
 
-            query = Operator.query
-
-            if operator_type:
-                query = query.filter_by(operator_type=operator_type.lower())
-
-            if active_only:
-                query = query.filter_by(active=True)
-
-            operators = query.all()
-            return {"success": True, "data": [op.to_dict() for op in operators]}, 200
+            return operators_response(operator_type, active_only)
         except Exception as e:
             return {"success": False, "message": str(e)}, 500
 
@@ -145,23 +151,11 @@ class OperatorResource(Resource):
 @operators_api.route('/active')
 class ActiveOperatorsResource(Resource):
     def get(self):
-        """Get all active operators, optionally filtered by type"""
+        """Get all active operators, optionally filtered by type (cached, with ETag)"""
         try:
             operator_type = request.args.get('type')  # Optional filter by type
 
-            query = Operator.query.filter_by(active=True)
-
-            if operator_type:
-                query = query.filter_by(operator_type=operator_type.lower())
-
-            operators = query.all()
-
-            result_data = []
-            for op in operators:
-                op_dict = op.to_dict()
-                result_data.append(op_dict)
-
-            return {"success": True, "data": result_data}, 200
+            return operators_response(operator_type, active_only=True)
         except Exception as e:
             print(f"❌ ActiveOperators API error: {str(e)}")
             import traceback
@@ -191,7 +185,6 @@ class OperatorsByTypeResource(Resource):
 
             active_only = request.args.get('active_only', 'false').lower() == 'true'
 
-            operators = Operator.get_by_type(operator_type, active_only)
-            return {"success": True, "data": [op.to_dict() for op in operators]}, 200
+            return operators_response(operator_type, active_only)
         except Exception as e:
             return {"success": False, "message": str(e)}, 500
@@ -1,125 +1,239 @@
 from flask import Blueprint, request
 from flask_restx import Namespace, Resource
-from sqlalchemy import text
-from api.models import db, OrderLinesView, OrderRatio, ProductionCenter, OrderComments, StyleComments, StyleSettings, ProdOrderComponentView, OrderProductionCenter, OrderAudit, NavBom
+from sqlalchemy import or_, and_, func
+from api.models import db, OrderLinesView, OrderLineReplica, SyncState, OrderRatio, ProductionCenter, OrderComments, StyleComments, StyleSettings, ProdOrderComponentView, OrderProductionCenter, OrderAudit, OrderBomSignature, OrderRatioBacklog
 import uuid
+import base64
+import json
+from api.order_lines_sync import sync_order_lines, replica_ready, order_prefix_filter, ORDER_LINES_SYNC
+from api.bom_signatures import store_signature, parse_bom_items, bom_distance
+from api.bom_cache import get_bom, fabric_bom, prefetch_boms, BOM_FRESH_SECONDS
+from api.consumption import get_collaretto_consumption
+from api.order_ratios import normalize_ratio_rows, upsert_order_ratios
+from api.reference_data import get_reference, etag_response, compute_etag
+from api.order_side_data import load_order_side_data
+from api.ratio_backlog import backlog_ready, remove_from_backlog, reconcile_ratio_backlog, BACKLOG_MIN_ORDER
 
 # ✅ Create Blueprint and API instance
 orders_bp = Blueprint('orders', __name__)
 orders_api = Namespace('orders', description="Order Management")
 
+ORDER_LINE_FIELDS = ['order_commessa', 'size', 'season', 'prod_order_no', 'style', 'color_code', 'quantity', 'status']
+DEFAULT_PAGE_SIZE = 500
+MAX_PAGE_SIZE = 5000
+
+def encode_cursor(order_commessa, size):
+    return base64.urlsafe_b64encode(json.dumps([order_commessa, size]).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    order_commessa, size = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+    return order_commessa, size
+
 @orders_api.route('/order_lines')
 class OrderLines(Resource):
     def get(self):
+        """Order lines from the local replica (NAV view until the replica is first synced).
+
+        Optional filters: order_commessa, min_prefix, prefix, style, season.
+        Paging: page + page_size (with total), or cursor + page_size (keyset).
+        Without page or cursor every matching line is returned, as before.
+        """
         try:
             # Optionally filter by order_commessa if provided as a query parameter.
             order_commessa = request.args.get('order_commessa')
             min_order_prefix = request.args.get('min_prefix', '24')  # Default to '24' if not specified
-
-            query = OrderLinesView.query
+            prefix = request.args.get('prefix')
+            style = request.args.get('style')
+            season = request.args.get('season')
+            page = request.args.get('page', type=int)
+            cursor = request.args.get('cursor')
+            page_size = min(max(request.args.get('page_size', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+            if cursor:
+                try:
+                    last_order, last_size = decode_cursor(cursor)
+                    if not isinstance(last_order, str) or not isinstance(last_size, str):
+                        raise ValueError("expected order and size strings")
+                except (ValueError, TypeError) as e:
+                    return {"success": False, "msg": f"Invalid cursor: {str(e)}"}, 400
+
+            model = OrderLineReplica if replica_ready() else OrderLinesView
+            query = db.session.query(*[getattr(model, field) for field in ORDER_LINE_FIELDS])
 
             # Apply order_commessa filter if provided
             if order_commessa:
-                query = query.filter_by(order_commessa=order_commessa)
+                query = query.filter(model.order_commessa == order_commessa)
             else:
                 # Filter for orders that start with numbers 24 and onwards
-                # Use LIKE to filter for orders that start with digits 2-9
-                query = query.filter(
-                    (OrderLinesView.order_commessa.like('2%') & (OrderLinesView.order_commessa >= min_order_prefix)) |
-                    OrderLinesView.order_commessa.like('3%') |
-                    OrderLinesView.order_commessa.like('4%') |
-                    OrderLinesView.order_commessa.like('5%') |
-                    OrderLinesView.order_commessa.like('6%') |
-                    OrderLinesView.order_commessa.like('7%') |
-                    OrderLinesView.order_commessa.like('8%') |
-                    OrderLinesView.order_commessa.like('9%')
-                )
+                query = query.filter(order_prefix_filter(model, min_order_prefix))
+
+            if prefix:
+                query = query.filter(model.order_commessa.like(f'{prefix}%'))
+            if style:
+                query = query.filter(model.style == style)
+            if season:
+                query = query.filter(model.season == season)
 
             # Fetch order lines sorted by 'order_commessa'
-            data = query.order_by(OrderLinesView.order_commessa).all()
+            query = query.order_by(model.order_commessa, model.size)
+            result = {"success": True, "source": "replica" if model is OrderLineReplica else "nav"}
+
+            if cursor:
+                query = query.filter(or_(
+                    model.order_commessa > last_order,
+                    and_(model.order_commessa == last_order, model.size > last_size)
+                ))
+            if page or cursor:
+                if page and not cursor:
+                    result.update(page=page, page_size=page_size, total=query.order_by(None).count())
+                    query = query.offset((max(page, 1) - 1) * page_size)
+                rows = query.limit(page_size + 1).all()
+                has_more = len(rows) > page_size
+                rows = rows[:page_size]
+                result["next_cursor"] = encode_cursor(rows[-1].order_commessa, rows[-1].size) if has_more else None
+            else:
+                rows = query.all()
+
+            # A single order that is not replicated yet (created since the last sync) is read from NAV
+            if not rows and order_commessa and model is OrderLineReplica:
+                rows = db.session.query(*[getattr(OrderLinesView, field) for field in ORDER_LINE_FIELDS]).filter(
+                    OrderLinesView.order_commessa == order_commessa
+                ).order_by(OrderLinesView.size).all()
 
             # Convert results to dictionary format
-            data_list = [row.to_dict() for row in data]
+            result["data"] = [dict(zip(ORDER_LINE_FIELDS, row)) for row in rows]
 
-            return {
-                "success": True,
-                "data": data_list
-            }, 200
+            return result, 200
+
+        except Exception as e:
+            return {"success": False, "msg": str(e)}, 500
+
+@orders_api.route('/order_lines/sync', methods=['POST'])
+class SyncOrderLines(Resource):
+    def post(self):
+        """Run an order lines sync now (body: {"full": true} for a full reconcile)"""
+        try:
+            data = request.get_json(silent=True) or {}
+            result = sync_order_lines(full=bool(data.get('full')))
+            return {"success": True, "data": result}, 200
+        except Exception as e:
+            return {"success": False, "msg": str(e)}, 500
 
+@orders_api.route('/order_lines/sync_status', methods=['GET'])
+class OrderLinesSyncStatus(Resource):
+    def get(self):
+        try:
+            state = db.session.get(SyncState, ORDER_LINES_SYNC)
+            return {"success": True, "data": state.to_dict() if state else None}, 200
         except Exception as e:
             return {"success": False, "msg": str(e)}, 500
 
 @orders_api.route('/order_lines/without_ratios', methods=['GET'])
 class OrdersWithoutRatios(Resource):
     def get(self):
+        """Orders from '25' on without ratios, from order_ratio_backlog.
+
+        Optional: style filter, page + page_size. Without page every order is returned.
+        """
         try:
-            # Step 1: Get all orders starting with '25' and onwards (25, 26, 27, etc.) and their styles
-            all_order_pairs = db.session.query(
-                OrderLinesView.order_commessa,
-                OrderLinesView.style
-            ).filter(
-                OrderLinesView.order_commessa >= '25'
-            ).distinct().all()  # Ex: [('25ABC', 'STYLE1'), ('26DEF', 'STYLE2')]
-
-            all_orders_dict = {
-                order_commessa: style
-                for order_commessa, style in all_order_pairs
-                if order_commessa and style
-            }
-
-            # Step 2: Get orders that already have ratios
-            existing_orders = db.session.query(OrderRatio.order_commessa).distinct().all()
-            existing_orders_set = {row[0] for row in existing_orders}
-
-            # Step 3: Subtract to find orders still needing ratios
-            orders_to_do = [
-                {"id": oc, "style": st}
-                for oc, st in all_orders_dict.items()
-                if oc not in existing_orders_set
-            ]
+            style = request.args.get('style')
+            page = request.args.get('page', type=int)
+            page_size = min(max(request.args.get('page_size', DEFAULT_PAGE_SIZE, type=int), 1), MAX_PAGE_SIZE)
+
+            if not backlog_ready():
+                # Backlog never reconciled yet: compare order lines and ratios directly
+                orders_to_do = legacy_orders_without_ratios()
+                if style:
+                    orders_to_do = [order for order in orders_to_do if order["style"] == style]
+                return {"success": True, "orders": orders_to_do}, 200
+
+            query = db.session.query(OrderRatioBacklog.order_commessa, OrderRatioBacklog.style)
+            if style:
+                query = query.filter(OrderRatioBacklog.style == style)
+            query = query.order_by(OrderRatioBacklog.order_commessa)
+
+            result = {"success": True}
+            if page:
+                result.update(page=page, page_size=page_size, total=query.order_by(None).count())
+                query = query.offset((max(page, 1) - 1) * page_size).limit(page_size)
+
+            result["orders"] = [{"id": oc, "style": st} for oc, st in query.all()]
+            return result, 200
 
-            return {"success": True, "orders": orders_to_do}, 200
+        except Exception as e:
+            return {"success": False, "msg": str(e)}, 500
 
+def legacy_orders_without_ratios():
+    """Orders from '25' on without ratios, computed from the order lines (used until the backlog exists)"""
+    # Step 1: Get all orders starting with '25' and onwards (25, 26, 27, etc.) and their styles
+    all_order_pairs = db.session.query(
+        OrderLinesView.order_commessa,
+        OrderLinesView.style
+    ).filter(
+        OrderLinesView.order_commessa >= BACKLOG_MIN_ORDER
+    ).distinct().all()  # Ex: [('25ABC', 'STYLE1'), ('26DEF', 'STYLE2')]
+
+    all_orders_dict = {
+        order_commessa: style
+        for order_commessa, style in all_order_pairs
+        if order_commessa and style
+    }
+
+    # Step 2: Get orders that already have ratios
+    existing_orders = db.session.query(OrderRatio.order_commessa).distinct().all()
+    existing_orders_set = {row[0] for row in existing_orders}
+
+    # Step 3: Subtract to find orders still needing ratios
+    return [
+        {"id": oc, "style": st}
+        for oc, st in all_orders_dict.items()
+        if oc not in existing_orders_set
+    ]
+
+@orders_api.route('/order_lines/without_ratios/reconcile', methods=['POST'])
+class ReconcileOrdersWithoutRatios(Resource):
+    def post(self):
+        """Rebuild order_ratio_backlog from the order lines and order_ratios"""
+        try:
+            return {"success": True, "data": reconcile_ratio_backlog()}, 200
         except Exception as e:
             return {"success": False, "msg": str(e)}, 500
 
 @orders_api.route('/ratios/update')
 class UpdateOrderRatios(Resource):
     def patch(self):
+        """Insert or update ratios for any number of orders in one set-based write.
+
+        Body: {"data": [{"order_commessa", "size", "theoretical_ratio"}, ...]}
+        Returns the inserted/updated row count per order.
+        """
         try:
-            payload = request.get_json()
-            ratios = payload.get("data", [])
-
-            for row in ratios:
-                ratio = OrderRatio(
-                    order_commessa=row["order_commessa"],
-                    size=row["size"],
-                    theoretical_ratio=row["theoretical_ratio"]
-                )
-                db.session.merge(ratio)  # Insert or update
+            payload = request.get_json() or {}
+
+            try:
+                ratios = normalize_ratio_rows(payload.get("data", []))
+            except ValueError as e:
+                return {"success": False, "msg": str(e)}, 400
+
+            counts = upsert_order_ratios(ratios)
+
+            # These orders have ratios now
+            remove_from_backlog(counts.keys())
 
             db.session.commit()
-            return {"success": True, "msg": "Ratios inserted/updated"}, 200
+            return {"success": True, "msg": "Ratios inserted/updated", "orders": counts}, 200
 
         except Exception as e:
+            db.session.rollback()
             return {"success": False, "msg": str(e)}, 500
 
 @orders_api.route('/order_lines/without_ratios/count', methods=['GET'])
 class OrdersWithoutRatiosCount(Resource):
     def get(self):
         try:
-            # All order_commessa starting with '25' and onwards (25, 26, 27, etc.)
-            all_order_ids = db.session.query(OrderLinesView.order_commessa).filter(
-                OrderLinesView.order_commessa >= '25'
-            ).distinct().all()
-            all_order_set = {row[0] for row in all_order_ids}
-
-            # All order_commessa that already have ratios
-            existing_ratios = db.session.query(OrderRatio.order_commessa).distinct().all()
-            existing_ratio_set = {row[0] for row in existing_ratios}
-
-            # Difference = those missing
-            missing_ratio_count = len(all_order_set - existing_ratio_set)
+            if backlog_ready():
+                missing_ratio_count = db.session.query(func.count(OrderRatioBacklog.order_commessa)).scalar()
+            else:
+                missing_ratio_count = len(legacy_orders_without_ratios())
 
             return {"success": True, "count": missing_ratio_count}, 200
 
@@ -130,16 +244,10 @@ class OrdersWithoutRatiosCount(Resource):
 class OrderLineStyles(Resource):
     def get(self):
         try:
-            # Query distinct styles from order lines
-            styles = db.session.query(OrderLinesView.style)\
-                .filter(OrderLinesView.style.isnot(None))\
-                .distinct()\
-                .all()
+            # Distinct styles from the reference data cache
+            etag, style_list = get_reference('styles')
 
-            # Flatten the result
-            style_list = [s[0] for s in styles if s[0]]
-
-            return {"success": True, "styles": style_list}, 200
+            return etag_response(etag, lambda: {"success": True, "styles": style_list})
 
         except Exception as e:
             return {"success": False, "msg": str(e)}, 500
@@ -439,167 +547,45 @@ class GetCombinedComments(Resource):
         except Exception as e:
             return {"success": False, "msg": str(e)}, 500
 
-@orders_api.route('/collaretto_consumption/<string:style>/<string:fabric_code>')
-class GetCollarettoConsumption(Resource):
-    def get(self, style, fabric_code):
+@orders_api.route('/side_data', methods=['GET'])
+@orders_api.route('/side_data/<string:order_commessa>', methods=['GET'])
+class OrderSideData(Resource):
+    def get(self, order_commessa=None):
+        """Comments, style comment and settings, production centers and audit of one or many orders.
+
+        /side_data/<order> returns the data of that order; /side_data?orders=A,B,C
+        returns {order: data}. The combined ETag allows 304 revalidation.
+        """
         try:
+            if order_commessa:
+                orders = [order_commessa]
+            else:
+                orders = [order for order in request.args.get('orders', '').split(',') if order.strip()]
+                if not orders:
+                    return {"success": False, "msg": "order_commessa or orders is required"}, 400
 
+            side_data = load_order_side_data(orders)
+            data = side_data.get(order_commessa.strip()) if order_commessa else side_data
 
-            try:
-                from api.models import Collaretto, CollarettoDetail, OrderLinesView, MattressSize, Mattresses, MattressDetail
-
-                # First, find orders that have the specified style
-                orders_with_style = db.session.query(OrderLinesView.order_commessa).filter_by(style=style).distinct().all()
-                order_commessas_with_style = [o[0] for o in orders_with_style if o[0]]
-
-                if not order_commessas_with_style:
-                    return {
-                        "success": True,
-                        "data": {},
-                        "debug_info": f"No orders found with style: {style}"
-                    }, 200
-
-                # Find collaretto records that match both the style (via orders) and fabric
-                # Limit to 5 most recent records based on order_commessa (assuming higher order numbers are newer)
-                matching_collarettos = Collaretto.query.filter(
-                    Collaretto.order_commessa.in_(order_commessas_with_style),
-                    Collaretto.fabric_code == fabric_code
-                ).order_by(Collaretto.order_commessa.desc()).limit(5).all()
-
-                if not matching_collarettos:
-                    return {
-                        "success": True,
-                        "data": {},
-                        "debug_info": f"No collaretto records found for style: {style}, fabric: {fabric_code}"
-                    }, 200
-
-                # Process all matching collaretto records and group by bagno
-                collaretto_records = []
-                bagno_groups = {}  # Group records by bagno
-                total_pieces = 0
-                total_consumption = 0
-                total_length = 0
-
-                for collaretto in matching_collarettos:
-                    detail = CollarettoDetail.query.filter_by(collaretto_id=collaretto.id).first()
-
-                    if detail:
-                        pieces = float(detail.pieces) if detail.pieces else 0
-                        cons_planned = float(detail.cons_planned) if detail.cons_planned else 0
-                        gross_length = float(detail.gross_length) if detail.gross_length else 0
-
-                        # Get the bagno from the mattress (bagno is stored in the dye_lot field)
-                        bagno = None
-                        if detail.mattress_id:
-                            mattress = Mattresses.query.get(detail.mattress_id)
-                            if mattress:
-                                bagno = mattress.dye_lot
-
-                        # Group by bagno for summing pieces
-                        if bagno not in bagno_groups:
-                            bagno_groups[bagno] = {
-                                'bagno': bagno,
-                                'total_pieces': 0,
-                                'total_consumption': 0,
-                                'records': []
-                            }
-
-                        bagno_groups[bagno]['total_pieces'] += pieces
-                        bagno_groups[bagno]['total_consumption'] += cons_planned
-
-                        roll_width_value = float(detail.roll_width) if detail.roll_width else 0
-
-                        record_data = {
-                            'order_commessa': collaretto.order_commessa,
-                            'collaretto_id': collaretto.id,
-                            'fabric_type': collaretto.fabric_type or 'N/A',
-                            'item_type': collaretto.item_type,  # Add item_type for grain direction
-                            'pieces': pieces,
-                            'usable_width': float(detail.usable_width) if detail.usable_width else 0,
-                            'gross_length': gross_length,
-                            'cons_planned': cons_planned,
-                            'pcs_seam': float(detail.pcs_seam) if detail.pcs_seam else 0,
-                            'collarettoWidth': roll_width_value,  # Use frontend field name
-                            'consumption_per_piece': round(cons_planned / pieces, 4) if pieces > 0 else 0,
-                            'bagno': bagno,
-                            'mattress_id': detail.mattress_id,
-                            'applicable_sizes': detail.applicable_sizes  # Add the stored applicable sizes
-                        }
-                        bagno_groups[bagno]['records'].append(record_data)
-                        collaretto_records.append(record_data)
-
-                        # Add to totals for averages
-                        total_pieces += pieces
-                        total_consumption += cons_planned
-                        total_length += gross_length
-
-                if not collaretto_records:
-                    return {
-                        "success": True,
-                        "data": {},
-                        "debug_info": f"Collaretto records found but no valid details"
-                    }, 200
-
-                # Calculate averages
-                avg_consumption_per_piece = round(total_consumption / total_pieces, 4) if total_pieces > 0 else 0
-                avg_length = round(total_length / len(collaretto_records), 2) if collaretto_records else 0
-                avg_pieces = round(total_pieces / len(collaretto_records), 1) if collaretto_records else 0
-
-                # Get planned quantities for each bagno from mattress sizes
-                bagno_planned_quantities = {}
-                for bagno in bagno_groups.keys():
-                    if bagno:
-                        # Find mattresses with this bagno (dye_lot)
-                        bagno_mattresses = Mattresses.query.filter_by(dye_lot=bagno).all()
-                        bagno_planned = {}
-
-                        for mattress in bagno_mattresses:
-                            # Get sizes for this mattress
-                            mattress_sizes = MattressSize.query.filter_by(mattress_id=mattress.id).all()
-                            for size_record in mattress_sizes:
-                                size = size_record.size
-                                planned_qty = float(size_record.pcs_planned) if size_record.pcs_planned else 0
-                                bagno_planned[size] = bagno_planned.get(size, 0) + planned_qty
-
-                        bagno_planned_quantities[bagno] = bagno_planned
-
-                # Add bagno grouping info to each record for frontend matching
-                for record in collaretto_records:
-                    bagno = record['bagno']
-                    if bagno in bagno_groups:
-                        record['bagno_info'] = {
-                            'bagno': bagno,
-                            'total_pieces_in_bagno': bagno_groups[bagno]['total_pieces'],
-                            'pieces_to_match': bagno_groups[bagno]['total_pieces'],  # Use total for matching
-                            'mattress_id': record['mattress_id'],
-                            'individual_pieces': record['pieces'],  # Keep individual record pieces for reference
-                            'planned_quantities': bagno_planned_quantities.get(bagno, {})  # Add planned quantities for this bagno
-                        }
+            return etag_response(compute_etag(data), lambda: {"success": True, "data": data})
 
-                # Build the result with all records and statistics
-                result_data = {
-                    'style': style,
-                    'fabric_code': fabric_code,
-                    'fabric_type': collaretto_records[0]['fabric_type'],
-                    'description': f"Collaretto - {collaretto_records[0]['fabric_type']}",
-                    'total_records': len(collaretto_records),
-                    'bagno_groups': bagno_groups,  # Include bagno grouping info
-                    'statistics': {
-                        'total_pieces': total_pieces,
-                        'total_consumption': round(total_consumption, 2),
-                        'avg_consumption_per_piece': avg_consumption_per_piece,
-                        'avg_length': avg_length,
-                        'avg_pieces': avg_pieces
-                    },
-                    'records': collaretto_records
-                }
+        except Exception as e:
+            print(f"❌ Error fetching order side data: {str(e)}")
+            return {"success": False, "msg": str(e)}, 500
 
-            except Exception as e:
-                print(f"⚠️ Error fetching collaretto details: {str(e)}")
+@orders_api.route('/collaretto_consumption/<string:style>/<string:fabric_code>')
+class GetCollarettoConsumption(Resource):
+    def get(self, style, fabric_code):
+        try:
+            # Figures are memoized per (style, fabric_code), see api/consumption.py
+            result_data, debug_info = get_collaretto_consumption(style, fabric_code)
+
+            if not result_data:
                 return {
-                    "success": False,
-                    "msg": f"Error fetching collaretto data: {str(e)}"
-                }, 500
+                    "success": True,
+                    "data": {},
+                    "debug_info": debug_info
+                }, 200
 
             return {
                 "success": True,
@@ -774,18 +760,13 @@ class UpdateOrderAudit(Resource):
 @orders_api.route('/bom/<string:order_number>')
 class OrderBom(Resource):
     def get(self, order_number):
-        """Get BOM (Bill of Materials) data for a specific order"""
+        """Get BOM (Bill of Materials) data for a specific order, from the local snapshot"""
         try:
             print(f"🔍 Fetching BOM data for order: {order_number}")
 
-            # Check if nav_bom table exists
-            table_exists = db.session.execute(text("""
-                SELECT COUNT(*)
-                FROM INFORMATION_SCHEMA.TABLES
-                WHERE TABLE_NAME = 'nav_bom'
-            """)).scalar()
+            bom = get_bom(order_number)
 
-            if not table_exists:
+            if bom is None:
                 print("⚠️ nav_bom table does not exist")
                 return {
                     "success": True,
@@ -793,25 +774,20 @@ class OrderBom(Resource):
                     "message": f"BOM table not found. No BOM data available for order {order_number}"
                 }, 200
 
-            # Query nav_bom table for the specified order number
-            bom_data = NavBom.query.filter_by(shortcut_dimension_2_code=order_number).all()
+            print(f"📋 Found {len(bom['lines'])} BOM records for order {order_number} ({bom['state']})")
 
-            print(f"📋 Found {len(bom_data)} BOM records for order {order_number}")
-
-            if not bom_data:
+            if not bom['lines']:
                 return {
                     "success": True,
                     "data": [],
                     "message": f"No BOM data found for order {order_number}"
                 }, 200
 
-            # Convert to dictionary format
-            bom_list = [item.to_dict() for item in bom_data]
-
             return {
                 "success": True,
-                "data": bom_list,
-                "order_number": order_number
+                "data": bom['lines'],
+                "order_number": order_number,
+                "fetched_at": bom['fetched_at'].isoformat()
             }, 200
 
         except Exception as e:
@@ -821,103 +797,111 @@ class OrderBom(Resource):
             return {"success": False, "msg": str(e)}, 500
 
 
+@orders_api.route('/bom/prefetch', methods=['POST'])
+class PrefetchOrderBoms(Resource):
+    def post(self):
+        """Load the BOM snapshots of a list of orders in bulk (e.g. before planning them)"""
+        try:
+            data = request.get_json() or {}
+            orders = data.get('orders')
+            if not isinstance(orders, list) or not orders:
+                return {"success": False, "msg": "orders must be a non-empty list"}, 400
+
+            # force=true refetches every order, even with a fresh snapshot
+            max_age = 0 if data.get('force') else BOM_FRESH_SECONDS
+            result = prefetch_boms([str(order) for order in orders], max_age_seconds=max_age)
+
+            return {"success": True, "data": result}, 200
+
+        except Exception as e:
+            db.session.rollback()
+            print(f"❌ Error prefetching BOMs: {str(e)}")
+            return {"success": False, "msg": str(e)}, 500
+
+
+# Largest relative consumption difference accepted for a nearest BOM match
+NEAREST_BOM_TOLERANCE = 0.05
+
 @orders_api.route('/ratios/auto_populate/<string:order_commessa>')
 class AutoPopulateRatios(Resource):
     def post(self, order_commessa):
         """
         Auto-populate Italian ratios for an order based on matching criteria:
         1. Same style
-        2. Same sizes (exact match)
-        3. Same fabric bill of materials
+        2. Same fabric bill of materials (item and consumption, color ignored)
+
+        Candidates come from order_bom_signatures (see api/bom_signatures.py):
+        the most recent order with ratios and an identical signature wins; if
+        there is none, the closest BOM with the same items within
+        NEAREST_BOM_TOLERANCE is proposed.
         """
         try:
             print(f"🔍 Auto-populating ratios for order: {order_commessa}")
 
             # Step 1: Get the style for the target order
-            target_order_lines = OrderLinesView.query.filter_by(order_commessa=order_commessa).all()
+            target_order_line = OrderLinesView.query.filter_by(order_commessa=order_commessa).first()
 
-            if not target_order_lines:
+            if not target_order_line:
                 return {
                     "success": False,
                     "msg": f"No order lines found for order {order_commessa}"
                 }, 404
 
-            target_style = target_order_lines[0].style
+            target_style = target_order_line.style
 
             print(f"📋 Target order - Style: {target_style}")
 
-            # Step 2: Get the fabric BOM for the target order (only FABRIC items)
-            target_bom = NavBom.query.filter_by(
-                shortcut_dimension_2_code=order_commessa,
-                source='FABRIC'
-            ).all()
-
-            # Create a normalized BOM signature (sorted list of item-quantity tuples)
-            # The quantity represents the consumption which indicates the size ratio distribution
-            # We don't care about color (pf_vertical_component), only item and quantity
-            target_bom_signature = sorted([
-                (bom.item_no, bom.quantity)
-                for bom in target_bom
-            ])
+            # Step 2: Read the fabric BOM of the target order and refresh its signature
+            target_bom_signature = fabric_bom(get_bom(order_commessa))
+            target_signature = store_signature(order_commessa, target_style, target_bom_signature).signature
+            db.session.commit()
 
             print(f"📋 Target BOM signature: {len(target_bom_signature)} fabric items with consumption values")
 
-            # Step 3: Find all orders with the same style
-            candidate_orders = db.session.query(OrderLinesView.order_commessa, OrderLinesView.style)\
-                .filter(OrderLinesView.style == target_style)\
-                .filter(OrderLinesView.order_commessa != order_commessa)\
-                .distinct().all()
-
-            print(f"🔍 Found {len(candidate_orders)} candidate orders with same style")
-
-            # Step 4: Filter candidates by matching BOM signature (fabric + consumption)
-            # Collect all matching orders with their creation dates
-            matching_orders = []
-
-            for candidate_order_commessa, _ in candidate_orders:
-                # Check if this candidate has ratios
-                existing_ratios = OrderRatio.query.filter_by(order_commessa=candidate_order_commessa).all()
-                if not existing_ratios:
-                    continue  # Skip orders without ratios
-
-                # Check BOM match (item and consumption quantity) - only FABRIC items
-                # We don't care about color (pf_vertical_component)
-                candidate_bom = NavBom.query.filter_by(
-                    shortcut_dimension_2_code=candidate_order_commessa,
-                    source='FABRIC'
-                ).all()
-                candidate_bom_signature = sorted([
-                    (bom.item_no, bom.quantity)
-                    for bom in candidate_bom
-                ])
-
-                if candidate_bom_signature != target_bom_signature:
-                    continue  # BOM doesn't match
-
-                # Found a match! Get the creation date of the ratios
-                # Use the most recent created_at from all ratio entries for this order
-                most_recent_ratio = max(existing_ratios, key=lambda r: r.created_at)
-                matching_orders.append({
-                    'order_commessa': candidate_order_commessa,
-                    'created_at': most_recent_ratio.created_at
-                })
-                print(f"✅ Found matching order: {candidate_order_commessa} (created: {most_recent_ratio.created_at})")
-
-            # Step 5: Select the most recent matching order
-            matching_order = None
-            if matching_orders:
-                # Sort by created_at descending and take the first (most recent)
-                matching_orders.sort(key=lambda x: x['created_at'], reverse=True)
-                matching_order = matching_orders[0]['order_commessa']
-                print(f"🎯 Selected most recent order: {matching_order} from {len(matching_orders)} matches")
-                print(f"   BOM signature matches: {len(target_bom_signature)} items with same consumption values")
-
-            if not matching_order:
+            # Step 3: One join for candidates of the same style that have ratios, most recent ratios first
+            latest_ratio = func.max(OrderRatio.created_at)
+            candidates_query = db.session.query(OrderBomSignature, latest_ratio.label('created_at'))\
+                .join(OrderRatio, OrderRatio.order_commessa == OrderBomSignature.order_commessa)\
+                .filter(OrderBomSignature.style == target_style)\
+                .filter(OrderBomSignature.order_commessa != order_commessa)\
+                .group_by(*OrderBomSignature.__table__.c)\
+                .order_by(latest_ratio.desc())
+
+            exact_matches = candidates_query.filter(OrderBomSignature.signature == target_signature).all()
+
+            match_type = None
+            deviation = 0.0
+            matching_signature = None
+            if exact_matches:
+                match_type = "exact"
+                matching_signature = exact_matches[0][0]
+                print(f"🎯 Selected most recent order: {matching_signature.order_commessa} from {len(exact_matches)} matches")
+            else:
+                # Step 4: No identical BOM, look for the same fabric items with the closest consumption
+                best_distance = None
+                for candidate, _ in candidates_query.filter(
+                        OrderBomSignature.item_count == len(target_bom_signature)).all():
+                    distance = bom_distance(target_bom_signature, parse_bom_items(candidate.items))
+                    if distance is None or distance > NEAREST_BOM_TOLERANCE:
+                        continue
+                    # Candidates are sorted by most recent ratios, so ties keep the most recent order
+                    if best_distance is None or distance < best_distance:
+                        best_distance = distance
+                        matching_signature = candidate
+                if matching_signature:
+                    match_type = "nearest"
+                    deviation = best_distance
+                    print(f"🎯 Selected nearest order: {matching_signature.order_commessa} (max consumption deviation {deviation:.2%})")
+
+            if not matching_signature:
                 return {
                     "success": False,
-                    "msg": "No matching order found with same style, sizes, and fabric BOM"
+                    "msg": "No matching order found with same style and fabric BOM"
                 }, 404
 
+            matching_order = matching_signature.order_commessa
+            matching_bom = parse_bom_items(matching_signature.items)
+
             # Step 5: Get ratios from matching order (don't save yet - let user review first)
             source_ratios = OrderRatio.query.filter_by(order_commessa=matching_order).all()
 
@@ -930,27 +914,27 @@ class AutoPopulateRatios(Resource):
 
             print(f"✅ Successfully found {len(ratios_data)} ratio entries from matching order")
 
-            # Get matching order details for display
-            matching_order_lines = OrderLinesView.query.filter_by(order_commessa=matching_order).first()
-            matching_bom = NavBom.query.filter_by(
-                shortcut_dimension_2_code=matching_order,
-                source='FABRIC'
-            ).all()
+            msg = f"Found matching order {matching_order}. Review and save the ratios below."
+            if match_type == "nearest":
+                msg = (f"Found similar order {matching_order} (fabric consumption differs by up to "
+                       f"{deviation:.1%}). Review and save the ratios below.")
 
             return {
                 "success": True,
-                "msg": f"Found matching order {matching_order}. Review and save the ratios below.",
+                "msg": msg,
                 "source_order": matching_order,
                 "ratios": ratios_data,
                 "match_details": {
+                    "match_type": match_type,
+                    "max_consumption_deviation": round(deviation, 4),
                     "target_order": order_commessa,
                     "target_style": target_style,
                     "target_bom_count": len(target_bom_signature),
                     "target_bom_items": [f"{item} (qty: {qty})" for item, qty in target_bom_signature[:10]],  # First 10 fabric items with consumption
                     "matched_order": matching_order,
-                    "matched_style": matching_order_lines.style if matching_order_lines else None,
+                    "matched_style": matching_signature.style,
                     "matched_bom_count": len(matching_bom),
-                    "matched_bom_items": [f"{bom.item_no} (qty: {bom.quantity})" for bom in matching_bom[:10]]  # First 10 fabric items with consumption
+                    "matched_bom_items": [f"{item} (qty: {qty})" for item, qty in matching_bom[:10]]  # First 10 fabric items with consumption
                 }
             }, 200
 
@@ -3,6 +3,7 @@ from flask_restx import Namespace, Resource
 from api.models import db, WidthChangeRequest, MarkerRequest, Mattresses, MarkerHeader, MattressMarker, MattressDetail
 from datetime import datetime
 import json
+from api.width_change_lookup import list_width_change_requests, get_width_change_summary
 
 # Create Blueprint and API instance
 width_change_requests_bp = Blueprint('width_change_requests', __name__)
@@ -209,64 +210,14 @@ class ListWidthChangeRequests(Resource):
             status = request.args.get('status', None)
             requested_by = request.args.get('requested_by', None)
 
-            query = WidthChangeRequest.query
-
-            # Apply filtering rules for approvals page:
-            # 1. Show everything that doesn't have status 'approved' OR 'rejected'
-            # 2. Show everything that is 'approved' or 'rejected' but was created less than 48 hours ago
-            from datetime import datetime, timedelta
-            forty_eight_hours_ago = datetime.utcnow() - timedelta(hours=48)
-
-            # Filter: (status != 'approved' AND status != 'rejected') OR (created_at > 48 hours ago)
-            query = query.filter(
-                db.or_(
-                    ~WidthChangeRequest.status.in_(['approved', 'rejected']),
-                    WidthChangeRequest.created_at > forty_eight_hours_ago
-                )
-            )
-
-            # Exclude subcontractor requests (requests without operator are from subcontractors)
-            query = query.filter(WidthChangeRequest.operator.isnot(None))
-
-            # Apply additional filters if provided
-            if status:
-                query = query.filter(WidthChangeRequest.status == status)
-            if requested_by:
-                query = query.filter(WidthChangeRequest.requested_by == requested_by)
-
-            requests = query.order_by(WidthChangeRequest.created_at.desc()).all()
-
-            # Enhance the data with marker length and consumption information
-            enhanced_data = []
-            for req in requests:
-                req_data = req.to_dict()
-
-                # Get current marker length from marker_headers using the current marker name
-                # This ensures we get the original marker length, not the updated one after approval
-                current_marker = MarkerHeader.query.filter_by(marker_name=req.current_marker_name).first()
-                if current_marker:
-                    req_data['current_marker_length'] = current_marker.marker_length
-
-                # Get selected marker length if it's a change_marker request
-                if req.request_type == 'change_marker' and req.selected_marker_id:
-                    selected_marker = MarkerHeader.query.get(req.selected_marker_id)
-                    if selected_marker:
-                        req_data['selected_marker_length'] = selected_marker.marker_length
-
-                # Get mattress layers, planned consumption and extra (allowance) from mattress_details
-                mattress_detail = MattressDetail.query.filter_by(mattress_id=req.mattress_id).first()
-                if mattress_detail:
-                    req_data['mattress_layers'] = mattress_detail.layers
-                    req_data['planned_consumption'] = mattress_detail.cons_planned
-                    req_data['extra'] = mattress_detail.extra
-
-                enhanced_data.append(req_data)
+            # Open requests, plus approved/rejected ones from the last 48 hours
+            data = list_width_change_requests(subcontractor=False, status=status, requested_by=requested_by)
 
             return {
                 "success": True,
-                "data": enhanced_data
+                "data": data
             }, 200
-            
+
         except Exception as e:
             return {"success": False, "message": f"Error fetching width change requests: {str(e)}"}, 500
 
@@ -279,62 +230,12 @@ class ListSubcontractorWidthChangeRequests(Resource):
             status = request.args.get('status', None)
             requested_by = request.args.get('requested_by', None)
 
-            query = WidthChangeRequest.query
-
-            # Apply filtering rules for approvals page:
-            # 1. Show everything that doesn't have status 'approved' OR 'rejected'
-            # 2. Show everything that is 'approved' or 'rejected' but was created less than 48 hours ago
-            from datetime import datetime, timedelta
-            forty_eight_hours_ago = datetime.utcnow() - timedelta(hours=48)
-
-            # Filter: (status != 'approved' AND status != 'rejected') OR (created_at > 48 hours ago)
-            query = query.filter(
-                db.or_(
-                    ~WidthChangeRequest.status.in_(['approved', 'rejected']),
-                    WidthChangeRequest.created_at > forty_eight_hours_ago
-                )
-            )
-
-            # Only include subcontractor requests (requests without operator are from subcontractors)
-            query = query.filter(WidthChangeRequest.operator.is_(None))
-
-            # Apply additional filters if provided
-            if status:
-                query = query.filter(WidthChangeRequest.status == status)
-            if requested_by:
-                query = query.filter(WidthChangeRequest.requested_by == requested_by)
-
-            requests = query.order_by(WidthChangeRequest.created_at.desc()).all()
-
-            # Enhance the data with marker length and consumption information
-            enhanced_data = []
-            for req in requests:
-                req_data = req.to_dict()
-
-                # Get current marker length from marker_headers using the current marker name
-                # This ensures we get the original marker length, not the updated one after approval
-                current_marker = MarkerHeader.query.filter_by(marker_name=req.current_marker_name).first()
-                if current_marker:
-                    req_data['current_marker_length'] = current_marker.marker_length
-
-                # Get selected marker length if it's a change_marker request
-                if req.request_type == 'change_marker' and req.selected_marker_id:
-                    selected_marker = MarkerHeader.query.get(req.selected_marker_id)
-                    if selected_marker:
-                        req_data['selected_marker_length'] = selected_marker.marker_length
-
-                # Get mattress layers, planned consumption and extra (allowance) from mattress_details
-                mattress_detail = MattressDetail.query.filter_by(mattress_id=req.mattress_id).first()
-                if mattress_detail:
-                    req_data['mattress_layers'] = mattress_detail.layers
-                    req_data['planned_consumption'] = mattress_detail.cons_planned
-                    req_data['extra'] = mattress_detail.extra
-
-                enhanced_data.append(req_data)
+            # Open requests, plus approved/rejected ones from the last 48 hours
+            data = list_width_change_requests(subcontractor=True, status=status, requested_by=requested_by)
 
             return {
                 "success": True,
-                "data": enhanced_data
+                "data": data
             }, 200
 
         except Exception as e:
@@ -346,12 +247,22 @@ class PendingWidthChangeRequestsCount(Resource):
     def get(self):
         """Get count of pending width change requests for badge notifications"""
         try:
-            count = WidthChangeRequest.query.filter_by(status='pending').count()
+            count = get_width_change_summary()["by_status"].get('pending', 0)
             return {"success": True, "count": count}, 200
         except Exception as e:
             return {"success": False, "count": 0, "error": str(e)}, 500
 
 
+@width_change_requests_api.route('/summary')
+class WidthChangeRequestsSummary(Resource):
+    def get(self):
+        """Count of width change requests per status and per cutting room"""
+        try:
+            return {"success": True, "data": get_width_change_summary()}, 200
+        except Exception as e:
+            return {"success": False, "message": f"Error fetching width change request summary: {str(e)}"}, 500
+
+
 @width_change_requests_api.route('/<int:request_id>/approve')
 class ApproveWidthChangeRequest(Resource):
     def post(self, request_id):
@@ -0,0 +1,83 @@
+"""
+JSON encoding of API responses.
+
+Flask-RESTX encodes the dicts returned by the resources with the stdlib json
+module. output_json() replaces its application/json representation with
+orjson (C, several times faster on large lists), falling back to the stdlib
+when orjson is not installed. Both encode datetimes as '%Y-%m-%d %H:%M:%S'
+(the format of the models' to_dict), dates as ISO dates, Decimals as floats,
+and numpy values natively.
+
+table_dicts() / row_dicts() build the response rows straight from column
+tuples: no ORM objects, no getattr and strftime per attribute.
+
+Flask-RESTX validation errors ({"message", "errors": {field: message}}) are
+reshaped to the app's {"success": False, "msg": ...} here, while the dict is
+still in hand, so nothing has to parse response bodies after the fact.
+"""
+
+import json
+from datetime import date, datetime, time
+from decimal import Decimal
+
+from flask import make_response
+
+from api.models import db
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+def _default(value):
+    if isinstance(value, datetime):
+        # '%Y-%m-%d %H:%M:%S' without strftime (2.5x faster): isoformat minus the microseconds
+        return value.isoformat(' ')[:19]
+    if isinstance(value, (date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, 'tolist'):  # numpy scalars and arrays (stdlib fallback)
+        return value.tolist()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+if orjson:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATETIME
+
+    def dumps(data):
+        """JSON bytes of a response body"""
+        return orjson.dumps(data, default=_default, option=_OPTIONS)
+else:
+    def dumps(data):
+        """JSON bytes of a response body"""
+        return json.dumps(data, default=_default, ensure_ascii=False).encode('utf-8')
+
+
+def _validation_errors(data, code):
+    if code >= 400 and isinstance(data, dict) and isinstance(data.get('errors'), dict) and data['errors']:
+        return {"success": False, "msg": next(iter(data['errors'].values()))}
+    return data
+
+
+def output_json(data, code, headers=None):
+    """Flask-RESTX representation for application/json"""
+    response = make_response(dumps(_validation_errors(data, code)), code)
+    response.headers['Content-Type'] = 'application/json'
+    response.headers.extend(headers or {})
+    return response
+
+
+def row_dicts(keys, rows):
+    """Dicts of result tuples, keyed by keys (in the order of the selected columns)"""
+    keys = tuple(keys)
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def table_dicts(model, *criteria, order_by=None):
+    """Every column of a model's rows as dicts, selected as tuples (same keys as to_dict)"""
+    columns = tuple(model.__table__.columns)
+    query = db.session.query(*columns).filter(*criteria)
+    if order_by is not None:
+        query = query.order_by(order_by)
+    return row_dicts((column.name for column in columns), query.all())
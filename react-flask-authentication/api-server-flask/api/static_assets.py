@@ -0,0 +1,165 @@
+"""
+Serving of the React build: index.html, the static/ chunks and the root files.
+
+The build directory is scanned once per worker into an in-memory manifest
+(path, content ETag, MIME type, precompressed variants), so a request is a dict
+lookup instead of os.path.exists() calls. Hashed chunks (static/js|css|media/
+name.<hash>.ext) never change under the same name and are served as immutable
+for a year; everything else, index.html included, is revalidated through its
+strong ETag and answered with 304 when unchanged.
+
+When the browser accepts it, the .br or .gz file written next to an asset by
+precompress() is sent instead of the asset (python -m api.static_assets, run by
+the Dockerfile after npm run build).
+
+A new build is picked up by calling react_build.reload(), or within
+RELOAD_CHECK_SECONDS when index.html changes (npm run build always rewrites it).
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+import threading
+import time
+
+from flask import request, send_file
+
+# Docker container path: /app/react-ui/build
+BUILD_DIR = '/app/react-ui/build'
+
+HASHED_ASSET = re.compile(r'^static/(js|css|media)/.+\.[0-9a-f]{8,}\.')  # main.3f2a1b9c.js, 787.8d1c4a2e.chunk.css
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'no-cache'
+
+# Preferred first: (Content-Encoding, file suffix)
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+COMPRESSIBLE = ('.js', '.css', '.html', '.json', '.map', '.svg', '.txt', '.ico')
+COMPRESS_MIN_SIZE = 1024
+
+RELOAD_CHECK_SECONDS = 30
+
+
+def _content_etag(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(65536), b''):
+            digest.update(block)
+    return digest.hexdigest()[:20]
+
+
+class BuildManifest:
+    """In-memory index of one React build directory"""
+
+    def __init__(self, build_dir=BUILD_DIR):
+        self.build_dir = build_dir
+        self.assets = {}
+        self.index_mtime = None
+        self.checked_at = 0
+        self.lock = threading.Lock()
+        self.reload()
+
+    def _index_mtime(self):
+        try:
+            return os.stat(os.path.join(self.build_dir, 'index.html')).st_mtime
+        except OSError:
+            return None
+
+    def reload(self):
+        """Rescan the build directory; returns the number of files indexed"""
+        assets = {}
+        for root, _, files in os.walk(self.build_dir):
+            for name in files:
+                if name.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+                    continue
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, self.build_dir).replace(os.sep, '/')
+                assets[relative] = {
+                    'path': path,
+                    'etag': _content_etag(path),
+                    'mimetype': mimetypes.guess_type(name)[0] or 'application/octet-stream',
+                    'immutable': bool(HASHED_ASSET.match(relative)),
+                    'variants': {encoding: path + suffix for encoding, suffix in ENCODINGS
+                                 if os.path.exists(path + suffix)}
+                }
+
+        # Swapped in one assignment: requests being served keep the old manifest
+        self.assets = assets
+        self.index_mtime = self._index_mtime()
+        self.checked_at = time.monotonic()
+        print(f"📦 React build indexed: {len(assets)} files from {self.build_dir}")
+        return len(assets)
+
+    def reload_if_changed(self):
+        if time.monotonic() - self.checked_at < RELOAD_CHECK_SECONDS:
+            return False
+        with self.lock:
+            if time.monotonic() - self.checked_at < RELOAD_CHECK_SECONDS:
+                return False
+            self.checked_at = time.monotonic()
+            if self._index_mtime() == self.index_mtime:
+                return False
+            self.reload()
+            return True
+
+    def response(self, path):
+        """Response for a build file, or None when the build has no such file"""
+        self.reload_if_changed()
+        asset = self.assets.get(path)
+        if asset is None:
+            return None
+
+        encoding = next((encoding for encoding, _ in ENCODINGS
+                         if encoding in asset['variants'] and request.accept_encodings[encoding]), None)
+        filename = asset['variants'][encoding] if encoding else asset['path']
+        etag = f"{asset['etag']}-{encoding}" if encoding else asset['etag']
+
+        response = send_file(filename, mimetype=asset['mimetype'], etag=etag, conditional=True)
+        response.headers['Cache-Control'] = IMMUTABLE if asset['immutable'] else REVALIDATE
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if asset['variants']:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    def index(self):
+        return self.response('index.html')
+
+
+react_build = BuildManifest(BUILD_DIR)
+
+
+def precompress(build_dir=BUILD_DIR):
+    """Write .gz (and .br when the brotli package is installed) next to the compressible build files"""
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+        print("⚠️ brotli is not installed, writing .gz files only")
+
+    written = 0
+    for root, _, files in os.walk(build_dir):
+        for name in files:
+            path = os.path.join(root, name)
+            if not name.endswith(COMPRESSIBLE) or os.path.getsize(path) < COMPRESS_MIN_SIZE:
+                continue
+            with open(path, 'rb') as file:
+                content = file.read()
+
+            # mtime=0 keeps the .gz identical between builds of the same file
+            with open(path + '.gz', 'wb') as file:
+                file.write(gzip.compress(content, compresslevel=9, mtime=0))
+            written += 1
+            if brotli:
+                with open(path + '.br', 'wb') as file:
+                    file.write(brotli.compress(content, quality=11))
+                written += 1
+
+    print(f"✅ Precompressed {written} files in {build_dir}")
+    return written
+
+
+if __name__ == "__main__":
+    precompress(sys.argv[1] if len(sys.argv) > 1 else BUILD_DIR)
@@ -0,0 +1,156 @@
+"""
+Transaction retries.
+
+@transactional wraps a unit of work: a function that reads and writes through
+db.session without committing. The session is committed when the function
+returns. If SQL Server chooses the transaction as a deadlock victim (1205), a
+lock wait times out (1222) or a snapshot transaction hits an update conflict
+(3960), the session is rolled back and the whole function runs again after a
+capped exponential backoff with full jitter. Other errors roll back and
+propagate.
+
+isolation='SNAPSHOT' runs the unit of work on a snapshot of the committed data
+(row versioning): its reads neither wait for nor block writers, and see one
+consistent state across queries (the marker calculator load). It needs
+ALLOW_SNAPSHOT_ISOLATION on the database (migrations/enable_snapshot_isolation.py);
+until then, and on other databases, the unit runs at the default level.
+
+Attempts, retries, deadlocks, lock timeouts and time spent backing off are
+counted per endpoint in each worker (transaction_stats(), /health/transactions).
+"""
+
+import random
+import re
+import threading
+import time
+from functools import wraps
+
+from flask import has_request_context, request
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+
+from api.models import db
+
+DEADLOCK = 1205
+LOCK_TIMEOUT = 1222
+SNAPSHOT_CONFLICT = 3960
+RETRYABLE_ERRORS = {DEADLOCK: 'deadlocks', LOCK_TIMEOUT: 'lock_timeouts', SNAPSHOT_CONFLICT: 'snapshot_conflicts'}
+
+# pyodbc messages carry the native error number before the ODBC function: "... (1205) (SQLExecDirectW)"
+NATIVE_ERROR = re.compile(r'\((\d+)\) \(SQL\w+\)')
+
+_stats_lock = threading.Lock()
+_stats = {}
+
+# Whether the database allows SNAPSHOT transactions, checked once per worker
+_snapshot_allowed = None
+
+
+def sql_server_error_code(error):
+    """Native SQL Server error number of a DBAPIError, or None"""
+    orig = getattr(error, 'orig', None)
+    for arg in getattr(orig, 'args', ()):
+        match = NATIVE_ERROR.search(str(arg))
+        if match:
+            return int(match.group(1))
+    return None
+
+
+def retryable_error(error):
+    """DEADLOCK, LOCK_TIMEOUT or SNAPSHOT_CONFLICT if the unit of work can be run again, else None"""
+    if not isinstance(error, DBAPIError):
+        return None
+    code = sql_server_error_code(error)
+    if code in RETRYABLE_ERRORS:
+        return code
+    # SQLite (local runs): the busy timeout expired waiting for another writer
+    if 'database is locked' in str(error.orig):
+        return LOCK_TIMEOUT
+    return None
+
+
+def _count(endpoint, **increments):
+    with _stats_lock:
+        counters = _stats.setdefault(endpoint, {
+            'attempts': 0, 'retries': 0, 'failures': 0,
+            'deadlocks': 0, 'lock_timeouts': 0, 'snapshot_conflicts': 0, 'backoff_ms': 0
+        })
+        for name, value in increments.items():
+            counters[name] += value
+
+
+def transaction_stats():
+    """Per-endpoint retry counters of this worker"""
+    with _stats_lock:
+        return {endpoint: dict(counters) for endpoint, counters in _stats.items()}
+
+
+def snapshot_allowed():
+    """ALLOW_SNAPSHOT_ISOLATION is ON for the application database"""
+    global _snapshot_allowed
+    if _snapshot_allowed is None:
+        state = db.session.execute(
+            text("SELECT snapshot_isolation_state FROM sys.databases WHERE name = DB_NAME()")
+        ).scalar()
+        db.session.rollback()
+        _snapshot_allowed = state == 1
+        if not _snapshot_allowed:
+            print("⚠️ Snapshot isolation is not allowed on the database, SNAPSHOT units run at the default level "
+                  "(migrations/enable_snapshot_isolation.py)")
+    return _snapshot_allowed
+
+
+def _begin(isolation):
+    if db.engine.dialect.name != 'mssql':
+        return
+    if isolation == 'SNAPSHOT' and not snapshot_allowed():
+        return
+    if db.session.in_transaction():
+        if db.session.new or db.session.dirty or db.session.deleted:
+            print(f"⚠️ Pending changes, running without {isolation} isolation")
+            return
+        # Only reads so far: end that transaction so the unit of work starts with the requested level
+        db.session.rollback()
+    db.session.connection(execution_options={'isolation_level': isolation})
+
+
+def transactional(func=None, *, retries=3, isolation=None, base_delay=0.05, max_delay=2.0):
+    """Run a unit of work in one transaction, retrying it on deadlocks and lock timeouts.
+
+    Usable as @transactional or @transactional(retries=5, isolation='SNAPSHOT').
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            endpoint = request.endpoint if has_request_context() and request.endpoint else func.__qualname__
+
+            for attempt in range(retries + 1):
+                _count(endpoint, attempts=1)
+                try:
+                    if isolation:
+                        _begin(isolation)
+                    result = func(*args, **kwargs)
+                    db.session.commit()
+                    return result
+
+                except Exception as e:
+                    db.session.rollback()
+
+                    code = retryable_error(e)
+                    if code is None:
+                        raise
+                    _count(endpoint, **{RETRYABLE_ERRORS[code]: 1})
+
+                    if attempt == retries:
+                        _count(endpoint, failures=1)
+                        print(f"❌ {endpoint}: error {code}, giving up after {retries + 1} attempts")
+                        raise
+
+                    delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+                    _count(endpoint, retries=1, backoff_ms=round(delay * 1000))
+                    print(f"🔁 {endpoint}: error {code}, retrying in {delay:.2f}s (attempt {attempt + 1}/{retries})")
+                    time.sleep(delay)
+
+        return wrapper
+
+    return decorator(func) if func else decorator
@@ -0,0 +1,147 @@
+"""
+Width change request lookups.
+
+- pending_width_change_mattresses() answers "which of these mattresses have a
+  pending request" with one indexed (status, mattress_id) read, instead of
+  loading every pending request.
+- list_width_change_requests() builds the approvals lists with a fixed number
+  of queries instead of three extra lookups per request.
+- get_width_change_summary() returns the counts per status and per cutting
+  room polled by every planner client. It is memoized per worker and
+  recomputed when a request is created, approved, rejected or deleted (the
+  after_flush hook below bumps its cache_versions key).
+"""
+
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from sqlalchemy import event, func
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from api.cache import Memo, bump_versions
+from api.models import (db, WidthChangeRequest, Mattresses, MattressProductionCenter, MarkerHeader,
+                        MattressDetail)
+from api.order_lines_sync import chunked
+
+WIDTH_CHANGE_VERSION_KEY = 'width_change_requests'
+
+# Approved and rejected requests stay on the approvals page for this long
+RECENT_DECISION_HOURS = 48
+
+summary_memo = Memo(ttl=600, max_entries=10)
+
+
+def pending_width_change_mattresses(mattress_ids):
+    """Return the subset of mattress_ids that have a pending width change request"""
+    pending = set()
+    for chunk in chunked(set(mattress_ids)):
+        pending.update(row[0] for row in db.session.query(WidthChangeRequest.mattress_id)
+                       .filter(WidthChangeRequest.status == 'pending')
+                       .filter(WidthChangeRequest.mattress_id.in_(chunk))
+                       .distinct())
+    return pending
+
+
+def compute_width_change_summary():
+    """Request counts per status and per cutting room (one grouped query)"""
+    rows = db.session.query(
+        WidthChangeRequest.status,
+        MattressProductionCenter.cutting_room,
+        func.count(WidthChangeRequest.id)
+    ).join(
+        Mattresses, WidthChangeRequest.mattress_id == Mattresses.id
+    ).outerjoin(
+        MattressProductionCenter, Mattresses.table_id == MattressProductionCenter.table_id
+    ).group_by(
+        WidthChangeRequest.status, MattressProductionCenter.cutting_room
+    ).all()
+
+    by_status = defaultdict(int)
+    by_cutting_room = defaultdict(lambda: defaultdict(int))
+    for status, cutting_room, count in rows:
+        by_status[status] += count
+        by_cutting_room[cutting_room or 'UNASSIGNED'][status] += count
+
+    return {
+        "by_status": dict(by_status),
+        "by_cutting_room": {cutting_room: dict(counts) for cutting_room, counts in by_cutting_room.items()},
+        "computed_at": datetime.now().isoformat()
+    }
+
+
+def get_width_change_summary():
+    return summary_memo.get_or_compute('summary', WIDTH_CHANGE_VERSION_KEY, compute_width_change_summary)
+
+
+def list_width_change_requests(subcontractor=False, status=None, requested_by=None):
+    """Requests for the approvals pages, with marker lengths and mattress consumption.
+
+    subcontractor selects requests without an operator. Open requests are always
+    listed, approved and rejected ones for RECENT_DECISION_HOURS.
+    """
+    recent = datetime.utcnow() - timedelta(hours=RECENT_DECISION_HOURS)
+
+    query = WidthChangeRequest.query.options(
+        joinedload(WidthChangeRequest.mattress),
+        selectinload(WidthChangeRequest.selected_marker)
+    ).filter(
+        db.or_(
+            ~WidthChangeRequest.status.in_(['approved', 'rejected']),
+            WidthChangeRequest.created_at > recent
+        )
+    )
+
+    # Requests without operator are from subcontractors
+    if subcontractor:
+        query = query.filter(WidthChangeRequest.operator.is_(None))
+    else:
+        query = query.filter(WidthChangeRequest.operator.isnot(None))
+
+    if status:
+        query = query.filter(WidthChangeRequest.status == status)
+    if requested_by:
+        query = query.filter(WidthChangeRequest.requested_by == requested_by)
+
+    requests = query.order_by(WidthChangeRequest.created_at.desc()).all()
+
+    # Original marker lengths by name (marker_name is not unique, the oldest marker wins as before)
+    marker_lengths = {}
+    for chunk in chunked({req.current_marker_name for req in requests}):
+        for marker_name, marker_length in db.session.query(MarkerHeader.marker_name, MarkerHeader.marker_length)\
+                .filter(MarkerHeader.marker_name.in_(chunk)).order_by(MarkerHeader.id.desc()):
+            marker_lengths[marker_name.upper()] = marker_length
+
+    details = {}
+    for chunk in chunked({req.mattress_id for req in requests}):
+        details.update({detail.mattress_id: detail for detail in
+                        MattressDetail.query.filter(MattressDetail.mattress_id.in_(chunk))})
+
+    result = []
+    for req in requests:
+        req_data = req.to_dict()
+
+        # Current marker length from marker_headers, not the one updated after approval
+        current_marker_length = marker_lengths.get((req.current_marker_name or '').upper())
+        if current_marker_length is not None:
+            req_data['current_marker_length'] = current_marker_length
+
+        if req.request_type == 'change_marker' and req.selected_marker:
+            req_data['selected_marker_length'] = req.selected_marker.marker_length
+
+        detail = details.get(req.mattress_id)
+        if detail:
+            req_data['mattress_layers'] = detail.layers
+            req_data['planned_consumption'] = detail.cons_planned
+            req_data['extra'] = detail.extra
+
+        result.append(req_data)
+    return result
+
+
+@event.listens_for(Session, 'after_flush')
+def invalidate_width_change_summary(session, flush_context):
+    """Bump the summary version when a request is created, changes status or is deleted"""
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, WidthChangeRequest):
+            bump_versions(session.connection(), [WIDTH_CHANGE_VERSION_KEY])
+            return
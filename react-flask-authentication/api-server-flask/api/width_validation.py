@@ -0,0 +1,562 @@
+"""
+Handling unit replica and persisted width validation.
+
+/navision/width_validation used to scan the whole View_PickedHandlingUnits
+on every call, match every handling unit with the mattress markers in Python,
+and /width_validation/count repeated all of it to return a number. Instead:
+
+- sync_handling_units() copies only the handling units above the stored
+  [Entry No_] watermark into handling_units_replica
+- the orders that received units (or whose mattresses changed since the last
+  run, or lost mattress markers) are validated once with validate_order_widths() and the results are
+  stored in width_validation_results
+- the validation list and the badge count are indexed reads of that table
+
+Run by sync_handling_units.py; "full" re-validates every order and
+"since <entry no>" re-reads the view from an older entry.
+"""
+
+import json
+import time
+from collections import defaultdict, Counter
+from datetime import timedelta
+
+from sqlalchemy import bindparam, text, func, select
+
+from api.models import (db, Mattresses, MattressMarker, HandlingUnitReplica, WidthValidationResult,
+                        WidthValidationInput, SyncState)
+from api.order_lines_sync import get_sync_state, chunked
+
+HANDLING_UNITS_SYNC = 'handling_units'
+
+HANDLING_UNIT_FIELDS = ['item_no', 'description', 'bin_code', 'quantity', 'unit_of_measure_code', 'width',
+                        'length', 'status', 'order_commessa', 'hu_no', 'batch_dye_lot']
+
+# Statuses shown to planners (orders with "no_change" are not stored)
+FLAGGED_STATUSES = ["width_warning", "width_error", "width_changed"]
+# Mattress edits are looked up from this long before the last run: a transaction
+# that was still open when the last run read them commits with an older updated_at
+CHANGE_OVERLAP = timedelta(seconds=5)
+
+
+def read_handling_units(since_entry_no=None):
+    """Picked handling units with a width from View_PickedHandlingUnits, above since_entry_no if given"""
+    since_filter = "AND [Entry No_] > :since_entry_no" if since_entry_no is not None else ""
+    query = text(f"""
+    SELECT
+        [Entry No_],
+        [Item No_],
+        [Description],
+        [Bin Code],
+        [Quantity],
+        [Unit of Measure Code],
+        [Width],
+        [Length],
+        [Status],
+        [Order Commessa],
+        [HU No_],
+        [Batch_Dye lot]
+    FROM [View_PickedHandlingUnits]
+    WHERE [Width] > 0 AND [Width] IS NOT NULL {since_filter}
+    ORDER BY [Entry No_]
+    """)
+
+    rows = db.session.execute(query, {'since_entry_no': since_entry_no} if since_entry_no is not None else {})
+
+    return [{
+        'entry_no': row[0],
+        'item_no': row[1],
+        'description': row[2],
+        'bin_code': row[3],
+        'quantity': float(row[4]) if row[4] else 0.0,
+        'unit_of_measure_code': row[5],
+        'width': float(row[6]) if row[6] else 0.0,
+        'length': float(row[7]) if row[7] else 0.0,
+        'status': row[8],
+        'order_commessa': row[9],
+        'hu_no': row[10],
+        'batch_dye_lot': row[11]
+    } for row in rows]
+
+
+def extract_bagno(value):
+    """Last 4 characters of a batch/dye lot (users often write only the last 4 digits of the bagno)"""
+    if not value:
+        return None
+    value = str(value)
+    return value[-4:] if len(value) >= 4 else value
+
+
+def validate_order_widths(order_commessa, navision_items, cutting_room_items):
+    """Compare the measured widths of one order with the planned marker widths.
+
+    navision_items are handling unit dicts, cutting_room_items dicts with width,
+    mattress, fabric_code, fabric_color and bagno. Returns the validation result
+    of the order, or None when there is nothing for the planner to check.
+    """
+    navision_widths = [item['width'] for item in navision_items]
+    cutting_room_widths = [item['width'] for item in cutting_room_items]
+
+    # Get unique widths for comparison
+    navision_unique = sorted(list(set(navision_widths)))  # Actual widths (from Specula)
+    cutting_room_unique = sorted(list(set(cutting_room_widths)))  # Planned widths
+
+    # Determine status - focus on actionable changes for planners
+    if set(navision_unique) == set(cutting_room_unique):
+        status = "no_change"
+        priority = 3
+    else:
+        # Will be updated after width_changes analysis
+        status = "width_changed"
+        priority = 1
+
+    # Calculate width differences - Match by BAGNO (last 4 digits of HU No vs mattress bagno)
+    # This gives us the exact correlation between planned mattresses and measured handling units
+    width_changes = []
+
+    # Group mattresses by bagno for comparison
+    mattresses_by_bagno = defaultdict(list)
+    for item in cutting_room_items:
+        bagno = extract_bagno(item['bagno'])
+        if bagno:
+            mattresses_by_bagno[bagno].append(item)
+
+    # Group Navision handling units by bagno (last 4 digits of batch/dye lot)
+    navision_by_bagno = defaultdict(list)
+    for item in navision_items:
+        bagno = extract_bagno(item['batch_dye_lot'])
+        if bagno:
+            navision_by_bagno[bagno].append(item)
+
+    # For each bagno in mattresses, find matching handling units and compare widths
+    for bagno in mattresses_by_bagno.keys():
+        if bagno not in navision_by_bagno:
+            # This bagno has no Specula measurements - skip
+            continue
+
+        # Get planned widths for this bagno
+        planned_items = mattresses_by_bagno[bagno]
+        planned_widths = [item['width'] for item in planned_items]
+        planned_unique = sorted(list(set(planned_widths)))
+
+        # Get actual widths for this bagno
+        actual_items = navision_by_bagno[bagno]
+        actual_widths = [item['width'] for item in actual_items]
+
+        # Get fabric info for context
+        fabric_codes = list(set([item['fabric_code'] for item in planned_items]))
+        fabric_code = fabric_codes[0] if fabric_codes else 'Unknown'
+
+        # Compare each planned width against actual widths for this bagno
+        for planned_width in planned_unique:
+            # Count how many measurements match the planned width exactly
+            exact_matches = [w for w in actual_widths if w == planned_width]
+            total_measurements = len(actual_widths)
+            non_matching = total_measurements - len(exact_matches)
+
+            # Calculate percentage of measurements that match planned width
+            match_percentage = len(exact_matches) / total_measurements if total_measurements > 0 else 0
+
+            # Determine severity based on cutting room manager's workflow:
+            # - 1-2 rolls different: WARNING (can create new mattresses/markers)
+            # - Majority different: ERROR (requires planner action)
+
+            if match_percentage < 0.5:
+                # CRITICAL ERROR: Majority of measurements don't match planned width
+                severity = "error"
+                width_counts = Counter(actual_widths)
+                most_common_actual = width_counts.most_common(1)[0][0]
+                difference = most_common_actual - planned_width
+                actual_width_for_message = most_common_actual
+
+            elif non_matching > 0 and non_matching <= 2:
+                # WARNING: Only 1-2 rolls different (cutting room can handle)
+                severity = "warning"
+                # Find the different width(s)
+                different_widths = [w for w in actual_widths if w != planned_width]
+                different_width_counts = Counter(different_widths)
+                most_common_different = different_width_counts.most_common(1)[0][0] if different_widths else planned_width
+                difference = most_common_different - planned_width
+                actual_width_for_message = most_common_different
+
+            elif non_matching > 2:
+                # ERROR: More than 2 rolls different (requires planner attention)
+                severity = "error"
+                width_counts = Counter(actual_widths)
+                most_common_actual = width_counts.most_common(1)[0][0]
+                difference = most_common_actual - planned_width
+                actual_width_for_message = most_common_actual
+            else:
+                # All measurements match - no issue
+                continue
+
+            # Get mattress names for context
+            mattress_names = [item['mattress'] for item in planned_items if item['width'] == planned_width]
+
+            # Create appropriate message based on severity
+            if severity == "warning":
+                message = f'Bagno {bagno} ({fabric_code}): {non_matching} roll(s) measured {actual_width_for_message}cm instead of planned {planned_width}cm - Consider creating new mattresses/markers'
+            else:
+                message = f'Bagno {bagno} ({fabric_code}): {non_matching}/{total_measurements} measurements don\'t match planned {planned_width}cm - Requires planner review'
+
+            width_changes.append({
+                'planned': planned_width,
+                'actual': actual_width_for_message,
+                'difference': round(difference, 1),
+                'fabric_code': fabric_code,
+                'bagno': bagno,
+                'mattresses': mattress_names,
+                'severity': severity,  # "warning" or "error"
+                'match_percentage': round(match_percentage * 100, 1),
+                'total_measurements': total_measurements,
+                'matching_measurements': len(exact_matches),
+                'non_matching_measurements': non_matching,
+                'message': message
+            })
+
+
+
+    # Update status based on severity of width changes
+    if width_changes:
+        # Check if any changes are errors (not just warnings)
+        has_errors = any(change.get('severity') == 'error' for change in width_changes)
+        has_warnings = any(change.get('severity') == 'warning' for change in width_changes)
+
+        if has_errors:
+            status = "width_error"
+            priority = 1  # High priority - requires planner action
+        elif has_warnings:
+            status = "width_warning"
+            priority = 2  # Medium priority - cutting room can handle
+        else:
+            status = "width_changed"
+            priority = 1
+    elif set(navision_unique) != set(cutting_room_unique):
+        # Fallback for any other width differences
+        status = "width_changed"
+        priority = 1
+
+    # Note: We don't care about Navision widths that aren't planned in mattresses
+    # Those are irrelevant to the planner for this order
+
+    # Generate batch summary - ONLY for bagnos that are planned in mattresses
+    batch_summary = {}
+
+    # Only process Navision items that match planned mattress bagnos
+    for planned_bagno in mattresses_by_bagno.keys():
+        if planned_bagno in navision_by_bagno:
+            # Process all Navision items for this planned bagno
+            for item in navision_by_bagno[planned_bagno]:
+                batch = item.get('batch_dye_lot', 'Unknown Batch')
+                width = item['width']
+                bin_code = item.get('bin_code', 'Unknown Location')
+                hu_no = item.get('hu_no', 'Unknown HU')
+                quantity = item.get('quantity', 0)
+
+                if batch not in batch_summary:
+                    batch_summary[batch] = {
+                        'batch': batch,
+                        'bagno': planned_bagno,  # Add the matched bagno for reference
+                        'widths': [],
+                        'locations': set(),
+                        'handling_units': set(),
+                        'total_quantity': 0,
+                        'measurements_count': 0
+                    }
+
+                batch_summary[batch]['widths'].append(width)
+                batch_summary[batch]['locations'].add(bin_code)
+                batch_summary[batch]['handling_units'].add(hu_no)
+                batch_summary[batch]['total_quantity'] += quantity
+                batch_summary[batch]['measurements_count'] += 1
+
+    # Convert sets to lists and calculate averages
+    for batch_info in batch_summary.values():
+        batch_info['locations'] = list(batch_info['locations'])
+        batch_info['handling_units'] = list(batch_info['handling_units'])
+        batch_info['avg_width'] = round(sum(batch_info['widths']) / len(batch_info['widths']), 1)
+        batch_info['width_range'] = f"{min(batch_info['widths'])}-{max(batch_info['widths'])}" if len(set(batch_info['widths'])) > 1 else str(batch_info['widths'][0])
+        # Fix floating point precision errors in total_quantity
+        batch_info['total_quantity'] = round(batch_info['total_quantity'], 2)
+
+    # Filter Navision items to only show measurements for planned bagnos
+    planned_navision_items = []
+    for planned_bagno in mattresses_by_bagno.keys():
+        if planned_bagno in navision_by_bagno:
+            planned_navision_items.extend(navision_by_bagno[planned_bagno])
+
+    # Only include orders with width warnings or errors (skip "no_change")
+    if status in FLAGGED_STATUSES:
+        return {
+            'order_commessa': order_commessa,
+            'planned_widths': cutting_room_unique,  # What planners expected
+            'actual_widths': navision_unique,       # What Specula measured
+            'status': status,
+            'priority': priority,
+            'width_changes': width_changes,
+            'batch_summary': list(batch_summary.values()),  # Who measured what where (planned bagnos only)
+            'navision_items': planned_navision_items,  # Only measurements for planned bagnos
+            'cutting_room_items': cutting_room_items
+        }
+    return None
+
+
+def planned_widths_by_order(orders):
+    """Marker widths of the mattresses of the given orders, grouped by order"""
+    cutting_room_by_order = defaultdict(list)
+    for chunk in chunked(orders):
+        rows = db.session.query(
+            Mattresses.order_commessa,
+            MattressMarker.marker_width,
+            Mattresses.mattress,
+            Mattresses.fabric_code,
+            Mattresses.fabric_color,
+            Mattresses.dye_lot
+        ).join(
+            MattressMarker, Mattresses.id == MattressMarker.mattress_id
+        ).filter(
+            Mattresses.order_commessa.in_(chunk)
+        ).all()
+
+        for row in rows:
+            cutting_room_by_order[row.order_commessa].append({
+                'width': float(row.marker_width),
+                'mattress': row.mattress,
+                'fabric_code': row.fabric_code,
+                'fabric_color': row.fabric_color,
+                'bagno': row.dye_lot  # Store bagno for matching
+            })
+    return cutting_room_by_order
+
+
+def group_handling_units(handling_units):
+    """Handling units with an order and a width, grouped by order (entry_no dropped from the item dicts)"""
+    navision_by_order = defaultdict(list)
+    for unit in handling_units:
+        if unit.get('order_commessa') and unit.get('width'):
+            item = {key: unit.get(key) for key in HANDLING_UNIT_FIELDS if key != 'order_commessa'}
+            item['entry_no'] = unit.get('entry_no')
+            item['width'] = float(unit['width'])
+            navision_by_order[unit['order_commessa']].append(item)
+    return navision_by_order
+
+
+def validate_widths(navision_by_order):
+    """Validate every order that has both handling units and planned mattresses"""
+    cutting_room_by_order = planned_widths_by_order(navision_by_order.keys())
+
+    results = []
+    for order_commessa, navision_items in navision_by_order.items():
+        # Only process orders that have cutting room data (planned widths)
+        if order_commessa not in cutting_room_by_order:
+            continue
+        result = validate_order_widths(order_commessa, navision_items, cutting_room_by_order[order_commessa])
+        if result:
+            results.append(result)
+
+    # Sort results by priority (width changes first) and then by order_commessa
+    results.sort(key=lambda x: (x['priority'], x['order_commessa']))
+    return results
+
+
+def replica_handling_units(orders):
+    """Replica rows of the given orders as handling unit dicts"""
+    units = []
+    for chunk in chunked(orders):
+        units.extend(unit.to_dict() for unit in
+                     HandlingUnitReplica.query.filter(HandlingUnitReplica.order_commessa.in_(chunk)))
+    return units
+
+
+def _upsert_replica(units, synced_at):
+    existing = set()
+    for chunk in chunked([unit['entry_no'] for unit in units]):
+        existing.update(row[0] for row in db.session.query(HandlingUnitReplica.entry_no)
+                        .filter(HandlingUnitReplica.entry_no.in_(chunk)))
+
+    inserts = []
+    updates = []
+    for unit in units:
+        row = {key: unit[key] for key in HANDLING_UNIT_FIELDS}
+        row['synced_at'] = synced_at
+        if unit['entry_no'] in existing:
+            row = {f'b_{key}': value for key, value in row.items()}
+            row['b_entry_no'] = unit['entry_no']
+            updates.append(row)
+        else:
+            row['entry_no'] = unit['entry_no']
+            inserts.append(row)
+
+    table = HandlingUnitReplica.__table__
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+    if updates:
+        db.session.execute(
+            table.update()
+            .where(table.c.entry_no == bindparam('b_entry_no'))
+            .values({table.c[key]: bindparam(f'b_{key}') for key in HANDLING_UNIT_FIELDS + ['synced_at']}),
+            updates
+        )
+    return len(inserts), len(updates)
+
+
+def recompute_width_validation(orders=None):
+    """Re-validate the given orders (every order of the replica if None) and store the results (caller commits).
+
+    Returns the number of orders flagged for the planners.
+    """
+    if orders is None:
+        orders = [row[0] for row in db.session.query(HandlingUnitReplica.order_commessa).distinct()]
+    orders = sorted({order for order in orders if order})
+    if not orders:
+        return 0
+
+    results = validate_widths(group_handling_units(replica_handling_units(orders)))
+
+    table = WidthValidationResult.__table__
+    inputs = WidthValidationInput.__table__
+    for chunk in chunked(orders):
+        db.session.execute(table.delete().where(table.c.order_commessa.in_(chunk)))
+        db.session.execute(inputs.delete().where(inputs.c.order_commessa.in_(chunk)))
+
+    planned_rows = _planned_row_counts(orders)
+    if planned_rows:
+        db.session.execute(inputs.insert(), [{'order_commessa': order, 'planned_rows': rows}
+                                             for order, rows in planned_rows.items()])
+
+    computed_at = _database_now()
+    if results:
+        db.session.execute(table.insert(), [{
+            'order_commessa': result['order_commessa'],
+            'status': result['status'],
+            'priority': result['priority'],
+            'result': json.dumps(result),
+            'computed_at': computed_at
+        } for result in results])
+    return len(results)
+
+
+def _database_now():
+    """Clock of the database, the one that sets updated_at"""
+    return db.session.execute(select(func.current_timestamp())).scalar()
+
+
+def _replica_has_units():
+    return db.session.query(HandlingUnitReplica.order_commessa)\
+        .filter(HandlingUnitReplica.order_commessa == Mattresses.order_commessa).exists()
+
+
+def _planned_row_counts(orders=None):
+    """{order_commessa: mattress marker rows} of the given orders (of every order of the replica if None)"""
+    query = db.session.query(Mattresses.order_commessa, func.count(MattressMarker.id))\
+        .join(MattressMarker, Mattresses.id == MattressMarker.mattress_id)\
+        .group_by(Mattresses.order_commessa)
+    if orders is None:
+        return dict(query.filter(_replica_has_units()).all())
+    counts = {}
+    for chunk in chunked(orders):
+        counts.update(query.filter(Mattresses.order_commessa.in_(chunk)).all())
+    return counts
+
+
+def _orders_with_changed_mattresses(since):
+    """Orders of the replica whose mattresses or markers were edited after since"""
+    return [row[0] for row in db.session.query(Mattresses.order_commessa)
+            .outerjoin(MattressMarker, Mattresses.id == MattressMarker.mattress_id)
+            .filter((Mattresses.updated_at >= since) | (MattressMarker.updated_at >= since))
+            .filter(_replica_has_units())
+            .distinct()]
+
+
+def _orders_with_changed_row_counts():
+    """Orders of the replica whose mattress marker rows differ in number from their last validation.
+
+    Deleting a mattress or a marker leaves no updated_at behind: the count is what shows it.
+    """
+    in_replica = db.session.query(HandlingUnitReplica.order_commessa)\
+        .filter(HandlingUnitReplica.order_commessa == WidthValidationInput.order_commessa).exists()
+    validated = dict(db.session.query(WidthValidationInput.order_commessa, WidthValidationInput.planned_rows)
+                     .filter(in_replica))
+    current = _planned_row_counts()
+    return [order for order in set(validated) | set(current) if validated.get(order, 0) != current.get(order, 0)]
+
+
+def sync_handling_units(full=False, since_entry_no=None):
+    """Copy new handling units into the replica and re-validate the affected orders.
+
+    full=True re-validates every order; since_entry_no re-reads the view from that
+    entry (exclusive) instead of the watermark. Commits. Returns a summary dict.
+    """
+    started = time.perf_counter()
+    synced_at = _database_now()  # read before the mattresses, so later edits fall in the next run
+    state = get_sync_state(HANDLING_UNITS_SYNC)
+    full = full or state.last_full_sync is None
+
+    try:
+        # A full sync re-reads the whole view so units removed from it leave the replica
+        reread_all = full and since_entry_no is None
+        if since_entry_no is None and state.watermark is not None and not reread_all:
+            since_entry_no = int(state.watermark)
+
+        units = read_handling_units(since_entry_no)
+        inserted, updated = _upsert_replica(units, synced_at)
+
+        deleted = 0
+        if reread_all:
+            current = {unit['entry_no'] for unit in units}
+            removed = [row[0] for row in db.session.query(HandlingUnitReplica.entry_no)
+                       if row[0] not in current]
+            for chunk in chunked(removed):
+                deleted += HandlingUnitReplica.query.filter(HandlingUnitReplica.entry_no.in_(chunk))\
+                    .delete(synchronize_session=False)
+
+        if full:
+            flagged = recompute_width_validation()
+            validated = db.session.query(func.count(func.distinct(HandlingUnitReplica.order_commessa))).scalar()
+        else:
+            orders = {unit['order_commessa'] for unit in units if unit['order_commessa']}
+            if state.last_incremental_sync:
+                orders.update(_orders_with_changed_mattresses(state.last_incremental_sync - CHANGE_OVERLAP))
+            orders.update(_orders_with_changed_row_counts())
+            flagged = recompute_width_validation(orders)
+            validated = len(orders)
+
+        watermark = max([unit['entry_no'] for unit in units], default=None)
+        if watermark is not None and (state.watermark is None or watermark > int(state.watermark)):
+            state.watermark = str(watermark)
+
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        if full:
+            state.last_full_sync = synced_at
+        state.last_incremental_sync = synced_at
+        state.last_row_count = len(units)
+        state.last_duration_ms = duration_ms
+        state.last_error = None
+        db.session.commit()
+
+        return {
+            "mode": "full" if full else "incremental",
+            "read": len(units),
+            "inserted": inserted,
+            "updated": updated,
+            "deleted": deleted,
+            "orders_validated": validated,
+            "orders_flagged": flagged,
+            "watermark": state.watermark,
+            "duration_ms": duration_ms
+        }
+
+    except Exception as e:
+        db.session.rollback()
+        try:
+            get_sync_state(HANDLING_UNITS_SYNC).last_error = str(e)[:1000]
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+        raise
+
+
+def width_validation_ready():
+    """True once the handling units have been synced at least once"""
+    state = db.session.get(SyncState, HANDLING_UNITS_SYNC)
+    return state is not None and state.last_full_sync is not None
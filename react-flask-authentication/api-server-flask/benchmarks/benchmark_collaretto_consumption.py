@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Benchmark for /api/orders/collaretto_consumption/<style>/<fabric_code>.
+
+Seeds a synthetic dataset (orders, collarettos, details, mattresses and sizes)
+into an in-memory SQLite database from a fixed seed, then compares the former
+per-row lookups with the set-based calculation in api/consumption.py:
+statements issued, elapsed time and identical results. The memoized call is
+timed as well.
+"""
+
+import sys
+import os
+import random
+import time
+
+# Add the parent directory to the path to import the app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import event
+
+from api.models import (db, OrderLinesView, SyncState, CacheVersion, OrderLineReplica, Collaretto,
+                        CollarettoDetail, Mattresses, MattressSize)
+from api.consumption import compute_collaretto_consumption, get_collaretto_consumption, consumption_memo
+
+# (name, orders of the style, collarettos per order, mattresses per bagno, sizes per mattress)
+CASES = [
+    ("small", 20, 2, 4, 4),
+    ("medium", 200, 3, 10, 6),
+    ("large", 1000, 4, 30, 8),
+]
+
+STYLE = "BENCH"
+FABRIC = "FAB-001"
+
+
+def create_benchmark_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def create_tables():
+    # The models use a SQL Server collation name; SQLite needs it registered
+    @event.listens_for(db.engine, 'connect')
+    def register_collation(connection, record):
+        connection.create_collation('SQL_Latin1_General_CP1_CI_AS',
+                                    lambda a, b: (a.lower() > b.lower()) - (a.lower() < b.lower()))
+
+    db.engine.dispose()
+    tables = [OrderLinesView, SyncState, CacheVersion, OrderLineReplica, Collaretto, CollarettoDetail,
+              Mattresses, MattressSize]
+    db.metadata.create_all(bind=db.engine, tables=[model.__table__ for model in tables])
+
+
+def seed(rnd, order_count, collarettos_per_order, mattresses_per_bagno, sizes_per_mattress):
+    sizes = [f"S{i:02d}" for i in range(sizes_per_mattress)]
+    bagnos = [f"BAGNO-{i:03d}" for i in range(max(1, order_count // 10))]
+
+    order_lines = []
+    for index in range(order_count):
+        order_commessa = f"25{index:05d}"
+        order_lines.extend({
+            'order_commessa': order_commessa, 'size': size, 'season': '25', 'prod_order_no': order_commessa,
+            'style': STYLE, 'color_code': 'C', 'quantity': 100, 'status': 3
+        } for size in sizes)
+    db.session.execute(OrderLinesView.__table__.insert(), order_lines)
+
+    mattress_id = 0
+    mattresses = []
+    mattress_sizes = []
+    for bagno in bagnos:
+        for _ in range(mattresses_per_bagno):
+            mattress_id += 1
+            mattresses.append({
+                'id': mattress_id, 'mattress': f"M-{mattress_id}", 'order_commessa': '2500000',
+                'fabric_type': 'A', 'fabric_code': FABRIC, 'fabric_color': 'C', 'dye_lot': bagno,
+                'item_type': 'MS', 'spreading_method': 'FACE UP', 'table_id': str(mattress_id),
+                'row_id': f"row-{mattress_id}"
+            })
+            mattress_sizes.extend({
+                'mattress_id': mattress_id, 'style': STYLE, 'size': size, 'pcs_layer': 1,
+                'pcs_planned': rnd.randint(10, 80)
+            } for size in sizes)
+    db.session.execute(Mattresses.__table__.insert(), mattresses)
+    db.session.execute(MattressSize.__table__.insert(), mattress_sizes)
+
+    collaretto_id = 0
+    collarettos = []
+    details = []
+    for index in range(order_count):
+        for _ in range(collarettos_per_order):
+            collaretto_id += 1
+            collarettos.append({
+                'id': collaretto_id, 'collaretto': f"C-{collaretto_id}", 'order_commessa': f"25{index:05d}",
+                'fabric_type': 'A', 'fabric_code': FABRIC, 'fabric_color': 'C', 'item_type': 'CA',
+                'table_id': str(collaretto_id), 'row_id': f"row-{collaretto_id}"
+            })
+            pieces = rnd.randint(50, 500)
+            details.append({
+                'collaretto_id': collaretto_id, 'mattress_id': rnd.randint(1, mattress_id),
+                'pieces': pieces, 'usable_width': 150, 'roll_width': 8, 'gross_length': rnd.uniform(1, 5),
+                'pcs_seam': 1, 'cons_planned': pieces * rnd.uniform(0.01, 0.05),
+                'applicable_sizes': 'ALL'
+            })
+    db.session.execute(Collaretto.__table__.insert(), collarettos)
+    db.session.execute(CollarettoDetail.__table__.insert(), details)
+    db.session.commit()
+
+
+def legacy_consumption(style, fabric_code):
+    """The former per-row lookups, kept here as the reference (figures only)"""
+    orders = [o[0] for o in db.session.query(OrderLinesView.order_commessa).filter_by(style=style).distinct().all()]
+    collarettos = Collaretto.query.filter(
+        Collaretto.order_commessa.in_(orders), Collaretto.fabric_code == fabric_code
+    ).order_by(Collaretto.order_commessa.desc(), Collaretto.id.desc()).limit(5).all()
+
+    total_pieces = 0
+    total_consumption = 0
+    planned = {}
+    for collaretto in collarettos:
+        detail = CollarettoDetail.query.filter_by(collaretto_id=collaretto.id).first()
+        total_pieces += detail.pieces
+        total_consumption += detail.cons_planned
+        bagno = Mattresses.query.get(detail.mattress_id).dye_lot
+        if bagno not in planned:
+            planned[bagno] = {}
+            for mattress in Mattresses.query.filter_by(dye_lot=bagno).all():
+                for size_record in MattressSize.query.filter_by(mattress_id=mattress.id).all():
+                    planned[bagno][size_record.size] = planned[bagno].get(size_record.size, 0) + size_record.pcs_planned
+    return round(total_consumption / total_pieces, 4), planned
+
+
+def measure(function):
+    statements = [0]
+
+    def count(*args):
+        statements[0] += 1
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    db.session.expire_all()
+    started = time.perf_counter()
+    result = function()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    event.remove(db.engine, 'before_cursor_execute', count)
+    return result, statements[0], elapsed_ms
+
+
+def run_benchmark():
+    print("=" * 78)
+    print(f"{'case':<8} {'collarettos':>11} {'legacy sql':>10} {'legacy ms':>10} {'new sql':>8} {'new ms':>8} {'memo ms':>8} {'same':>5}")
+    print("-" * 78)
+
+    for seed_value, (name, order_count, per_order, per_bagno, size_count) in enumerate(CASES):
+        app = create_benchmark_app()
+        with app.app_context():
+            create_tables()
+            seed(random.Random(seed_value), order_count, per_order, per_bagno, size_count)
+            consumption_memo.clear()
+
+            (legacy_avg, legacy_planned), legacy_sql, legacy_ms = measure(lambda: legacy_consumption(STYLE, FABRIC))
+            (data, _), new_sql, new_ms = measure(lambda: compute_collaretto_consumption(STYLE, FABRIC))
+            get_collaretto_consumption(STYLE, FABRIC)
+            _, _, memo_ms = measure(lambda: get_collaretto_consumption(STYLE, FABRIC))
+
+            planned = {bagno: info['records'][0]['bagno_info']['planned_quantities']
+                       for bagno, info in data['bagno_groups'].items()}
+            same = legacy_avg == data['statistics']['avg_consumption_per_piece'] and legacy_planned == planned
+
+            print(f"{name:<8} {order_count * per_order:>11} {legacy_sql:>10} {legacy_ms:>10.1f} "
+                  f"{new_sql:>8} {new_ms:>8.1f} {memo_ms:>8.2f} {'yes' if same else 'NO':>5}")
+
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Load test for the connection pool settings of api/db_pool.py.
+
+Runs against the database of BaseConfig (or --uri):
+- bulk insert: 20000 rows into a scratch table with one executemany, with
+  fast_executemany off and on (SQL Server only)
+- concurrent reads: 2 and 8 threads running short queries, with the former
+  default pool (5 + 10 overflow, no pre-ping, no recycle) and with the
+  configured one; prints queries per second and the checkout wait histogram
+
+The scratch table (bench_pool_rows) is dropped at the end.
+"""
+
+import sys
+import os
+import argparse
+import threading
+import time
+
+# Add the parent directory to the path to import the app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text, Table, Column, Integer, Float, String, MetaData
+
+from api.config import BaseConfig
+from api.db_pool import TimedQueuePool, engine_options, pool_stats, reset_pool_stats
+
+BULK_ROWS = 20000
+READ_THREADS = (2, 8)
+READS_PER_THREAD = 500
+
+metadata = MetaData()
+bench_rows = Table(
+    'bench_pool_rows', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('collaretto', String(50)),
+    Column('pieces', Float),
+    Column('cons_planned', Float)
+)
+
+
+def configured_options(uri):
+    config = {name: getattr(BaseConfig, name) for name in dir(BaseConfig) if name.isupper()}
+    config['SQLALCHEMY_DATABASE_URI'] = uri
+    options = engine_options(config)
+    if not options:
+        # Other databases (local runs): same pool, without the pyodbc options
+        options = {'poolclass': TimedQueuePool, 'pool_size': BaseConfig.DB_POOL_SIZE,
+                   'max_overflow': BaseConfig.DB_MAX_OVERFLOW, 'pool_timeout': BaseConfig.DB_POOL_TIMEOUT,
+                   'pool_recycle': BaseConfig.DB_POOL_RECYCLE, 'pool_pre_ping': BaseConfig.DB_POOL_PRE_PING}
+    return options
+
+
+def make_engine(uri, **options):
+    if uri.startswith('sqlite'):
+        options['connect_args'] = {'check_same_thread': False}
+    return create_engine(uri, **options)
+
+
+def bulk_insert(uri, fast_executemany):
+    options = {'fast_executemany': fast_executemany} if uri.startswith('mssql+pyodbc') else {}
+    engine = make_engine(uri, **options)
+    rows = [{'id': i, 'collaretto': f"C-{i:06d}", 'pieces': i % 40, 'cons_planned': i * 0.01} for i in range(BULK_ROWS)]
+
+    metadata.drop_all(engine, tables=[bench_rows])
+    metadata.create_all(engine, tables=[bench_rows])
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        connection.execute(bench_rows.insert(), rows)
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    return elapsed
+
+
+def concurrent_reads(engine, thread_count):
+    errors = []
+
+    def worker():
+        try:
+            for i in range(READS_PER_THREAD):
+                with engine.connect() as connection:
+                    connection.execute(
+                        text("SELECT COUNT(*) FROM bench_pool_rows WHERE pieces = :pieces"), {'pieces': i % 40}
+                    ).scalar()
+        except Exception as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=worker) for _ in range(thread_count)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return thread_count * READS_PER_THREAD / elapsed, errors
+
+
+def run_benchmark(uri):
+    print("=" * 78)
+    print(f"Bulk insert of {BULK_ROWS} rows")
+    print("-" * 78)
+    if uri.startswith('mssql+pyodbc'):
+        for fast in (False, True):
+            print(f"fast_executemany={str(fast):<5} {bulk_insert(uri, fast):>8.2f} s")
+    else:
+        print(f"{'(not SQL Server)':<22} {bulk_insert(uri, False):>8.2f} s")
+
+    print("=" * 78)
+    print(f"{'pool':<11} {'threads':>7} {'queries/s':>10} {'avg wait ms':>12} {'max wait ms':>12}  histogram")
+    print("-" * 78)
+    pools = [
+        ("former", {'poolclass': TimedQueuePool, 'pool_size': 5, 'max_overflow': 10}),
+        ("configured", configured_options(uri)),
+    ]
+    for name, options in pools:
+        for thread_count in READ_THREADS:
+            engine = make_engine(uri, **options)
+            reset_pool_stats()
+            qps, errors = concurrent_reads(engine, thread_count)
+            stats = pool_stats(engine)
+            histogram = {bucket: count for bucket, count in stats['histogram'].items() if count}
+            print(f"{name:<11} {thread_count:>7} {qps:>10.0f} {stats['wait_ms_avg']:>12.3f} "
+                  f"{stats['wait_ms_max']:>12.2f}  {histogram}")
+            if errors:
+                print(f"  ❌ {len(errors)} errors, first: {errors[0]}")
+            engine.dispose()
+
+    metadata.drop_all(make_engine(uri), tables=[bench_rows])
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--uri', default=BaseConfig.SQLALCHEMY_DATABASE_URI,
+                        help="database to run against (default: BaseConfig)")
+    run_benchmark(parser.parse_args().uri)
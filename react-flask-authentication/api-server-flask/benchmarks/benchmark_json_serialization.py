@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the JSON encoding of large responses (api/serialization.py).
+
+Seeds 50000 mattresses into an in-memory SQLite database, then builds the
+/api/mattress/all body the former way (ORM objects, Mattresses.to_dict with
+strftime per datetime, stdlib json as Flask-RESTX does) and the new way
+(table_dicts column tuples, serialization.dumps). Prints the CPU time of
+building the rows and of encoding them, the body size, and whether both
+bodies decode to the same data.
+"""
+
+import sys
+import os
+import json
+import time
+from datetime import datetime, timedelta
+
+# Add the parent directory to the path to import the app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import event
+
+from api.models import db, Mattresses
+from api.serialization import dumps, orjson, table_dicts
+
+ROW_COUNTS = (5000, 50000)
+
+
+def create_benchmark_app():
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite://'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def create_tables():
+    # The models use a SQL Server collation name; SQLite needs it registered
+    @event.listens_for(db.engine, 'connect')
+    def register_collation(connection, record):
+        connection.create_collation('SQL_Latin1_General_CP1_CI_AS',
+                                    lambda a, b: (a.lower() > b.lower()) - (a.lower() < b.lower()))
+
+    db.engine.dispose()
+    db.metadata.create_all(bind=db.engine, tables=[Mattresses.__table__])
+
+
+def seed(row_count):
+    started = datetime(2025, 1, 1, 6, 0, 0)
+    db.session.execute(Mattresses.__table__.insert(), [{
+        'id': i, 'mattress': f"ASA-25-{i:06d}", 'order_commessa': f"25{i // 20:05d}",
+        'fabric_type': 'A', 'fabric_code': f"FAB-{i % 300:03d}", 'fabric_color': f"{i % 50:04d}",
+        'dye_lot': f"B{i % 900}" if i % 3 else None, 'item_type': 'AS', 'spreading_method': 'FACE UP',
+        'created_at': started + timedelta(minutes=i), 'updated_at': started + timedelta(minutes=i, seconds=30),
+        'table_id': f"table-{i // 8}", 'row_id': f"row-{i}", 'sequence_number': i % 8
+    } for i in range(1, row_count + 1)])
+    db.session.commit()
+
+
+def cpu(function):
+    started = time.process_time()
+    result = function()
+    return result, (time.process_time() - started) * 1000
+
+
+def run_benchmark():
+    encoder = "orjson" if orjson else "stdlib json (orjson not installed)"
+    print("=" * 84)
+    print(f"New encoder: {encoder}")
+    print(f"{'rows':>6} {'legacy rows ms':>15} {'legacy json ms':>15} {'new rows ms':>12} {'new json ms':>12} "
+          f"{'MB':>6} {'same':>5}")
+    print("-" * 84)
+
+    for row_count in ROW_COUNTS:
+        app = create_benchmark_app()
+        with app.app_context():
+            create_tables()
+            seed(row_count)
+
+            db.session.expire_all()
+            legacy_rows, legacy_rows_ms = cpu(lambda: [m.to_dict() for m in Mattresses.get_all()])
+            legacy_body, legacy_json_ms = cpu(lambda: json.dumps({"success": True, "data": legacy_rows}).encode('utf-8'))
+
+            new_rows, new_rows_ms = cpu(lambda: table_dicts(Mattresses))
+            new_body, new_json_ms = cpu(lambda: dumps({"success": True, "data": new_rows}))
+
+            same = json.loads(legacy_body) == json.loads(new_body)
+            print(f"{row_count:>6} {legacy_rows_ms:>15.0f} {legacy_json_ms:>15.0f} {new_rows_ms:>12.0f} "
+                  f"{new_json_ms:>12.0f} {len(new_body) / 1e6:>6.1f} {'yes' if same else 'NO':>5}")
+            db.session.remove()
+
+    print("=" * 84)
+
+
+if __name__ == "__main__":
+    run_benchmark()
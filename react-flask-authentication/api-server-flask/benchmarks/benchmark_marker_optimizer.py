@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the marker-mix optimizer used by /api/marker_calculator/optimize.
+
+Generates synthetic orders and candidate markers from a fixed seed, so every
+run solves exactly the same problems. The local search is capped by iterations
+(not time) to keep the results reproducible; elapsed time is reported so that
+regressions on large orders are visible.
+"""
+
+import sys
+import os
+import random
+import time
+
+# Add the parent directory to the path to import the app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.marker_optimizer import optimize_marker_mix
+
+# (name, number of sizes, number of candidate markers, pieces per size range)
+CASES = [
+    ("small", 4, 20, (50, 300)),
+    ("medium", 8, 60, (200, 1500)),
+    ("large", 12, 150, (500, 4000)),
+    ("huge", 16, 400, (1000, 8000)),
+]
+
+ITERATIONS = 300
+TIME_BUDGET = 10.0  # seconds, high enough that the iteration cap always decides
+
+
+def build_case(seed, size_count, marker_count, quantity_range):
+    """Build a reproducible demand and marker set"""
+    rnd = random.Random(seed)
+    sizes = [f"S{i:02d}" for i in range(size_count)]
+    demand = {size: rnd.randint(*quantity_range) for size in sizes}
+
+    markers = []
+    for index in range(marker_count):
+        # Markers carry 2-6 sizes with 1-3 pieces each, like real nesting output
+        chosen = rnd.sample(sizes, rnd.randint(min(2, size_count), min(6, size_count)))
+        size_quantities = {size: rnd.randint(1, 3) for size in chosen}
+        pieces = sum(size_quantities.values())
+        markers.append({
+            "id": index + 1,
+            "marker_name": f"BENCH-{index:04d}",
+            "marker_width": 160,
+            "marker_length": round(pieces * rnd.uniform(0.35, 0.5), 3),
+            "size_quantities": size_quantities
+        })
+    return demand, markers
+
+
+def run_benchmark():
+    print("=" * 78)
+    print(f"{'case':<8} {'sizes':>5} {'markers':>7} {'greedy m':>10} {'best m':>10} {'overcut':>8} {'rows':>5} {'ms':>9}")
+    print("-" * 78)
+
+    for seed, (name, size_count, marker_count, quantity_range) in enumerate(CASES):
+        demand, markers = build_case(seed, size_count, marker_count, quantity_range)
+
+        started = time.perf_counter()
+        result = optimize_marker_mix(
+            demand,
+            markers,
+            time_budget=TIME_BUDGET,
+            max_iterations=ITERATIONS,
+            max_layers=100,
+            max_markers=8,
+            seed=seed
+        )
+        elapsed_ms = (time.perf_counter() - started) * 1000
+
+        print(f"{name:<8} {size_count:>5} {marker_count:>7} "
+              f"{result['stats']['greedy_meters']:>10.1f} {result['total_meters']:>10.1f} "
+              f"{result['total_overcut']:>8.0f} {len(result['plan']):>5} {elapsed_ms:>9.1f}")
+
+    print("=" * 78)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the boot of the gunicorn workers (preload_app in gunicorn-cfg.py).
+
+Boots 9 workers two ways against the database of BaseConfig (or --uri):
+- former: 9 processes started together, each importing the app, running
+  create_app(), db.create_all() and the BOM probe (what every worker did)
+- preload: one process running create_app() and prepare_preload(), then 9
+  forked children running init_worker() (what gunicorn does now)
+
+Prints the wall time until every worker is ready and the SQL statements sent
+to the database during the boot. The tables are created once before timing,
+as they exist in production.
+"""
+
+import sys
+import os
+import argparse
+import contextlib
+import io
+import subprocess
+import time
+
+# Add the parent directory to the path to import the app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from api.config import BaseConfig
+
+WORKERS = 9
+
+statements = [0]
+
+
+def quiet(function, *args):
+    """Call without the startup banners of the app"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        return function(*args)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def count_statement(connection, cursor, statement, parameters, context, executemany):
+    statements[0] += 1
+
+
+@event.listens_for(Engine, 'connect')
+def register_collation(connection, record):
+    # The models use a SQL Server collation name; SQLite (--uri sqlite:///...) needs it registered
+    if hasattr(connection, 'create_collation'):
+        connection.create_collation('SQL_Latin1_General_CP1_CI_AS',
+                                    lambda a, b: (a.lower() > b.lower()) - (a.lower() < b.lower()))
+
+
+def boot_former_worker():
+    """One worker of the former boot; prints its statement count"""
+    from api import create_app
+    from api.models import db
+    from api.bom_cache import probe_nav_bom
+
+    app = quiet(create_app)
+    with app.app_context():
+        db.create_all()
+        probe_nav_bom()
+    print(statements[0])
+
+
+def boot(uri, mode, processes):
+    """Wall time until every process of the boot exits, and the statements they report"""
+    started = time.perf_counter()
+    workers = [subprocess.Popen([sys.executable, os.path.abspath(__file__), '--uri', uri, mode],
+                                stdout=subprocess.PIPE, text=True) for _ in range(processes)]
+    counts = [int(worker.communicate()[0].strip().splitlines()[-1]) for worker in workers]
+    return time.perf_counter() - started, sum(counts)
+
+
+def boot_preload_master():
+    """The gunicorn master with preload_app: one app, forked workers; prints the statement count"""
+    from api import create_app, prepare_preload, init_worker
+
+    app = quiet(create_app)
+    quiet(prepare_preload, app)
+    master_statements = statements[0]
+
+    read_fd, write_fd = os.pipe()
+    children = []
+    for _ in range(WORKERS):
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_fd)
+            statements[0] = 0
+            init_worker(app)
+            os.write(write_fd, f"{statements[0]}\n".encode())
+            os._exit(0)
+        children.append(pid)
+    os.close(write_fd)
+    for pid in children:
+        os.waitpid(pid, 0)
+
+    with os.fdopen(read_fd) as counts:
+        worker_statements = sum(int(line) for line in counts.read().split())
+    print(master_statements + worker_statements)
+
+
+def run_benchmark(uri):
+    from api import create_app
+    from api.models import db
+
+    with quiet(create_app).app_context():
+        db.create_all()
+        db.engine.dispose()
+
+    print("=" * 60)
+    print(f"{'boot':<10} {'workers':>8} {'seconds':>10} {'SQL statements':>16}")
+    print("-" * 60)
+    elapsed, count = boot(uri, '--former-worker', WORKERS)
+    print(f"{'former':<10} {WORKERS:>8} {elapsed:>10.2f} {count:>16}")
+    elapsed, count = boot(uri, '--preload-master', 1)
+    print(f"{'preload':<10} {WORKERS:>8} {elapsed:>10.2f} {count:>16}")
+    print("=" * 60)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--uri', default=BaseConfig.SQLALCHEMY_DATABASE_URI,
+                        help="database to run against (default: BaseConfig)")
+    parser.add_argument('--former-worker', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--preload-master', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    BaseConfig.SQLALCHEMY_DATABASE_URI = args.uri
+    if args.former_worker:
+        boot_former_worker()
+    elif args.preload_master:
+        boot_preload_master()
+    else:
+        run_benchmark(args.uri)
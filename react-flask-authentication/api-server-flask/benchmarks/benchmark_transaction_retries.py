@@ -0,0 +1,254 @@
+#!/usr/bin/env python3
+"""
+Concurrency harness for @transactional (api/transactions.py).
+
+Reproduces lock conflicts with two connections against a scratch table
+(bench_tx_rows) and checks that the unit of work is rolled back, run again
+and either succeeds or gives up with the 503 of the routes:
+- lock released: a second connection holds a write lock on the row for 0.5 s;
+  the unit times out waiting, retries and commits once the lock is released
+- lock held: the second connection holds the lock longer than every retry;
+  the route answers 503 "Database is busy" and nothing is written
+- deadlock stand-in: the first attempt writes, then fails with the pyodbc
+  message of a SQL Server deadlock victim (1205); the write is rolled back
+  and the retry commits it once
+- crossed updates: two threads update two rows in opposite order; on SQL
+  Server one is chosen as deadlock victim (1205), on SQLite it waits for the
+  other writer's lock; both units end up committed
+
+Runs on a temporary SQLite file by default, or against --uri (the lock wait
+is bounded with SET LOCK_TIMEOUT on SQL Server, to get 1222 instead of
+waiting forever). Prints the retry counters of each scenario and exits with
+1 if any check fails. The scratch tables are dropped at the end.
+"""
+
+import sys
+import os
+import argparse
+import tempfile
+import threading
+import time
+
+# Add the parent directory to the path to import the app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from sqlalchemy import create_engine, text, Table, Column, Integer, String, MetaData
+from sqlalchemy.exc import OperationalError
+
+from api.models import db
+from api.transactions import transactional, retryable_error, transaction_stats
+
+LOCK_WAIT_MS = 200
+SHORT_HOLD_SECONDS = 0.5
+LONG_HOLD_SECONDS = 5.0
+
+metadata = MetaData()
+bench_rows = Table(
+    'bench_tx_rows', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=False),
+    Column('value', Integer)
+)
+bench_log = Table(
+    'bench_tx_log', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('note', String(50))
+)
+
+# pyodbc message of a deadlock victim, as SQLAlchemy wraps it
+DEADLOCK_MESSAGE = ("('40001', '[40001] [Microsoft][ODBC Driver 18 for SQL Server][SQL Server]Transaction "
+                    "(Process ID 57) was deadlocked on lock resources with another process and has been "
+                    "chosen as the deadlock victim. Rerun the transaction. (1205) (SQLExecDirectW)')")
+
+
+def create_benchmark_app(uri):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if uri.startswith('sqlite'):
+        # The busy timeout plays the part of SQL Server's LOCK_TIMEOUT
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'connect_args': {'timeout': LOCK_WAIT_MS / 1000, 'check_same_thread': False}
+        }
+    db.init_app(app)
+
+    @app.route('/bench/rows/<int:row_id>', methods=['POST'])
+    def update_row(row_id):
+        # Same error handling as the routes using @transactional
+        try:
+            add_to_row(row_id, 1)
+            return {"success": True}
+        except Exception as e:
+            if retryable_error(e):
+                return {"success": False, "message": "Database is busy, please try again in a moment."}, 503
+            return {"success": False, "message": str(e)}, 500
+
+    return app
+
+
+def bound_lock_wait():
+    if db.engine.dialect.name == 'mssql':
+        db.session.execute(text(f"SET LOCK_TIMEOUT {LOCK_WAIT_MS}"))
+
+
+@transactional(retries=4, base_delay=0.05, max_delay=0.4)
+def add_to_row(row_id, amount):
+    bound_lock_wait()
+    db.session.execute(text("UPDATE bench_tx_rows SET value = value + :amount WHERE id = :id"),
+                       {'amount': amount, 'id': row_id})
+
+
+deadlock_attempts = [0]
+
+
+@transactional(retries=4, base_delay=0.05, max_delay=0.4)
+def log_with_deadlock_on_first_attempt(note):
+    deadlock_attempts[0] += 1
+    db.session.execute(bench_log.insert(), {'note': note})
+    if deadlock_attempts[0] == 1:
+        raise OperationalError("INSERT INTO bench_tx_log", {}, Exception(DEADLOCK_MESSAGE))
+
+
+@transactional(retries=4, base_delay=0.05, max_delay=0.4)
+def crossed_update(first, second, pause):
+    bound_lock_wait()
+    for index, row_id in enumerate((first, second)):
+        db.session.execute(text("UPDATE bench_tx_rows SET value = value + 1 WHERE id = :id"), {'id': row_id})
+        if index == 0:
+            time.sleep(pause)
+
+
+def hold_row_lock(engine, row_id, seconds, locked):
+    """Second connection: write the row and keep the transaction open"""
+    with engine.begin() as connection:
+        connection.execute(text("UPDATE bench_tx_rows SET value = value WHERE id = :id"), {'id': row_id})
+        locked.set()
+        time.sleep(seconds)
+
+
+def row_value(row_id):
+    value = db.session.execute(text("SELECT value FROM bench_tx_rows WHERE id = :id"), {'id': row_id}).scalar()
+    db.session.rollback()
+    return value
+
+
+def counters_since(before, name):
+    after = transaction_stats()
+    delta = {}
+    for endpoint, counters in after.items():
+        if name in endpoint:
+            previous = before.get(endpoint, {})
+            for counter, value in counters.items():
+                delta[counter] = delta.get(counter, 0) + value - previous.get(counter, 0)
+    return delta
+
+
+def run_with_blocker(app, engine, hold_seconds):
+    locked = threading.Event()
+    blocker = threading.Thread(target=hold_row_lock, args=(engine, 1, hold_seconds, locked))
+    blocker.start()
+    locked.wait()
+    started = time.perf_counter()
+    response = app.test_client().post('/bench/rows/1')
+    elapsed = time.perf_counter() - started
+    blocker.join()
+    return response, elapsed
+
+
+def scenario_lock_released(app, engine):
+    before_value, before = row_value(1), transaction_stats()
+    response, elapsed = run_with_blocker(app, engine, SHORT_HOLD_SECONDS)
+    counters = counters_since(before, 'update_row')
+    ok = (response.status_code == 200 and row_value(1) == before_value + 1
+          and counters.get('retries', 0) >= 1 and counters.get('failures', 0) == 0)
+    return ok, f"HTTP {response.status_code} after {elapsed:.2f}s", counters
+
+
+def scenario_lock_held(app, engine):
+    before_value, before = row_value(1), transaction_stats()
+    response, elapsed = run_with_blocker(app, engine, LONG_HOLD_SECONDS)
+    counters = counters_since(before, 'update_row')
+    ok = response.status_code == 503 and row_value(1) == before_value and counters.get('failures', 0) == 1
+    return ok, f"HTTP {response.status_code} after {elapsed:.2f}s", counters
+
+
+def scenario_deadlock_stand_in(app, engine):
+    before = transaction_stats()
+    deadlock_attempts[0] = 0
+    log_with_deadlock_on_first_attempt('deadlock stand-in')
+    rows = db.session.execute(text("SELECT COUNT(*) FROM bench_tx_log")).scalar()
+    db.session.rollback()
+    counters = counters_since(before, 'log_with_deadlock')
+    ok = rows == 1 and deadlock_attempts[0] == 2 and counters.get('deadlocks', 0) == 1
+    return ok, f"{deadlock_attempts[0]} attempts, {rows} row written", counters
+
+
+def scenario_crossed_updates(app, engine):
+    before_values, before = (row_value(1), row_value(2)), transaction_stats()
+    errors = []
+
+    def worker(first, second):
+        try:
+            with app.app_context():
+                crossed_update(first, second, 0.3)
+        except Exception as e:
+            errors.append(str(e))
+
+    threads = [threading.Thread(target=worker, args=(1, 2)), threading.Thread(target=worker, args=(2, 1))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    counters = counters_since(before, 'crossed_update')
+    ok = (not errors and (row_value(1), row_value(2)) == (before_values[0] + 2, before_values[1] + 2)
+          and counters.get('retries', 0) >= 1)
+    return ok, errors[0][:60] if errors else "both committed", counters
+
+
+SCENARIOS = [
+    ("lock released", scenario_lock_released),
+    ("lock held", scenario_lock_held),
+    ("deadlock stand-in", scenario_deadlock_stand_in),
+    ("crossed updates", scenario_crossed_updates),
+]
+
+
+def run_benchmark(uri):
+    app = create_benchmark_app(uri)
+    blocker_engine = create_engine(uri, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    failed = 0
+
+    with app.app_context():
+        metadata.drop_all(db.engine)
+        metadata.create_all(db.engine)
+        db.session.execute(bench_rows.insert(), [{'id': 1, 'value': 0}, {'id': 2, 'value': 0}])
+        db.session.commit()
+
+        print("=" * 96)
+        print(f"{'scenario':<18} {'check':>5}  {'outcome':<28} {'attempts':>8} {'retries':>7} {'deadlocks':>9} "
+              f"{'lock t/o':>8} {'failures':>8}")
+        print("-" * 96)
+        for name, scenario in SCENARIOS:
+            ok, outcome, counters = scenario(app, blocker_engine)
+            failed += not ok
+            print(f"{name:<18} {'PASS' if ok else 'FAIL':>5}  {outcome:<28} {counters.get('attempts', 0):>8} "
+                  f"{counters.get('retries', 0):>7} {counters.get('deadlocks', 0):>9} "
+                  f"{counters.get('lock_timeouts', 0):>8} {counters.get('failures', 0):>8}")
+        print("=" * 96)
+
+        db.session.remove()
+        metadata.drop_all(db.engine)
+    blocker_engine.dispose()
+    return failed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--uri', help="database to run against (default: a temporary SQLite file)")
+    args = parser.parse_args()
+
+    if args.uri:
+        sys.exit(1 if run_benchmark(args.uri) else 0)
+    with tempfile.TemporaryDirectory() as directory:
+        sys.exit(1 if run_benchmark(f"sqlite:///{os.path.join(directory, 'bench_tx.db')}") else 0)
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Benchmark for API calls made through the VPN prefix (/web_forward_CuttingApplicationAPI/api/...).
+
+Builds two small Flask apps with the same API routes: one forwards prefixed
+calls through current_app.test_client() like the former serve_react_app_vpn
+route, the other is wrapped in api.prefix_dispatch.PrefixDispatch. Both are
+called with the same GET and POST payloads; the script prints the mean and
+p95 latency per call and the peak memory allocated during one call
+(tracemalloc), and checks that both return the same body.
+"""
+
+import sys
+import os
+import json
+import statistics
+import time
+import tracemalloc
+
+# Add the parent directory to the path to import the app
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, Response, request, current_app, jsonify
+
+from api.prefix_dispatch import PrefixDispatch, VPN_PREFIX
+
+# (name, method, path, body size in rows)
+CASES = [
+    ("get small", "GET", "/api/rows", 50),
+    ("get large", "GET", "/api/rows", 20000),
+    ("post small", "POST", "/api/echo", 50),
+    ("post large", "POST", "/api/echo", 20000),
+]
+
+CALLS = 200
+
+
+def add_api_routes(app):
+    @app.route('/api/rows')
+    def rows():
+        count = int(request.args.get('count', 10))
+        return jsonify([{"id": i, "collaretto": f"C-{i:06d}", "pieces": i % 40, "cons_planned": i * 0.01}
+                        for i in range(count)])
+
+    @app.route('/api/echo', methods=['POST'])
+    def echo():
+        data = request.get_json()
+        return jsonify({"rows": len(data["rows"]), "pieces": sum(row["pieces"] for row in data["rows"])})
+
+
+def create_legacy_app():
+    """Prefixed calls replayed through the test client (the former proxy route)"""
+    app = Flask(__name__)
+    add_api_routes(app)
+
+    @app.route(f'{VPN_PREFIX}/<path:path>', methods=['GET', 'POST'])
+    def forward(path):
+        with current_app.test_client() as client:
+            if request.method == 'GET':
+                response = client.get('/' + path, headers=dict(request.headers), query_string=request.query_string)
+            else:
+                response = client.post('/' + path, headers=dict(request.headers), data=request.get_data(),
+                                       query_string=request.query_string)
+            return Response(response.get_data(), status=response.status_code,
+                            headers=dict(response.headers), mimetype=response.mimetype)
+
+    return app
+
+
+def create_dispatch_app():
+    app = Flask(__name__)
+    add_api_routes(app)
+    app.wsgi_app = PrefixDispatch(app.wsgi_app)
+    return app
+
+
+def call(client, method, path, size):
+    url = VPN_PREFIX + path
+    if method == 'GET':
+        return client.get(url, query_string={"count": size})
+    body = {"rows": [{"id": i, "pieces": i % 40, "applicable_sizes": "S-M-L"} for i in range(size)]}
+    return client.post(url, data=json.dumps(body), content_type='application/json')
+
+
+def measure(app, method, path, size):
+    client = app.test_client()
+    body = call(client, method, path, size).get_data()  # warm-up, and the body to compare
+
+    timings = []
+    for _ in range(CALLS if size < 1000 else CALLS // 10):
+        started = time.perf_counter()
+        call(client, method, path, size)
+        timings.append((time.perf_counter() - started) * 1000)
+
+    tracemalloc.start()
+    call(client, method, path, size)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    p95 = statistics.quantiles(timings, n=20)[-1]
+    return body, statistics.mean(timings), p95, peak / 1024
+
+
+def run_benchmark():
+    legacy_app = create_legacy_app()
+    dispatch_app = create_dispatch_app()
+
+    print("=" * 96)
+    print(f"{'case':<11} {'legacy ms':>10} {'legacy p95':>11} {'legacy KiB':>11} "
+          f"{'new ms':>8} {'new p95':>8} {'new KiB':>8} {'same':>5}")
+    print("-" * 96)
+
+    for name, method, path, size in CASES:
+        legacy_body, legacy_ms, legacy_p95, legacy_kib = measure(legacy_app, method, path, size)
+        new_body, new_ms, new_p95, new_kib = measure(dispatch_app, method, path, size)
+
+        print(f"{name:<11} {legacy_ms:>10.2f} {legacy_p95:>11.2f} {legacy_kib:>11.0f} "
+              f"{new_ms:>8.2f} {new_p95:>8.2f} {new_kib:>8.0f} {'yes' if legacy_body == new_body else 'NO':>5}")
+
+    print("=" * 96)
+
+
+if __name__ == "__main__":
+    run_benchmark()
@@ -4,13 +4,16 @@ Sets "0 - NOT SET" to FALSE and "5 - COMPLETED" to TRUE with operator.
 
 Run this from the api-server-flask directory:
 cd react-flask-authentication/api-server-flask
-python fix_wrong_status_phases.py
+python fix_wrong_status_phases.py         # asks for confirmation before updating
+python fix_wrong_status_phases.py --yes   # no prompt (background job, cron)
 """
 
+import sys
+
 from api import create_app
 from api.models import db, Mattresses, MattressDetail, MattressPhase, MattressProductionCenter
 
-def fix_wrong_status_phases():
+def fix_wrong_status_phases(assume_yes=False):
     """
     Find all mattresses with:
     - cons_actual > 0
@@ -81,7 +84,11 @@ def fix_wrong_status_phases():
         
         # Ask for confirmation
         print()
-        response = input(f"Do you want to fix all {len(mattresses_to_fix)} mattresses? (yes/no): ")
+        if assume_yes:
+            response = 'yes'
+            print(f"Fixing all {len(mattresses_to_fix)} mattresses (--yes)")
+        else:
+            response = input(f"Do you want to fix all {len(mattresses_to_fix)} mattresses? (yes/no): ")
         
         if response.lower() not in ['yes', 'y']:
             print("❌ Operation cancelled.")
@@ -165,5 +172,5 @@ def fix_wrong_status_phases():
 
 
 if __name__ == '__main__':
-    fix_wrong_status_phases()
+    fix_wrong_status_phases(assume_yes='--yes' in sys.argv[1:])
 
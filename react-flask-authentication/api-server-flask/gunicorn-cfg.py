@@ -18,3 +18,19 @@ keepalive = 5
 
 # 🔁 Reload disabled for production (default)
 # reload = False
+
+# 🚀 Load the app once in the master, then fork the workers with everything imported
+# (no per-worker app build; restart the container to deploy new code, HUP does not reload it)
+preload_app = True
+
+def when_ready(server):
+    # One-time checks, then drop the master's connections before the workers fork
+    from run import app
+    from api import prepare_preload
+    prepare_preload(app)
+
+def post_fork(server, worker):
+    # Fork-safe engine: each worker opens its own connections
+    from run import app
+    from api import init_worker
+    init_worker(app)
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Migration script to add lookup indexes on marker_headers and marker_lines.
+
+Markers are looked up by name (marker_pcs, add_mattress_row, import duplicate
+detection, collaretto paths), by status/model (planning) and their lines by
+marker_header_id. None of these columns was indexed, so every lookup scanned
+the table.
+
+This migration:
+1. Creates ix_marker_headers_marker_name on marker_headers(marker_name)
+2. Creates ix_marker_headers_status_model_variant on marker_headers(status, model, variant)
+3. Creates ix_marker_lines_marker_header_id on marker_lines(marker_header_id)
+   INCLUDE (style, size, pcs_on_layer)
+4. Checks the query plans of the lookups and reports seeks vs scans
+
+marker_name is indexed but not unique: when a shorter marker is imported, the
+previous one is kept as NOT ACTIVE under the same name.
+
+Run with "verify" to only check the query plans.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import create_app
+from api.models import db
+from sqlalchemy import text
+import traceback
+
+INDEXES = [
+    ("marker_headers", "ix_marker_headers_marker_name", """
+        CREATE NONCLUSTERED INDEX ix_marker_headers_marker_name
+        ON marker_headers (marker_name)
+    """),
+    ("marker_headers", "ix_marker_headers_status_model_variant", """
+        CREATE NONCLUSTERED INDEX ix_marker_headers_status_model_variant
+        ON marker_headers (status, model, variant)
+    """),
+    ("marker_lines", "ix_marker_lines_marker_header_id", """
+        CREATE NONCLUSTERED INDEX ix_marker_lines_marker_header_id
+        ON marker_lines (marker_header_id)
+        INCLUDE (style, size, pcs_on_layer)
+    """),
+]
+
+# (description, query, index expected to be seeked)
+PLAN_CHECKS = [
+    ("marker by name",
+     "SELECT id FROM marker_headers WHERE marker_name = 'PLAN_CHECK'",
+     "ix_marker_headers_marker_name"),
+    ("active markers by model",
+     "SELECT id FROM marker_headers WHERE status = 'ACTIVE' AND model = 'PLAN_CHECK'",
+     "ix_marker_headers_status_model_variant"),
+    ("marker lines by header",
+     "SELECT style, size, pcs_on_layer FROM marker_lines WHERE marker_header_id = 1",
+     "ix_marker_lines_marker_header_id"),
+]
+
+def index_exists(table_name, index_name):
+    return db.session.execute(text("""
+        SELECT 1
+        FROM sys.indexes
+        WHERE name = :index_name
+        AND object_id = OBJECT_ID(:table_name)
+    """), {"index_name": index_name, "table_name": table_name}).fetchone() is not None
+
+def verify_query_plans():
+    """Return True if every lookup uses an Index Seek on the expected index"""
+    all_seeks = True
+
+    # SHOWPLAN must run on its own batch on a dedicated connection
+    with db.engine.connect() as connection:
+        connection.execute(text("SET SHOWPLAN_TEXT ON"))
+        try:
+            for description, query, index_name in PLAN_CHECKS:
+                plan = "\n".join(row[0] for row in connection.execute(text(query)).fetchall())
+                seek = "Index Seek" in plan and index_name in plan
+                all_seeks = all_seeks and seek
+                print(f"{'✅' if seek else '❌'} {description}: {'Index Seek on ' + index_name if seek else 'no seek on ' + index_name}")
+                if not seek:
+                    print(plan)
+        finally:
+            connection.execute(text("SET SHOWPLAN_TEXT OFF"))
+
+    return all_seeks
+
+def run_migration():
+    """Run the migration to add marker lookup indexes"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print("🔄 Starting migration: Add marker lookup indexes...")
+
+            created = 0
+            for table_name, index_name, statement in INDEXES:
+                if index_exists(table_name, index_name):
+                    print(f"✅ {index_name} already exists")
+                    continue
+
+                print(f"📝 Creating {index_name} on {table_name}...")
+                db.session.execute(text(statement))
+                created += 1
+
+            db.session.commit()
+            print("✅ Migration completed successfully!")
+            print(f"   Created: {created} index(es)")
+
+            print("🔍 Checking query plans...")
+            if not verify_query_plans():
+                print("⚠️ Some lookups do not use an index seek (statistics may need an update)")
+
+            return True
+
+        except Exception as e:
+            print(f"❌ Migration failed: {str(e)}")
+            print(f"📋 Error details: {traceback.format_exc()}")
+            db.session.rollback()
+            return False
+
+def rollback_migration():
+    """Rollback the migration (drop marker lookup indexes)"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print("🔄 Starting rollback: Drop marker lookup indexes...")
+
+            for table_name, index_name, _ in INDEXES:
+                if index_exists(table_name, index_name):
+                    print(f"📝 Dropping {index_name}...")
+                    db.session.execute(text(f"DROP INDEX {index_name} ON {table_name}"))
+
+            db.session.commit()
+            print("✅ Rollback completed successfully!")
+
+            return True
+
+        except Exception as e:
+            print(f"❌ Rollback failed: {str(e)}")
+            print(f"📋 Error details: {traceback.format_exc()}")
+            db.session.rollback()
+            return False
+
+def run_verification():
+    """Only check the query plans"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            return verify_query_plans()
+        except Exception as e:
+            print(f"❌ Verification failed: {str(e)}")
+            return False
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "rollback":
+        success = rollback_migration()
+    elif len(sys.argv) > 1 and sys.argv[1] == "verify":
+        success = run_verification()
+    else:
+        success = run_migration()
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Migration script to add version column to collaretto_details table.
+
+The version is bumped on every save of a row from the logistic collaretto
+screen. Saves that send an older version are rejected with 409 so two
+logistic screens cannot silently overwrite each other.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import create_app
+from api.models import db
+from sqlalchemy import text
+import traceback
+
+def run_migration():
+    """Run the migration to add version to collaretto_details table"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print("🔄 Starting migration: Add version to collaretto_details table...")
+
+            # Check if version column already exists
+            result = db.session.execute(text("""
+                SELECT COLUMN_NAME
+                FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_NAME = 'collaretto_details'
+                AND COLUMN_NAME = 'version'
+            """)).fetchone()
+
+            if result:
+                print("✅ version column already exists in collaretto_details table")
+                return True
+
+            # Existing rows start at version 1
+            print("📝 Adding version column to collaretto_details table...")
+            db.session.execute(text("""
+                ALTER TABLE collaretto_details
+                ADD version INT NOT NULL
+                CONSTRAINT df_collaretto_details_version DEFAULT 1
+            """))
+
+            db.session.commit()
+            print("✅ Migration completed successfully!")
+            print("📋 Summary:")
+            print("   - Added version column to collaretto_details table (existing rows = 1)")
+
+            return True
+
+        except Exception as e:
+            print(f"❌ Migration failed: {str(e)}")
+            print(f"📋 Error details: {traceback.format_exc()}")
+            db.session.rollback()
+            return False
+
+def rollback_migration():
+    """Rollback the migration (remove version column)"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print("🔄 Starting rollback: Remove version from collaretto_details table...")
+
+            db.session.execute(text("""
+                ALTER TABLE collaretto_details
+                DROP CONSTRAINT df_collaretto_details_version
+            """))
+            db.session.execute(text("""
+                ALTER TABLE collaretto_details
+                DROP COLUMN version
+            """))
+
+            db.session.commit()
+            print("✅ Rollback completed successfully!")
+
+            return True
+
+        except Exception as e:
+            print(f"❌ Rollback failed: {str(e)}")
+            print(f"📋 Error details: {traceback.format_exc()}")
+            db.session.rollback()
+            return False
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "rollback":
+        success = rollback_migration()
+    else:
+        success = run_migration()
+
+    sys.exit(0 if success else 1)
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Migration script to add version column to marker_calculator_data table.
+
+The version is bumped on every save of a calculator tab. Saves that send an
+older version are rejected with 409 so concurrent editors cannot silently
+overwrite each other.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import create_app
+from api.models import db
+from sqlalchemy import text
+import traceback
+
+def run_migration():
+    """Run the migration to add version to marker_calculator_data table"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print("🔄 Starting migration: Add version to marker_calculator_data table...")
+
+            # Check if version column already exists
+            result = db.session.execute(text("""
+                SELECT COLUMN_NAME
+                FROM INFORMATION_SCHEMA.COLUMNS
+                WHERE TABLE_NAME = 'marker_calculator_data'
+                AND COLUMN_NAME = 'version'
+            """)).fetchone()
+
+            if result:
+                print("✅ version column already exists in marker_calculator_data table")
+                return True
+
+            # Existing tabs start at version 1
+            print("📝 Adding version column to marker_calculator_data table...")
+            db.session.execute(text("""
+                ALTER TABLE marker_calculator_data
+                ADD version INT NOT NULL
+                CONSTRAINT df_marker_calculator_data_version DEFAULT 1
+            """))
+
+            db.session.commit()
+            print("✅ Migration completed successfully!")
+            print("📋 Summary:")
+            print("   - Added version column to marker_calculator_data table (existing rows = 1)")
+
+            return True
+
+        except Exception as e:
+            print(f"❌ Migration failed: {str(e)}")
+            print(f"📋 Error details: {traceback.format_exc()}")
+            db.session.rollback()
+            return False
+
+def rollback_migration():
+    """Rollback the migration (remove version column)"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print("🔄 Starting rollback: Remove version from marker_calculator_data table...")
+
+            db.session.execute(text("""
+                ALTER TABLE marker_calculator_data
+                DROP CONSTRAINT df_marker_calculator_data_version
+            """))
+            db.session.execute(text("""
+                ALTER TABLE marker_calculator_data
+                DROP COLUMN version
+            """))
+
+            db.session.commit()
+            print("✅ Rollback completed successfully!")
+
+            return True
+
+        except Exception as e:
+            print(f"❌ Rollback failed: {str(e)}")
+            print(f"📋 Error details: {traceback.format_exc()}")
+            db.session.rollback()
+            return False
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "rollback":
+        success = rollback_migration()
+    else:
+        success = run_migration()
+
+    sys.exit(0 if success else 1)
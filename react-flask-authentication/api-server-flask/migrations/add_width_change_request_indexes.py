@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Migration script to add the (status, mattress_id) index on width_change_requests.
+
+The mattress lists flag mattresses with a pending width change request and
+the planner badge counts pending requests; both filter on status and
+mattress_id, which were not indexed.
+
+This migration:
+1. Creates ix_width_change_requests_status_mattress on width_change_requests(status, mattress_id)
+2. Checks the query plan of the pending lookup and reports seek vs scan
+
+Run with "verify" to only check the query plan.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import create_app
+from api.models import db
+from sqlalchemy import text
+import traceback
+
+INDEXES = [
+    ("width_change_requests", "ix_width_change_requests_status_mattress", """
+        CREATE NONCLUSTERED INDEX ix_width_change_requests_status_mattress
+        ON width_change_requests (status, mattress_id)
+    """),
+]
+
+# (description, query, index expected to be seeked)
+PLAN_CHECKS = [
+    ("pending requests of mattresses",
+     "SELECT DISTINCT mattress_id FROM width_change_requests WHERE status = 'pending' AND mattress_id IN (1, 2, 3)",
+     "ix_width_change_requests_status_mattress"),
+]
+
+def index_exists(table_name, index_name):
+    return db.session.execute(text("""
+        SELECT 1
+        FROM sys.indexes
+        WHERE name = :index_name
+        AND object_id = OBJECT_ID(:table_name)
+    """), {"index_name": index_name, "table_name": table_name}).fetchone() is not None
+
+def verify_query_plans():
+    """Return True if every lookup uses an Index Seek on the expected index"""
+    all_seeks = True
+
+    # SHOWPLAN must run on its own batch on a dedicated connection
+    with db.engine.connect() as connection:
+        connection.execute(text("SET SHOWPLAN_TEXT ON"))
+        try:
+            for description, query, index_name in PLAN_CHECKS:
+                plan = "\n".join(row[0] for row in connection.execute(text(query)).fetchall())
+                seek = "Index Seek" in plan and index_name in plan
+                all_seeks = all_seeks and seek
+                print(f"{'✅' if seek else '❌'} {description}: {'Index Seek on ' + index_name if seek else 'no seek on ' + index_name}")
+                if not seek:
+                    print(plan)
+        finally:
+            connection.execute(text("SET SHOWPLAN_TEXT OFF"))
+
+    return all_seeks
+
+def run_migration():
+    """Run the migration to add the width change request index"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print("🔄 Starting migration: Add width change request indexes...")
+
+            created = 0
+            for table_name, index_name, statement in INDEXES:
+                if index_exists(table_name, index_name):
+                    print(f"✅ {index_name} already exists")
+                    continue
+
+                print(f"📝 Creating {index_name} on {table_name}...")
+                db.session.execute(text(statement))
+                created += 1
+
+            db.session.commit()
+            print("✅ Migration completed successfully!")
+            print(f"   Created: {created} index(es)")
+
+            print("🔍 Checking query plans...")
+            if not verify_query_plans():
+                print("⚠️ Some lookups do not use an index seek (statistics may need an update)")
+
+            return True
+
+        except Exception as e:
+            print(f"❌ Migration failed: {str(e)}")
+            print(f"📋 Error details: {traceback.format_exc()}")
+            db.session.rollback()
+            return False
+
+def rollback_migration():
+    """Rollback the migration (drop the width change request index)"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print("🔄 Starting rollback: Drop width change request indexes...")
+
+            for table_name, index_name, _ in INDEXES:
+                if index_exists(table_name, index_name):
+                    print(f"📝 Dropping {index_name}...")
+                    db.session.execute(text(f"DROP INDEX {index_name} ON {table_name}"))
+
+            db.session.commit()
+            print("✅ Rollback completed successfully!")
+
+            return True
+
+        except Exception as e:
+            print(f"❌ Rollback failed: {str(e)}")
+            print(f"📋 Error details: {traceback.format_exc()}")
+            db.session.rollback()
+            return False
+
+def run_verification():
+    """Only check the query plans"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            return verify_query_plans()
+        except Exception as e:
+            print(f"❌ Verification failed: {str(e)}")
+            return False
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "rollback":
+        success = rollback_migration()
+    elif len(sys.argv) > 1 and sys.argv[1] == "verify":
+        success = run_verification()
+    else:
+        success = run_migration()
+
+    sys.exit(0 if success else 1)
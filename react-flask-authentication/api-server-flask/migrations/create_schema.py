@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Migration script to create the tables of the models that do not exist yet.
+
+create_app() used to run db.create_all() on every worker boot: 9 workers
+reflected the whole schema against SQL Server at every deploy or restart. The
+app no longer touches the database at startup; run this once on a new
+installation and after adding a model.
+
+This migration:
+1. Lists the model tables missing from the database
+2. Creates them with db.create_all() (existing tables are left untouched:
+   column changes still need their own migration)
+
+Run with "check" to only list the missing tables.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import create_app
+from api.models import db
+from sqlalchemy import inspect
+import traceback
+
+def missing_tables():
+    inspector = inspect(db.engine)
+    return [table.name for table in db.metadata.sorted_tables if not inspector.has_table(table.name)]
+
+def run_migration(check_only=False):
+    """Create the missing model tables"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print("🔄 Starting migration: Create missing model tables...")
+            missing = missing_tables()
+            if not missing:
+                print("✅ Every model table exists, nothing to create")
+                return True
+
+            print(f"📋 Missing tables ({len(missing)}): {', '.join(missing)}")
+            if check_only:
+                return True
+
+            db.create_all()
+            still_missing = missing_tables()
+            if still_missing:
+                print(f"❌ Tables still missing: {', '.join(still_missing)}")
+                return False
+
+            print(f"✅ Created {len(missing)} tables")
+            return True
+
+        except Exception as e:
+            print(f"❌ Migration failed: {str(e)}")
+            print(traceback.format_exc())
+            return False
+
+if __name__ == "__main__":
+    check_only = len(sys.argv) > 1 and sys.argv[1] == "check"
+    success = run_migration(check_only=check_only)
+    sys.exit(0 if success else 1)
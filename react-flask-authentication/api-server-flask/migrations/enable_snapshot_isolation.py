@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Migration script to allow snapshot isolation on the application database.
+
+Units of work declared with @transactional(isolation='SNAPSHOT') (api/transactions.py)
+read a snapshot of the committed data through row versioning, so their reads
+neither wait for nor block the writers. SQL Server only accepts SNAPSHOT
+transactions once ALLOW_SNAPSHOT_ISOLATION is ON; other transactions are not
+affected. Row versions are kept in tempdb.
+
+ALTER DATABASE cannot run inside a transaction, so the statements run in autocommit.
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api import create_app
+from api.models import db
+from sqlalchemy import text
+import traceback
+
+def snapshot_isolation_state(connection):
+    """1 when snapshot isolation is allowed on the current database"""
+    return connection.execute(text(
+        "SELECT snapshot_isolation_state FROM sys.databases WHERE name = DB_NAME()"
+    )).scalar()
+
+def run_migration():
+    """Run the migration to turn ALLOW_SNAPSHOT_ISOLATION on"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print("🔄 Starting migration: Allow snapshot isolation...")
+
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                if snapshot_isolation_state(connection) == 1:
+                    print("✅ Snapshot isolation is already allowed")
+                    return True
+
+                print("📝 Setting ALLOW_SNAPSHOT_ISOLATION ON...")
+                connection.execute(text("ALTER DATABASE CURRENT SET ALLOW_SNAPSHOT_ISOLATION ON"))
+
+                print("✅ Migration completed successfully!")
+                print(f"📋 snapshot_isolation_state = {snapshot_isolation_state(connection)}")
+
+            return True
+
+        except Exception as e:
+            print(f"❌ Migration failed: {str(e)}")
+            print(f"📋 Error details: {traceback.format_exc()}")
+            return False
+
+def rollback_migration():
+    """Rollback the migration (ALLOW_SNAPSHOT_ISOLATION OFF)"""
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print("🔄 Starting rollback: Disallow snapshot isolation...")
+
+            with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as connection:
+                connection.execute(text("ALTER DATABASE CURRENT SET ALLOW_SNAPSHOT_ISOLATION OFF"))
+
+            print("✅ Rollback completed successfully!")
+
+            return True
+
+        except Exception as e:
+            print(f"❌ Rollback failed: {str(e)}")
+            print(f"📋 Error details: {traceback.format_exc()}")
+            return False
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "rollback":
+        success = rollback_migration()
+    else:
+        success = run_migration()
+
+    sys.exit(0 if success else 1)
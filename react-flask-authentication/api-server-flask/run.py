@@ -3,7 +3,7 @@
 Copyright (c) 2019 - present AppSeed.us
 """
 
-from api import create_app, db
+from api import create_app, db, init_worker
 
 # Initialize app using the factory function
 app = create_app()
@@ -13,5 +13,6 @@ def make_shell_context():
     return {"app": app, "db": db}
 
 if __name__ == '__main__':
+    init_worker(app)
     app.run(debug=True, host="0.0.0.0")
 
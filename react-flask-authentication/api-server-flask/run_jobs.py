@@ -0,0 +1,27 @@
+"""
+Script to run the background jobs queued through /api/jobs (see api/jobs.py):
+long dashboard reports, batch marker imports, width validation syncs and the
+ops scripts.
+
+Run this from the api-server-flask directory, next to the API (it must see the
+same JOBS_DB_PATH):
+cd react-flask-authentication/api-server-flask
+python run_jobs.py      # 2 runner threads
+python run_jobs.py 4    # 4 runner threads
+
+In docker-compose it runs as the jobs_runner service. Each job kind also has
+its own concurrency limit, shared by every runner.
+"""
+
+import sys
+
+from api import create_app
+from api import job_kinds  # registers the job kinds
+from api.jobs import JobRunner
+
+def run_jobs(threads=2):
+    app = create_app()
+    JobRunner(app, threads=threads).run_forever()
+
+if __name__ == "__main__":
+    run_jobs(int(sys.argv[1]) if len(sys.argv) > 1 else 2)
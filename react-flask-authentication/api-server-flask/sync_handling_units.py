@@ -0,0 +1,49 @@
+"""
+Script to copy new picked handling units from View_PickedHandlingUnits into the
+local replica and store the width validation results of the affected orders.
+
+Run this from the api-server-flask directory:
+cd react-flask-authentication/api-server-flask
+python sync_handling_units.py              # incremental (entries above the watermark)
+python sync_handling_units.py full         # re-read the view and re-validate every order
+python sync_handling_units.py since 12345  # re-read the entries after Entry No_ 12345
+
+Schedule the incremental run every few minutes and the full run nightly, e.g.:
+*/5 * * * *  cd /app && python sync_handling_units.py
+45 2 * * *   cd /app && python sync_handling_units.py full
+"""
+
+import sys
+
+from api import create_app
+from api.width_validation import sync_handling_units
+
+def run_sync(full=False, since_entry_no=None):
+    app = create_app()
+
+    with app.app_context():
+        try:
+            mode = 'full' if full else (f'since {since_entry_no}' if since_entry_no is not None else 'incremental')
+            print(f"🔄 Syncing handling units ({mode})...")
+            result = sync_handling_units(full=full, since_entry_no=since_entry_no)
+            print(f"✅ Sync completed in {result['duration_ms']} ms ({result['mode']})")
+            print(f"   Read: {result['read']}, inserted: {result['inserted']}, "
+                  f"updated: {result['updated']}, deleted: {result['deleted']}")
+            print(f"   Orders validated: {result['orders_validated']}, flagged: {result['orders_flagged']}")
+            print(f"   Watermark: {result['watermark']}")
+            return True
+
+        except Exception as e:
+            print(f"❌ Sync failed: {str(e)}")
+            return False
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if args and args[0] == "since":
+        if len(args) < 2 or not args[1].isdigit():
+            print("Usage: python sync_handling_units.py since <entry no>")
+            sys.exit(2)
+        success = run_sync(since_entry_no=int(args[1]))
+    else:
+        success = run_sync(full=bool(args) and args[0] == "full")
+    sys.exit(0 if success else 1)
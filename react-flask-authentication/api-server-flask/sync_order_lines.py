@@ -0,0 +1,80 @@
+"""
+Script to refresh the local order lines replica from the NAV view, then the
+fabric BOM signatures used by ratio auto-populate, the BOM snapshots of open
+orders and the backlog of orders without ratios.
+
+Run this from the api-server-flask directory:
+cd react-flask-authentication/api-server-flask
+python sync_order_lines.py          # incremental (new and open orders)
+python sync_order_lines.py full     # full reconcile (also removes deleted lines, rehashes every BOM, rebuilds the backlog)
+python sync_order_lines.py backlog  # only rebuild the backlog of orders without ratios
+
+Schedule the incremental run every few minutes and the full run nightly, e.g.:
+*/5 * * * *  cd /app && python sync_order_lines.py
+30 2 * * *   cd /app && python sync_order_lines.py full
+"""
+
+import sys
+
+from api import create_app
+from api.order_lines_sync import sync_order_lines
+from api.bom_signatures import refresh_bom_signatures
+from api.ratio_backlog import reconcile_ratio_backlog
+from api.bom_cache import prefetch_boms, open_orders
+
+def run_sync(full=False):
+    app = create_app()
+
+    with app.app_context():
+        try:
+            print(f"🔄 Syncing order lines ({'full' if full else 'incremental'})...")
+            result = sync_order_lines(full=full)
+            print(f"✅ Sync completed in {result['duration_ms']} ms ({result['mode']})")
+            print(f"   Read: {result['read']}, inserted: {result['inserted']}, "
+                  f"updated: {result['updated']}, deleted: {result['deleted']}, "
+                  f"new orders without ratios: {result['backlog_added']}")
+            print(f"   Watermark: {result['watermark']}")
+
+            print("🔄 Refreshing fabric BOM signatures...")
+            result = refresh_bom_signatures(full=full)
+            print(f"✅ BOM signatures refreshed in {result['duration_ms']} ms ({result['mode']})")
+            print(f"   Orders: {result['orders']}, inserted: {result['inserted']}, updated: {result['updated']}")
+
+            print("🔄 Prefetching BOM snapshots of open orders...")
+            result = prefetch_boms(open_orders())
+            print(f"✅ BOM snapshots prefetched in {result['duration_ms']} ms")
+            print(f"   Orders: {result['orders']}, fetched: {result['fetched']}, already fresh: {result['already_fresh']}")
+
+            if full:
+                run_backlog_reconcile()
+            return True
+
+        except Exception as e:
+            print(f"❌ Sync failed: {str(e)}")
+            return False
+
+def run_backlog_reconcile():
+    print("🔄 Rebuilding the backlog of orders without ratios...")
+    result = reconcile_ratio_backlog()
+    print(f"✅ Backlog rebuilt in {result['duration_ms']} ms")
+    print(f"   Orders: {result['orders']}, inserted: {result['inserted']}, "
+          f"updated: {result['updated']}, deleted: {result['deleted']}")
+
+def run_backlog_only():
+    app = create_app()
+
+    with app.app_context():
+        try:
+            run_backlog_reconcile()
+            return True
+
+        except Exception as e:
+            print(f"❌ Backlog rebuild failed: {str(e)}")
+            return False
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "backlog":
+        success = run_backlog_only()
+    else:
+        success = run_sync(full=len(sys.argv) > 1 and sys.argv[1] == "full")
+    sys.exit(0 if success else 1)
@@ -146,6 +146,9 @@ const MarkerCalculatorDialog = ({
     // State for selected baseline (tab-specific)
     const [baselineByTab, setBaselineByTab] = useState({});
 
+    // Saved version of each tab (e.g. '01', '01_right'), sent back on save to detect concurrent edits
+    const [versionByTab, setVersionByTab] = useState({});
+
     // Get current tab's baseline
     const getCurrentBaseline = () => {
         return baselineByTab[currentMaterialType] || 'original';
@@ -661,10 +664,13 @@ const MarkerCalculatorDialog = ({
                 const loadedTabsData = {};
                 const loadedRightTabsData = {};
                 const loadedBaselines = {};
+                const loadedVersions = {};
                 let hasRightTableData = false;
 
                 // Process each tab's data
                 Object.entries(tabsData).forEach(([tabNumber, tabData]) => {
+                    loadedVersions[tabNumber] = tabData.version;
+
                     if (tabNumber.endsWith('_right')) {
                         // This is right table data
                         const baseTabNumber = tabNumber.replace('_right', '');
@@ -718,6 +724,7 @@ const MarkerCalculatorDialog = ({
                 setTestMarkersByMaterial(loadedTabsData);
                 setRightTableMarkersByMaterial(loadedRightTabsData);
                 setBaselineByTab(loadedBaselines);
+                setVersionByTab(loadedVersions);
 
                 // Enable split view if right table data exists
                 if (hasRightTableData) {
@@ -742,7 +749,7 @@ const MarkerCalculatorDialog = ({
 
 
 
-    // Save calculator data to API (tab-specific) with deadlock handling
+    // Save calculator data to API (tab-specific), retrying while the database is busy (HTTP 503)
     const saveCalculatorData = async () => {
         const maxRetries = 3;
         const retryDelay = 1000; // 1 second
@@ -751,13 +758,10 @@ const MarkerCalculatorDialog = ({
             try {
                 return await axios.post('/marker_calculator/save', payload);
             } catch (error) {
-                // Check if it's a deadlock error (SQL Server error 1205)
-                const isDeadlock = error.response?.data?.message?.includes('1205') ||
-                                 error.response?.data?.message?.includes('deadlock') ||
-                                 error.message?.includes('1205') ||
-                                 error.message?.includes('deadlock');
+                // 503: the server already retried its deadlocks and lock timeouts and the database is still busy
+                const isBusy = error.response?.status === 503;
 
-                if (isDeadlock && retryCount < maxRetries) {
+                if (isBusy && retryCount < maxRetries) {
                     await new Promise(resolve => setTimeout(resolve, retryDelay * (retryCount + 1))); // Exponential backoff
                     return saveWithRetry(payload, retryCount + 1);
                 }
@@ -765,6 +769,9 @@ const MarkerCalculatorDialog = ({
             }
         };
 
+        // Versions returned by the tabs saved so far, kept even if a later tab fails
+        const savedVersions = { ...versionByTab };
+
         try {
             // Save each tab sequentially to avoid deadlocks (instead of parallel)
             const results = [];
@@ -787,12 +794,14 @@ const MarkerCalculatorDialog = ({
                         tab_number: tabNumber,
                         selected_baseline: baselineByTab[tabValue] || 'original',
                         style: selectedStyle,
-                        markers: markersData
+                        markers: markersData,
+                        version: versionByTab[tabNumber]
                     };
 
                     console.log(`Saving tab ${tabNumber}...`);
                     const response = await saveWithRetry(payload);
                     results.push(response);
+                    savedVersions[tabNumber] = response.data.data?.version;
                     console.log(`✅ Tab ${tabNumber} saved successfully`);
 
                     // Also save right table data if in split view and has data
@@ -811,17 +820,21 @@ const MarkerCalculatorDialog = ({
                             tab_number: `${tabNumber}_right`, // Distinguish right table data
                             selected_baseline: `calc_tab_${tabNumber}`, // Right table uses left table's output
                             style: selectedStyle,
-                            markers: rightMarkersData
+                            markers: rightMarkersData,
+                            version: versionByTab[`${tabNumber}_right`]
                         };
 
                         console.log(`Saving right table for tab ${tabNumber}...`);
                         const rightResponse = await saveWithRetry(rightPayload);
                         results.push(rightResponse);
+                        savedVersions[`${tabNumber}_right`] = rightResponse.data.data?.version;
                         console.log(`✅ Right table for tab ${tabNumber} saved successfully`);
                     }
                 }
             }
 
+            setVersionByTab(savedVersions);
+
             // Check if all saves were successful
             const allSuccessful = results.every(response => response.data.success);
 
@@ -839,9 +852,10 @@ const MarkerCalculatorDialog = ({
                 return false;
             }
         } catch (error) {
+            setVersionByTab(savedVersions);
             const errorMsg = error.response?.data?.message || error.message;
 
-            if (errorMsg.includes('1205') || errorMsg.includes('deadlock')) {
+            if (error.response?.status === 503) {
                 setErrorMessage(t('calculator.databaseBusy'));
             } else {
                 setErrorMessage(t('calculator.saveFailed', { message: errorMsg }));